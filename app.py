@@ -8,6 +8,7 @@ from io import BytesIO
 import numpy as np
 import uuid
 import re
+from functools import partial
 
 # ==============================================================================
 # IMPORTAÇÕES ABSOLUTAS
@@ -15,7 +16,8 @@ import re
 from config import COL_CONFIG
 from utils import safe_parse_date, to_excel, formatar_dataframe_para_exibicao, convert_df_to_csv, create_word_report
 from data_loader import ler_cadastro_contas, importar_multiplos_extratos, ler_extrato_contabil, ler_bancos_associados, ler_plano_contas_csv
-from conciliacao import vincular_contas_ao_extrato, conciliar_extratos, gerar_lancamentos_saldo_negativo, gerar_lancamentos_saldo_negativo_contabil_cadastro
+from data_loader import ler_extrato_contabil_em_lotes, LIMITE_EXTRATO_CONTABIL_MB
+from conciliacao import vincular_contas_ao_extrato, conciliar_extratos, gerar_lancamentos_saldo_negativo, gerar_lancamentos_saldo_negativo_contabil_cadastro, gerar_lancamentos_saldo_negativo_todas_contas
 from relatorios import gerar_extrato_bancario_pdf
 from relatorios_contabeis import (
     gerar_balancete_pdf,
@@ -36,7 +38,13 @@ from db_manager import (
     salvar_plano_contas,
     excluir_conta_plano,
     salvar_lancamentos_contabeis,
-    carregar_lancamentos_contabeis,
+    salvar_lancamentos_contabeis_em_lotes,
+    carregar_lancamentos,
+    existem_lancamentos_contabeis,
+    carregar_saldos_contas,
+    movimento_acumulado,
+    primeira_data_saldo_diario,
+    normalizar_codigos_conta,
     limpar_lancamentos_contabeis,
     salvar_lancamentos_editados,
     excluir_lancamentos_por_ids,
@@ -53,6 +61,7 @@ from db_manager import (
     definir_logo_principal,
     excluir_logotipo,
     obter_logo_principal,
+    fechar_conexoes,
     # Parcelamentos
     carregar_parcelamentos,
     salvar_parcelamento,
@@ -68,6 +77,8 @@ from db_manager import (
     salvar_pagamento_parcelamento,
     atualizar_saldo_parcelamento
 )
+from db_async import executar_concorrente
+from cache_importacao import limpar_cache as limpar_cache_importacao
 from cnpj_api import buscar_cnpj_api, formatar_cnpj, limpar_cnpj
 from parcelamentos import (
     parse_extrato_parcelamento_ecac,
@@ -902,10 +913,9 @@ def submenu_extrato_visualizacao():
 
             # Se não há data inicial de saldo no cadastro, buscar a transação mais antiga
             if not data_inicial_saldo or pd.isna(data_inicial_saldo):
-                # Buscar todas as transações desta conta para encontrar a data mais antiga
-                df_todas = carregar_extrato_bancario_historico(conta_ofx_normalizada, datetime.date(2000, 1, 1), datetime.date.today())
-                if not df_todas.empty and 'Data Lançamento' in df_todas.columns:
-                    data_inicial_saldo = df_todas['Data Lançamento'].min()
+                # Data da transação mais antiga desta conta (saldos diários materializados)
+                data_inicial_saldo = primeira_data_saldo_diario('extrato', conta_ofx_normalizada)
+                if data_inicial_saldo:
                     st.info(f"ℹ️ 'Data Inicial Saldo' não está preenchida no cadastro. Usando a data da transação mais antiga ({data_inicial_saldo.strftime('%d/%m/%Y')}) como referência. Para alterar, edite o cadastro no Menu 1.1.")
                 else:
                     data_inicial_saldo = None
@@ -924,10 +934,9 @@ def submenu_extrato_visualizacao():
                 if data_inicial_saldo and data_inicial_saldo < data_inicio:
                     # Busca todas as transações desde a data inicial do saldo até um dia antes do período
                     data_ate_antes = data_inicio - datetime.timedelta(days=1)
-                    df_antes = carregar_extrato_bancario_historico(conta_ofx_normalizada, data_inicial_saldo, data_ate_antes)
+                    saldo_acumulado_antes = movimento_acumulado('extrato', conta_ofx_normalizada, data_inicial_saldo, data_ate_antes)
 
-                    if not df_antes.empty:
-                        saldo_acumulado_antes = df_antes['Valor'].sum()
+                    if saldo_acumulado_antes:
                         saldo_inicial_real = saldo_inicial_cadastro + saldo_acumulado_antes
                         st.success(f"✅ Saldo inicial calculado: R$ {saldo_inicial_cadastro:,.2f} (cadastro em {data_inicial_saldo.strftime('%d/%m/%Y')}) + R$ {saldo_acumulado_antes:,.2f} (movimentações até {data_ate_antes.strftime('%d/%m/%Y')}) = R$ {saldo_inicial_real:,.2f}")
 
@@ -971,27 +980,21 @@ def submenu_lancamentos_contabeis_visualizacao():
         st.session_state.df_lancamentos_filtrados = pd.DataFrame()
 
     if st.button("Buscar"):
-        all_transactions = carregar_lancamentos_contabeis().copy()
         filtro_limpo = conta_reduzida_filtro.strip()
-        
-        df_display = all_transactions.copy()
-        df_display['data_lancamento_obj'] = pd.to_datetime(df_display['data_lancamento'], errors='coerce').dt.date
 
         try:
-            if data_inicio_str:
-                data_inicio_filtro = datetime.datetime.strptime(data_inicio_str, "%d/%m/%Y").date()
-                df_display = df_display[df_display['data_lancamento_obj'] >= data_inicio_filtro]
-            if data_fim_str:
-                data_fim_filtro = datetime.datetime.strptime(data_fim_str, "%d/%m/%Y").date()
-                df_display = df_display[df_display['data_lancamento_obj'] <= data_fim_filtro]
+            data_inicio_filtro = datetime.datetime.strptime(data_inicio_str, "%d/%m/%Y").date() if data_inicio_str else None
+            data_fim_filtro = datetime.datetime.strptime(data_fim_str, "%d/%m/%Y").date() if data_fim_str else None
+            # Filtros de período e conta aplicados no banco
+            df_display = carregar_lancamentos(
+                periodo=(data_inicio_filtro, data_fim_filtro),
+                contas=[filtro_limpo] if filtro_limpo else None,
+                decrescente=True
+            )
+            df_display['data_lancamento_obj'] = df_display['data_lancamento'].dt.date
         except ValueError:
             st.error("Formato de data inválido. Use DD/MM/YYYY.")
             df_display = pd.DataFrame() # Limpa em caso de erro
-
-        if filtro_limpo and not df_display.empty:
-            col_deb_str = pd.to_numeric(df_display['reduz_deb'], errors='coerce').astype('Int64').astype(str)
-            col_cred_str = pd.to_numeric(df_display['reduz_cred'], errors='coerce').astype('Int64').astype(str)
-            df_display = df_display[(col_deb_str == filtro_limpo) | (col_cred_str == filtro_limpo)]
         
         # Armazena o resultado no session_state
         st.session_state.df_lancamentos_filtrados = df_display
@@ -1081,14 +1084,13 @@ def submenu_lancamentos_contabeis_visualizacao():
             if data_inicio_str:
                 try:
                     data_inicio_filtro = datetime.datetime.strptime(data_inicio_str, "%d/%m/%Y").date()
-                    df_saldo_inicial = carregar_lancamentos_contabeis()
-                    df_saldo_inicial = df_saldo_inicial[pd.to_datetime(df_saldo_inicial['data_lancamento']).dt.date < data_inicio_filtro]
-                    
-                    col_deb_hist = pd.to_numeric(df_saldo_inicial['reduz_deb'], errors='coerce').astype('Int64').astype(str)
-                    col_cred_hist = pd.to_numeric(df_saldo_inicial['reduz_cred'], errors='coerce').astype('Int64').astype(str)
-
-                    debitos_passados = df_saldo_inicial.loc[col_deb_hist == filtro_limpo, 'valor'].sum()
-                    creditos_passados = df_saldo_inicial.loc[col_cred_hist == filtro_limpo, 'valor'].sum()
+                    df_saldo_inicial = carregar_lancamentos(
+                        periodo=(None, data_inicio_filtro - datetime.timedelta(days=1)),
+                        contas=[filtro_limpo], colunas=['reduz_deb', 'reduz_cred', 'valor']
+                    )
+
+                    debitos_passados = df_saldo_inicial.loc[df_saldo_inicial['reduz_deb'] == filtro_limpo, 'valor'].sum()
+                    creditos_passados = df_saldo_inicial.loc[df_saldo_inicial['reduz_cred'] == filtro_limpo, 'valor'].sum()
                     saldo_inicial = creditos_passados - debitos_passados
                 except ValueError:
                     st.error("Formato de data inválido para cálculo do Saldo Inicial.")
@@ -1369,9 +1371,7 @@ def submenu_relatorios_extratos_bancarios():
 
             # Buscar movimentações entre a data de cadastro e o dia anterior ao período
             data_anterior = data_inicio - datetime.timedelta(days=1)
-            df_anterior = carregar_extrato_bancario_historico(conta_ofx_normalizada, data_inicial_cadastro, data_anterior)
-
-            saldo_movimentacoes_anteriores = df_anterior['Valor'].sum() if not df_anterior.empty else 0.0
+            saldo_movimentacoes_anteriores = movimento_acumulado('extrato', conta_ofx_normalizada, data_inicial_cadastro, data_anterior)
             saldo_inicial_real = saldo_cadastrado + saldo_movimentacoes_anteriores
 
             # SALVAR NO SESSION STATE
@@ -1508,45 +1508,26 @@ def submenu_relatorio_balancete():
             data_inicio = datetime.datetime.strptime(data_inicio_str, '%d/%m/%Y').date()
             data_fim = datetime.datetime.strptime(data_fim_str, '%d/%m/%Y').date()
 
-            df_lancamentos = carregar_lancamentos_contabeis()
+            # Saldos por conta agregados no banco (saldo anterior, débitos e créditos do período)
+            df_saldos = carregar_saldos_contas(data_inicio, data_fim)
             df_plano_contas = carregar_plano_contas()
 
-            if df_lancamentos.empty:
+            if df_saldos.empty:
                 st.warning("Nenhum lançamento contábil encontrado.")
                 return
 
-            # Converter data_lancamento para datetime se for string
-            if df_lancamentos['data_lancamento'].dtype == 'object':
-                df_lancamentos['data_lancamento'] = pd.to_datetime(df_lancamentos['data_lancamento'])
+            # Na tela, apenas as contas movimentadas no período
+            df_movimentadas = df_saldos[(df_saldos['debitos'] != 0) | (df_saldos['creditos'] != 0)]
 
-            # Filtrar lançamentos do período
-            df_periodo = df_lancamentos[
-                (pd.to_datetime(df_lancamentos['data_lancamento']).dt.date >= data_inicio) &
-                (pd.to_datetime(df_lancamentos['data_lancamento']).dt.date <= data_fim)
-            ].copy()
-
-            # Normalizar códigos de conta (remover .0 se for float)
-            df_periodo['reduz_deb'] = df_periodo['reduz_deb'].apply(
-                lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-            )
-            df_periodo['reduz_cred'] = df_periodo['reduz_cred'].apply(
-                lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-            )
-
-            # Calcular totais por conta
             balancete = []
-            contas_deb = df_periodo['reduz_deb'].dropna().unique()
-            contas_cred = df_periodo['reduz_cred'].dropna().unique()
-            todas_contas = set(list(contas_deb) + list(contas_cred))
-
-            for conta in sorted(todas_contas, key=lambda x: str(x)):
-                conta_str = str(conta)
+            for _, saldo_conta in df_movimentadas.iterrows():
+                conta_str = str(saldo_conta['conta'])
                 conta_info = df_plano_contas[df_plano_contas['codigo'] == conta_str]
                 nome_conta = conta_info.iloc[0]['descricao'] if not conta_info.empty else 'N/A'
                 tipo_conta = conta_info.iloc[0]['tipo'] if not conta_info.empty and 'tipo' in conta_info.columns else 'Analitico'
 
-                debitos = df_periodo[df_periodo['reduz_deb'] == conta_str]['valor'].sum()
-                creditos = df_periodo[df_periodo['reduz_cred'] == conta_str]['valor'].sum()
+                debitos = saldo_conta['debitos']
+                creditos = saldo_conta['creditos']
                 saldo = creditos - debitos
 
                 balancete.append({
@@ -1566,7 +1547,7 @@ def submenu_relatorio_balancete():
 
             # SALVAR NO SESSION STATE
             st.session_state.balancete_preview = {
-                'df_lancamentos': df_lancamentos,
+                'df_saldos': df_saldos,
                 'df_plano_contas': df_plano_contas,
                 'df_balancete': df_balancete,
                 'data_inicio': data_inicio,
@@ -1581,7 +1562,7 @@ def submenu_relatorio_balancete():
     # VERIFICAR SE HÁ DADOS SALVOS NO SESSION STATE PARA EXIBIR
     if 'balancete_preview' in st.session_state:
         preview_data = st.session_state.balancete_preview
-        df_lancamentos = preview_data['df_lancamentos']
+        df_saldos = preview_data['df_saldos']
         df_plano_contas = preview_data['df_plano_contas']
         df_balancete = preview_data['df_balancete']
         data_inicio = preview_data['data_inicio']
@@ -1629,7 +1610,7 @@ def submenu_relatorio_balancete():
         # Botão para gerar PDF
         if st.button("📄 Gerar PDF do Balancete", type="primary", use_container_width=True, key="btn_gerar_pdf_balancete"):
             with st.spinner("Gerando balancete em PDF..."):
-                pdf_buffer = gerar_balancete_pdf(df_lancamentos, df_plano_contas,
+                pdf_buffer = gerar_balancete_pdf(df_saldos, df_plano_contas,
                                                  empresa_info, logo_path,
                                                  data_inicio, data_fim)
 
@@ -1672,21 +1653,9 @@ def submenu_relatorio_livro_diario():
             data_inicio = datetime.datetime.strptime(data_inicio_str, '%d/%m/%Y').date()
             data_fim = datetime.datetime.strptime(data_fim_str, '%d/%m/%Y').date()
 
-            df_lancamentos = carregar_lancamentos_contabeis()
-
-            if df_lancamentos.empty:
-                st.warning("Nenhum lançamento contábil encontrado.")
-                return
-
-            # Converter data_lancamento para datetime se for string
-            if df_lancamentos['data_lancamento'].dtype == 'object':
-                df_lancamentos['data_lancamento'] = pd.to_datetime(df_lancamentos['data_lancamento'])
-
-            # Filtrar lançamentos pelo período
-            df_filtrado = df_lancamentos[
-                (df_lancamentos['data_lancamento'].dt.date >= data_inicio) &
-                (df_lancamentos['data_lancamento'].dt.date <= data_fim)
-            ].copy()
+            # O período é filtrado no banco
+            df_lancamentos = carregar_lancamentos(periodo=(data_inicio, data_fim))
+            df_filtrado = df_lancamentos.copy()
 
             if df_filtrado.empty:
                 st.warning(f"Nenhum lançamento encontrado no período de {data_inicio_str} a {data_fim_str}.")
@@ -1858,30 +1827,16 @@ def submenu_relatorio_livro_razao():
             data_inicio = datetime.datetime.strptime(data_inicio_str, '%d/%m/%Y').date()
             data_fim = datetime.datetime.strptime(data_fim_str, '%d/%m/%Y').date()
 
-            df_lancamentos = carregar_lancamentos_contabeis()
+            # Conta e período filtrados no banco; o PDF usa o histórico anterior para o saldo inicial
+            df_lancamentos = carregar_lancamentos(periodo=(None, data_fim), contas=[conta_selecionada])
 
             if df_lancamentos.empty:
                 st.warning("Nenhum lançamento contábil encontrado.")
                 return
 
-            # Converter data_lancamento para datetime se for string
-            if df_lancamentos['data_lancamento'].dtype == 'object':
-                df_lancamentos['data_lancamento'] = pd.to_datetime(df_lancamentos['data_lancamento'])
-
-            # Normalizar códigos de conta
-            df_lancamentos['reduz_deb'] = df_lancamentos['reduz_deb'].apply(
-                lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-            )
-            df_lancamentos['reduz_cred'] = df_lancamentos['reduz_cred'].apply(
-                lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-            )
-
-            # Filtrar lançamentos da conta no período
+            # Filtrar lançamentos do período
             df_filtrado = df_lancamentos[
-                ((df_lancamentos['reduz_deb'] == conta_selecionada) |
-                 (df_lancamentos['reduz_cred'] == conta_selecionada)) &
-                (df_lancamentos['data_lancamento'].dt.date >= data_inicio) &
-                (df_lancamentos['data_lancamento'].dt.date <= data_fim)
+                df_lancamentos['data_lancamento'].dt.date >= data_inicio
             ].copy()
 
             if df_filtrado.empty:
@@ -2034,52 +1989,19 @@ def submenu_relatorio_balanco_patrimonial():
         try:
             data_referencia = datetime.datetime.strptime(data_referencia_str, '%d/%m/%Y').date()
 
-            df_lancamentos = carregar_lancamentos_contabeis()
+            # Saldo final de cada conta até a data de referência, agregado no banco
+            df_saldos = carregar_saldos_contas(data_fim=data_referencia)
             df_plano_contas = carregar_plano_contas()
 
-            if df_lancamentos.empty:
-                st.warning("Nenhum lançamento contábil encontrado.")
-                return
-
             if df_plano_contas.empty:
                 st.warning("Nenhum plano de contas cadastrado.")
                 return
 
-            # Converter data_lancamento para datetime se for string
-            if df_lancamentos['data_lancamento'].dtype == 'object':
-                df_lancamentos['data_lancamento'] = pd.to_datetime(df_lancamentos['data_lancamento'])
-
-            # Filtrar lançamentos até a data de referência
-            df_filtrado = df_lancamentos[df_lancamentos['data_lancamento'].dt.date <= data_referencia].copy()
-
-            if df_filtrado.empty:
+            if df_saldos.empty:
                 st.warning(f"Nenhum lançamento encontrado até {data_referencia_str}.")
                 return
 
-            # Normalizar códigos de conta
-            df_filtrado['reduz_deb'] = df_filtrado['reduz_deb'].apply(
-                lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-            )
-            df_filtrado['reduz_cred'] = df_filtrado['reduz_cred'].apply(
-                lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-            )
-
-            # Calcular saldos por conta
-            saldos_contas = {}
-            for _, lanc in df_filtrado.iterrows():
-                conta_deb = lanc['reduz_deb']
-                conta_cred = lanc['reduz_cred']
-                valor = lanc['valor']
-
-                if pd.notna(conta_deb) and conta_deb not in saldos_contas:
-                    saldos_contas[conta_deb] = 0.0
-                if pd.notna(conta_cred) and conta_cred not in saldos_contas:
-                    saldos_contas[conta_cred] = 0.0
-
-                if pd.notna(conta_deb):
-                    saldos_contas[conta_deb] += valor
-                if pd.notna(conta_cred):
-                    saldos_contas[conta_cred] -= valor
+            saldos_contas = dict(zip(df_saldos['conta'], df_saldos['saldo_final']))
 
             # Classificar contas por tipo
             ativo = {}
@@ -2132,7 +2054,7 @@ def submenu_relatorio_balanco_patrimonial():
 
             # SALVAR NO SESSION STATE
             st.session_state.balanco_patrimonial_preview = {
-                'df_lancamentos': df_lancamentos,
+                'df_saldos': df_saldos,
                 'df_plano_contas': df_plano_contas,
                 'ativo': ativo,
                 'passivo': passivo,
@@ -2153,7 +2075,7 @@ def submenu_relatorio_balanco_patrimonial():
     # VERIFICAR SE HÁ DADOS SALVOS NO SESSION STATE PARA EXIBIR
     if 'balanco_patrimonial_preview' in st.session_state:
         preview_data = st.session_state.balanco_patrimonial_preview
-        df_lancamentos = preview_data['df_lancamentos']
+        df_saldos = preview_data['df_saldos']
         df_plano_contas = preview_data['df_plano_contas']
         ativo = preview_data['ativo']
         passivo = preview_data['passivo']
@@ -2284,7 +2206,7 @@ def submenu_relatorio_balanco_patrimonial():
         st.markdown("---")
         if st.button("📄 Gerar PDF do Balanço Patrimonial", key="btn_gerar_pdf_balanco"):
             with st.spinner("Gerando balanço patrimonial em PDF..."):
-                pdf_buffer = gerar_balanco_patrimonial_pdf(df_lancamentos, df_plano_contas,
+                pdf_buffer = gerar_balanco_patrimonial_pdf(df_saldos, df_plano_contas,
                                                            empresa_info, logo_path,
                                                            data_referencia)
 
@@ -2299,6 +2221,15 @@ def submenu_relatorio_balanco_patrimonial():
                 key="download_balanco_patrimonial_pdf"
             )
 
+def _data_inicial_cadastro(data_cadastro) -> datetime.date:
+    """Data Inicial Saldo do cadastro (DD/MM/AAAA); vazia ou inválida vira 01/01/2000."""
+    if data_cadastro and pd.notna(data_cadastro):
+        try:
+            return pd.to_datetime(data_cadastro, format='%d/%m/%Y').date()
+        except Exception:
+            pass
+    return datetime.date(2000, 1, 1)
+
 def submenu_conciliacao_banco_contabil():
     st.subheader("5.1 Conciliação Banco x Contábil")
 
@@ -2409,11 +2340,31 @@ def submenu_conciliacao_banco_contabil():
             else:
                 contas_processar = df_contas_vinculadas.to_dict('records')
 
+            # Saldos contábeis de todas as contas processadas (principal e negativa) em uma consulta
+            contas_contabeis = [c.get(col) for c in contas_processar for col in ('Conta Contábil', 'Conta Contábil (-)')]
+            saldos_contabeis = carregar_saldos_contas(
+                data_inicio, data_fim, contas=[c for c in contas_contabeis if c is not None and pd.notna(c)]
+            ).set_index('conta')
+
+            # Extrato do período e movimento anterior de cada conta, consultados em paralelo
+            data_anterior = data_inicio - datetime.timedelta(days=1)
+            consultas_banco = {}
+            for posicao, conta_selecionada in enumerate(contas_processar):
+                conta_ofx_normalizada = conta_selecionada['Conta_OFX_Normalizada']
+                data_inicial_cadastro = _data_inicial_cadastro(conta_selecionada.get('Data Inicial Saldo'))
+                consultas_banco[('extrato', posicao)] = partial(
+                    carregar_extrato_bancario_historico, conta_ofx_normalizada, data_inicio, data_fim
+                )
+                consultas_banco[('anterior', posicao)] = partial(
+                    movimento_acumulado, 'extrato', conta_ofx_normalizada, data_inicial_cadastro, data_anterior
+                )
+            resultados_banco = executar_concorrente(consultas_banco)
+
             # Lista para armazenar resultados
             resultados_conciliacao = []
 
             # Processar cada conta
-            for conta_selecionada in contas_processar:
+            for posicao, conta_selecionada in enumerate(contas_processar):
                 conta_ofx_normalizada = conta_selecionada['Conta_OFX_Normalizada']
                 conta_contabil = conta_selecionada['Conta Contábil']
                 conta_contabil_negativo = conta_selecionada.get('Conta Contábil (-)')
@@ -2427,10 +2378,8 @@ def submenu_conciliacao_banco_contabil():
                 )
 
                 # === SALDO BANCÁRIO ===
-                # Buscar extrato bancário do período
-                df_extrato_banco = carregar_extrato_bancario_historico(
-                    conta_ofx_normalizada, data_inicio, data_fim
-                )
+                # Extrato do período (consultado antes do laço)
+                df_extrato_banco = resultados_banco[('extrato', posicao)]
 
                 # Calcular saldo bancário
                 if not df_extrato_banco.empty:
@@ -2438,147 +2387,33 @@ def submenu_conciliacao_banco_contabil():
                 else:
                     movimentacoes_banco = 0.0
 
-                # Buscar movimentações anteriores para calcular saldo inicial real
-                data_cadastro = conta_selecionada.get('Data Inicial Saldo')
-                if data_cadastro and pd.notna(data_cadastro):
-                    try:
-                        data_inicial_cadastro = pd.to_datetime(data_cadastro, format='%d/%m/%Y').date()
-                    except:
-                        data_inicial_cadastro = datetime.date(2000, 1, 1)
-                else:
-                    data_inicial_cadastro = datetime.date(2000, 1, 1)
-
-                data_anterior = data_inicio - datetime.timedelta(days=1)
-                df_anterior_banco = carregar_extrato_bancario_historico(
-                    conta_ofx_normalizada, data_inicial_cadastro, data_anterior
-                )
-
-                saldo_anterior_banco = saldo_inicial_banco + (
-                    df_anterior_banco['Valor'].sum() if not df_anterior_banco.empty else 0.0
-                )
+                # Movimentações anteriores (desde a data inicial do cadastro) para o saldo inicial real
+                saldo_anterior_banco = saldo_inicial_banco + resultados_banco[('anterior', posicao)]
                 saldo_final_banco = saldo_anterior_banco + movimentacoes_banco
 
                 # === SALDO CONTÁBIL ===
-                # Buscar lançamentos contábeis da conta
-                df_lancamentos = carregar_lancamentos_contabeis()
-
-                if not df_lancamentos.empty:
-                    # Converter conta contábil para string e normalizar
-                    try:
-                        # Limpar e converter a conta contábil
-                        conta_contabil_limpa = str(conta_contabil).strip()
-                        # Tentar converter para inteiro se for número
-                        try:
-                            conta_contabil_str = str(int(float(conta_contabil_limpa)))
-                        except:
-                            conta_contabil_str = conta_contabil_limpa
-                    except:
-                        st.error(f"Erro ao processar conta contábil: {conta_contabil}")
-                        continue
-
-                    # Converter data para datetime
-                    df_lancamentos['data_lancamento_dt'] = pd.to_datetime(
-                        df_lancamentos['data_lancamento'], errors='coerce'
-                    ).dt.date
-
-                    # Converter colunas de débito e crédito para string, tratando valores nulos
-                    df_lancamentos['reduz_deb_str'] = df_lancamentos['reduz_deb'].fillna('').astype(str).str.strip()
-                    df_lancamentos['reduz_cred_str'] = df_lancamentos['reduz_cred'].fillna('').astype(str).str.strip()
-
-                    # Converter valores numéricos para inteiro quando possível
-                    def normalizar_conta(valor):
-                        if valor == '' or valor == 'nan':
-                            return ''
-                        try:
-                            return str(int(float(valor)))
-                        except:
-                            return valor
-
-                    df_lancamentos['reduz_deb_str'] = df_lancamentos['reduz_deb_str'].apply(normalizar_conta)
-                    df_lancamentos['reduz_cred_str'] = df_lancamentos['reduz_cred_str'].apply(normalizar_conta)
-
-                    # Lançamentos até o dia anterior (para saldo inicial)
-                    df_anterior_contabil = df_lancamentos[
-                        df_lancamentos['data_lancamento_dt'] < data_inicio
-                    ].copy()
-
-                    # Lançamentos do período
-                    df_periodo_contabil = df_lancamentos[
-                        (df_lancamentos['data_lancamento_dt'] >= data_inicio) &
-                        (df_lancamentos['data_lancamento_dt'] <= data_fim)
-                    ].copy()
-
-                    # Calcular saldo anterior contábil
-                    debitos_anteriores = df_anterior_contabil[
-                        df_anterior_contabil['reduz_deb_str'] == conta_contabil_str
-                    ]['valor'].sum()
-
-                    creditos_anteriores = df_anterior_contabil[
-                        df_anterior_contabil['reduz_cred_str'] == conta_contabil_str
-                    ]['valor'].sum()
-
-                    saldo_anterior_contabil = creditos_anteriores - debitos_anteriores
-
-                    # Calcular movimentações do período
-                    debitos_periodo = df_periodo_contabil[
-                        df_periodo_contabil['reduz_deb_str'] == conta_contabil_str
-                    ]['valor'].sum()
-
-                    creditos_periodo = df_periodo_contabil[
-                        df_periodo_contabil['reduz_cred_str'] == conta_contabil_str
-                    ]['valor'].sum()
+                # Saldos agregados no banco antes do laço (natureza devedora); aqui, crédito - débito
+                conta_contabil_str = normalizar_codigos_conta(pd.Series([conta_contabil])).iloc[0]
+                if pd.isna(conta_contabil_str) or conta_contabil_str == '':
+                    st.error(f"Erro ao processar conta contábil: {conta_contabil}")
+                    continue
 
+                if conta_contabil_str in saldos_contabeis.index:
+                    saldo_conta = saldos_contabeis.loc[conta_contabil_str]
+                    saldo_anterior_contabil = -saldo_conta['saldo_anterior']
+                    debitos_periodo = saldo_conta['debitos']
+                    creditos_periodo = saldo_conta['creditos']
                     movimentacoes_contabil = creditos_periodo - debitos_periodo
                     saldo_final_contabil = saldo_anterior_contabil + movimentacoes_contabil
 
-                    # === AJUSTE PARA SALDO NEGATIVO ===
-                    # Se o saldo bancário é negativo e existe conta contábil negativa configurada,
-                    # precisa somar o saldo da conta contábil negativa (passivo)
-                    if saldo_final_banco < 0 and conta_contabil_negativo and pd.notna(conta_contabil_negativo):
-                        try:
-                            # Normalizar conta contábil negativa
-                            conta_contabil_negativo_limpa = str(conta_contabil_negativo).strip()
-                            try:
-                                conta_contabil_negativo_str = str(int(float(conta_contabil_negativo_limpa)))
-                            except:
-                                conta_contabil_negativo_str = conta_contabil_negativo_limpa
-
-                            # Calcular saldo anterior da conta negativa
-                            debitos_anteriores_neg = df_anterior_contabil[
-                                df_anterior_contabil['reduz_deb_str'] == conta_contabil_negativo_str
-                            ]['valor'].sum()
-
-                            creditos_anteriores_neg = df_anterior_contabil[
-                                df_anterior_contabil['reduz_cred_str'] == conta_contabil_negativo_str
-                            ]['valor'].sum()
-
-                            saldo_anterior_contabil_neg = creditos_anteriores_neg - debitos_anteriores_neg
-
-                            # Calcular movimentações do período da conta negativa
-                            debitos_periodo_neg = df_periodo_contabil[
-                                df_periodo_contabil['reduz_deb_str'] == conta_contabil_negativo_str
-                            ]['valor'].sum()
-
-                            creditos_periodo_neg = df_periodo_contabil[
-                                df_periodo_contabil['reduz_cred_str'] == conta_contabil_negativo_str
-                            ]['valor'].sum()
-
-                            movimentacoes_contabil_neg = creditos_periodo_neg - debitos_periodo_neg
-                            saldo_final_contabil_neg = saldo_anterior_contabil_neg + movimentacoes_contabil_neg
-
-                            # O saldo contábil total é: saldo da conta principal + saldo da conta negativa
-                            # Como a conta negativa é passivo (crédito), ela representa o valor negativo
-                            # Então: Saldo Real = Saldo Ativo - Saldo Passivo
-                            saldo_final_contabil = saldo_final_contabil - saldo_final_contabil_neg
-
-                        except Exception as e:
-                            # Se houver erro, mantém o saldo original
-                            pass
-
-                    # Debug: mostrar quantos lançamentos foram encontrados (apenas no modo individual)
+                    # Debug: mostrar os lançamentos encontrados (apenas no modo individual)
                     if tipo_conciliacao == "Individual":
-                        total_lanc_deb = len(df_periodo_contabil[df_periodo_contabil['reduz_deb_str'] == conta_contabil_str])
-                        total_lanc_cred = len(df_periodo_contabil[df_periodo_contabil['reduz_cred_str'] == conta_contabil_str])
+                        lanc_conta = carregar_lancamentos(
+                            periodo=(data_inicio, data_fim), contas=[conta_contabil_str],
+                            colunas=['data_lancamento', 'reduz_deb', 'reduz_cred', 'valor', 'historico']
+                        )
+                        total_lanc_deb = int((lanc_conta['reduz_deb'] == conta_contabil_str).sum())
+                        total_lanc_cred = int((lanc_conta['reduz_cred'] == conta_contabil_str).sum())
 
                         with st.expander("🔍 Debug - Lançamentos Encontrados"):
                             st.write(f"Conta Contábil procurada: **{conta_contabil_str}**")
@@ -2587,10 +2422,6 @@ def submenu_conciliacao_banco_contabil():
 
                             if total_lanc_deb > 0 or total_lanc_cred > 0:
                                 st.write("Lançamentos do período:")
-                                lanc_conta = df_periodo_contabil[
-                                    (df_periodo_contabil['reduz_deb_str'] == conta_contabil_str) |
-                                    (df_periodo_contabil['reduz_cred_str'] == conta_contabil_str)
-                                ][['data_lancamento', 'reduz_deb_str', 'reduz_cred_str', 'valor', 'historico']]
                                 st.dataframe(lanc_conta)
                 else:
                     saldo_anterior_contabil = 0.0
@@ -2599,6 +2430,17 @@ def submenu_conciliacao_banco_contabil():
                     movimentacoes_contabil = 0.0
                     saldo_final_contabil = 0.0
 
+                # === AJUSTE PARA SALDO NEGATIVO ===
+                # Se o saldo bancário é negativo e existe conta contábil negativa configurada,
+                # precisa somar o saldo da conta contábil negativa (passivo)
+                conta_contabil_negativo_str = normalizar_codigos_conta(pd.Series([conta_contabil_negativo])).iloc[0]
+                if saldo_final_banco < 0 and pd.notna(conta_contabil_negativo_str) and \
+                        conta_contabil_negativo_str in saldos_contabeis.index:
+                    # Como a conta negativa é passivo (crédito), ela representa o valor negativo
+                    # Então: Saldo Real = Saldo Ativo - Saldo Passivo
+                    saldo_final_contabil_neg = -saldos_contabeis.loc[conta_contabil_negativo_str, 'saldo_final']
+                    saldo_final_contabil = saldo_final_contabil - saldo_final_contabil_neg
+
                 # Calcular diferença
                 diferenca = saldo_final_banco - saldo_final_contabil
                 status_conciliacao = 'Conciliado' if abs(diferenca) < 0.01 else 'Não Conciliado'
@@ -2802,7 +2644,8 @@ def submenu_conciliacao_contas_negativas():
 
     col1, col2, col3 = st.columns([2, 1, 1])
     with col1:
-        conta_selecionada_display = st.selectbox("Selecione a Conta Bancária para análise:", options=contas_display['Display'].tolist(), key="ccn_conta_select")
+        todas_contas = st.checkbox("Analisar todas as contas do cadastro", key="ccn_todas_contas")
+        conta_selecionada_display = st.selectbox("Selecione a Conta Bancária para análise:", options=contas_display['Display'].tolist(), key="ccn_conta_select", disabled=todas_contas)
     
     today = datetime.date.today()
     first_day_of_month = today.replace(day=1)
@@ -2823,10 +2666,13 @@ def submenu_conciliacao_contas_negativas():
             data_inicio = datetime.datetime.strptime(data_inicio_str, '%d/%m/%Y').date()
             data_fim = datetime.datetime.strptime(data_fim_str, '%d/%m/%Y').date()
             
-            conta_selecionada_row = df_contas[df_contas['Display'] == conta_selecionada_display].iloc[0]
-            
             with st.spinner("Analisando saldos e gerando lançamentos..."):
-                lancamentos_propostos_df = gerar_lancamentos_saldo_negativo(conta_selecionada_row, data_inicio, data_fim)
+                if todas_contas:
+                    # Lote: uma carga do extrato e do plano de contas para todas as contas
+                    lancamentos_propostos_df = gerar_lancamentos_saldo_negativo_todas_contas(df_contas, data_inicio, data_fim, base='extrato')
+                else:
+                    conta_selecionada_row = df_contas[df_contas['Display'] == conta_selecionada_display].iloc[0]
+                    lancamentos_propostos_df = gerar_lancamentos_saldo_negativo(conta_selecionada_row, data_inicio, data_fim)
                 st.session_state.lancamentos_negativos_propostos = lancamentos_propostos_df
         
         except ValueError:
@@ -2847,7 +2693,10 @@ def submenu_conciliacao_contas_negativas():
         df_proposto['data_lancamento'] = df_proposto['data_lancamento_dt'].dt.strftime('%d/%m/%Y')
         df_proposto['valor_formatado'] = df_proposto['valor'].apply(formatar_moeda)
         
-        st.dataframe(df_proposto[['data_lancamento', 'historico', 'valor_formatado', 'reduz_deb', 'nome_conta_d', 'reduz_cred', 'nome_conta_c', 'origem']], width='stretch')
+        colunas_exibicao = ['data_lancamento', 'historico', 'valor_formatado', 'reduz_deb', 'nome_conta_d', 'reduz_cred', 'nome_conta_c', 'origem']
+        if 'conta_bancaria' in df_proposto.columns:
+            colunas_exibicao.insert(0, 'conta_bancaria')
+        st.dataframe(df_proposto[colunas_exibicao], width='stretch')
         
         if st.button("✅ Salvar Lançamentos de Ajuste na Contabilidade"):
             try:
@@ -2877,10 +2726,8 @@ def submenu_analise_diferenca_debito_credito():
     - Problemas na importação dos dados
     """)
 
-    # Carregar lançamentos
-    df_lancamentos = carregar_lancamentos_contabeis()
-
-    if df_lancamentos.empty:
+    # Só verifica se há lançamentos; o período é carregado ao analisar
+    if not existem_lancamentos_contabeis():
         st.warning("Não há lançamentos contábeis cadastrados. Importe os lançamentos no Item 3.")
         return
 
@@ -2899,13 +2746,8 @@ def submenu_analise_diferenca_debito_credito():
                 data_inicio = datetime.datetime.strptime(data_inicio_str, "%d/%m/%Y").date()
                 data_fim = datetime.datetime.strptime(data_fim_str, "%d/%m/%Y").date()
 
-                # Converter coluna de data
-                df_lancamentos['data_lancamento'] = pd.to_datetime(df_lancamentos['data_lancamento'], errors='coerce')
-
-                # Filtrar por período
-                mask = (df_lancamentos['data_lancamento'].dt.date >= data_inicio) & \
-                       (df_lancamentos['data_lancamento'].dt.date <= data_fim)
-                df_filtrado = df_lancamentos[mask].copy()
+                # Período filtrado no banco
+                df_filtrado = carregar_lancamentos(periodo=(data_inicio, data_fim))
 
                 if df_filtrado.empty:
                     st.warning("Nenhum lançamento encontrado no período selecionado.")
@@ -3015,10 +2857,12 @@ def submenu_conciliacao_contas_contabeis_banco():
 
     col1, col2, col3 = st.columns([2, 1, 1])
     with col1:
+        todas_contas = st.checkbox("Analisar todas as contas do cadastro", key="ccb_todas_contas")
         conta_selecionada_display = st.selectbox(
             "Selecione a Conta Bancária para análise:",
             options=contas_display['Display'].tolist(),
-            key="ccb_conta_select"
+            key="ccb_conta_select",
+            disabled=todas_contas
         )
 
     today = datetime.date.today()
@@ -3048,12 +2892,17 @@ def submenu_conciliacao_contas_contabeis_banco():
             data_inicio = datetime.datetime.strptime(data_inicio_str, '%d/%m/%Y').date()
             data_fim = datetime.datetime.strptime(data_fim_str, '%d/%m/%Y').date()
 
-            conta_selecionada_row = df_contas[df_contas['Display'] == conta_selecionada_display].iloc[0]
-
             with st.spinner("Analisando saldos contábeis e gerando lançamentos..."):
-                lancamentos_propostos_df = gerar_lancamentos_saldo_negativo_contabil_cadastro(
-                    conta_selecionada_row, data_inicio, data_fim
-                )
+                if todas_contas:
+                    # Lote: uma carga dos lançamentos contábeis e do plano de contas para todas as contas
+                    lancamentos_propostos_df = gerar_lancamentos_saldo_negativo_todas_contas(
+                        df_contas, data_inicio, data_fim, base='contabil'
+                    )
+                else:
+                    conta_selecionada_row = df_contas[df_contas['Display'] == conta_selecionada_display].iloc[0]
+                    lancamentos_propostos_df = gerar_lancamentos_saldo_negativo_contabil_cadastro(
+                        conta_selecionada_row, data_inicio, data_fim
+                    )
                 st.session_state.lancamentos_contabeis_negativos_propostos = lancamentos_propostos_df
 
         except ValueError:
@@ -3074,10 +2923,10 @@ def submenu_conciliacao_contas_contabeis_banco():
         df_proposto['data_lancamento'] = df_proposto['data_lancamento_dt'].dt.strftime('%d/%m/%Y')
         df_proposto['valor_formatado'] = df_proposto['valor'].apply(formatar_moeda)
 
-        st.dataframe(
-            df_proposto[['data_lancamento', 'historico', 'valor_formatado', 'reduz_deb', 'nome_conta_d', 'reduz_cred', 'nome_conta_c', 'origem']],
-            use_container_width=True
-        )
+        colunas_exibicao = ['data_lancamento', 'historico', 'valor_formatado', 'reduz_deb', 'nome_conta_d', 'reduz_cred', 'nome_conta_c', 'origem']
+        if 'conta_bancaria' in df_proposto.columns:
+            colunas_exibicao.insert(0, 'conta_bancaria')
+        st.dataframe(df_proposto[colunas_exibicao], use_container_width=True)
 
         if st.button("✅ Salvar Lançamentos de Ajuste na Contabilidade"):
             try:
@@ -3133,6 +2982,8 @@ def main():
         if st.button("Resetar Banco de Dados"):
             db_file = 'conciliacao_db.sqlite'
             if os.path.exists(db_file):
+                # As conexões do pool mantêm o arquivo aberto; fecha antes de apagar
+                fechar_conexoes()
                 os.remove(db_file)
                 st.success("Banco de dados resetado.")
                 st.rerun()
@@ -3152,8 +3003,9 @@ def main():
 
     # Botão de limpar cache no sidebar
     st.sidebar.markdown("---")
-    if st.sidebar.button("🔄 Limpar Cache", help="Limpa o cache e atualiza todos os dados", use_container_width=True):
+    if st.sidebar.button("🔄 Limpar Cache", help="Limpa o cache e atualiza todos os dados (inclui os arquivos de extrato já lidos)", use_container_width=True):
         st.cache_data.clear()
+        limpar_cache_importacao()
         st.sidebar.success("✅ Cache limpo!")
         st.rerun()
     st.sidebar.caption("💡 Use se os dados não estiverem atualizados")
@@ -3262,8 +3114,57 @@ def main():
 
         uploaded_file = st.file_uploader("Selecione o arquivo Contábil", type=['xlsx', 'xls', 'csv'])
         substituir_dados = st.checkbox("Substituir lançamentos existentes", value=False)
+        importar_em_lotes = st.checkbox(
+            "Importar em lotes (arquivos grandes)",
+            value=bool(uploaded_file) and uploaded_file.size > LIMITE_EXTRATO_CONTABIL_MB * 1024 * 1024,
+            help="Lê, trata e grava o arquivo em partes, com memória limitada. Lançamentos já gravados antes são ignorados."
+        )
+
+        if uploaded_file and importar_em_lotes:
+            if substituir_dados:
+                limpar_lancamentos_contabeis()
+
+            barra = st.progress(0.0, text="Importando em lotes...")
+            amostra = {}
+
+            def ao_gravar_lote(df_lote, metricas):
+                amostra.setdefault('df', df_lote.head())
+                amostra['metricas'] = metricas
+                progresso = df_lote.attrs.get('progresso')
+                if progresso is None:
+                    progresso = metricas['lotes'] / (metricas['lotes'] + 1)
+                barra.progress(progresso, text=(
+                    f"Lote {metricas['lotes']}: {metricas['linhas']:,} lançamentos lidos, "
+                    f"{metricas['inseridas']:,} gravados ({metricas['linhas_por_segundo']:,.0f} linhas/s)"
+                ))
+
+            try:
+                metricas = salvar_lancamentos_contabeis_em_lotes(ler_extrato_contabil_em_lotes(uploaded_file), ao_gravar_lote)
+            except Exception as e:
+                barra.empty()
+                gravados = amostra.get('metricas', {'lotes': 0, 'inseridas': 0})
+                st.error(f"Erro na importação em lotes: {e}")
+                st.warning(
+                    f"A importação ficou incompleta: {gravados['lotes']} lotes ({gravados['inseridas']} linhas) "
+                    f"foram gravados antes do erro. Corrija o arquivo e envie-o novamente: os lançamentos já "
+                    f"gravados serão ignorados."
+                )
+                st.stop()
+            barra.empty()
+
+            if metricas['lotes'] == 0:
+                st.error("Nenhum dado foi lido do arquivo. Verifique o formato e as colunas.")
+                st.stop()
+
+            st.success(
+                f"Lançamentos contábeis importados e salvos em {metricas['lotes']} lotes: {metricas['inseridas']} linhas em "
+                f"{metricas['segundos']:.1f}s ({metricas['linhas_por_segundo']:,.0f} linhas/s)."
+            )
+            if metricas['ignoradas']:
+                st.info(f"{metricas['ignoradas']} linhas de lançamentos que já estavam gravados foram ignoradas.")
+            st.dataframe(amostra['df'])
 
-        if uploaded_file:
+        elif uploaded_file:
             df_contabil = ler_extrato_contabil(uploaded_file)
 
             # Verificar se leitura funcionou
@@ -3330,8 +3231,11 @@ def main():
                             mime="text/csv"
                         )
 
-            salvar_lancamentos_contabeis(df_contabil)
-            st.success("Lançamentos contábeis importados e salvos.")
+            metricas = salvar_lancamentos_contabeis(df_contabil)
+            st.success(
+                f"Lançamentos contábeis importados e salvos: {metricas['inseridas']} linhas em "
+                f"{metricas['segundos']:.1f}s ({metricas['linhas_por_segundo']:,.0f} linhas/s)."
+            )
             st.dataframe(df_contabil.head())
 
     elif menu_option == "4. Lançamentos Contábeis":
@@ -3461,12 +3365,10 @@ def submenu_exportacao_dominio():
     if st.button("📥 Gerar Arquivo Domínio", type="primary"):
         with st.spinner("Gerando arquivo..."):
             try:
-                from db_manager import carregar_lancamentos_contabeis
-
                 # Validar datas
                 try:
-                    data_inicio = datetime.datetime.strptime(data_inicio_str, "%d/%m/%Y")
-                    data_fim = datetime.datetime.strptime(data_fim_str, "%d/%m/%Y")
+                    data_inicio = datetime.datetime.strptime(data_inicio_str, "%d/%m/%Y").date()
+                    data_fim = datetime.datetime.strptime(data_fim_str, "%d/%m/%Y").date()
                 except ValueError:
                     st.error("⚠️ Formato de data inválido. Use DD/MM/YYYY.")
                     return
@@ -3476,19 +3378,11 @@ def submenu_exportacao_dominio():
                     st.warning("⚠️ Selecione pelo menos uma origem de lançamento.")
                     return
 
-                # Carregar lançamentos
-                df_lancamentos = carregar_lancamentos_contabeis()
-
-                if df_lancamentos.empty:
-                    st.warning("⚠️ Não há lançamentos contábeis para exportar.")
-                    return
-
-                total_inicial = len(df_lancamentos)
-                st.info(f"Total de lançamentos carregados: {total_inicial}")
-
-                # Filtrar por origem
-                df_lancamentos = df_lancamentos[df_lancamentos['origem'].isin(origens_lancamento)]
-                st.info(f"Lançamentos após filtro de origem: {len(df_lancamentos)}")
+                # Carregar lançamentos do período e das origens selecionadas (filtros aplicados no banco)
+                df_lancamentos = carregar_lancamentos(
+                    periodo=(data_inicio, data_fim), origens=origens_lancamento
+                )
+                st.info(f"Lançamentos no período com as origens selecionadas: {len(df_lancamentos)}")
 
                 # Se origem Manual foi selecionada e há filtro de tipo, aplicar filtro adicional
                 if "Manual" in origens_lancamento and tipo_lancamento_manual:
@@ -3503,14 +3397,6 @@ def submenu_exportacao_dominio():
                     df_lancamentos = pd.concat([df_manuais, df_outras_origens], ignore_index=True)
                     st.info(f"Lançamentos após filtro de tipo manual: {len(df_lancamentos)}")
 
-                # Filtrar por período
-                df_lancamentos['data_lancamento'] = pd.to_datetime(df_lancamentos['data_lancamento'])
-                df_lancamentos = df_lancamentos[
-                    (df_lancamentos['data_lancamento'] >= data_inicio) &
-                    (df_lancamentos['data_lancamento'] <= data_fim)
-                ]
-                st.info(f"Lançamentos após filtro de período: {len(df_lancamentos)}")
-
                 if df_lancamentos.empty:
                     st.warning("⚠️ Não há lançamentos no período selecionado com os filtros aplicados.")
                     return
@@ -3778,15 +3664,14 @@ def submenu_exportacao_relatorios_excel():
             try:
                 # Validar datas
                 try:
-                    data_inicio = datetime.datetime.strptime(data_inicio_str, "%d/%m/%Y")
-                    data_fim = datetime.datetime.strptime(data_fim_str, "%d/%m/%Y")
+                    data_inicio = datetime.datetime.strptime(data_inicio_str, "%d/%m/%Y").date()
+                    data_fim = datetime.datetime.strptime(data_fim_str, "%d/%m/%Y").date()
                 except ValueError:
                     st.error("⚠️ Formato de data inválido. Use DD/MM/YYYY.")
                     return
 
                 # Importar biblioteca necessária
                 from io import BytesIO
-                from db_manager import carregar_lancamentos_contabeis
 
                 # Criar arquivo Excel em memória
                 output = BytesIO()
@@ -3794,15 +3679,23 @@ def submenu_exportacao_relatorios_excel():
 
                 # Carregar dados necessários
                 df_plano_contas = carregar_plano_contas()
-                df_lancamentos = carregar_lancamentos_contabeis()
-
-                # Filtrar por período
-                if not df_lancamentos.empty:
-                    df_lancamentos['data'] = pd.to_datetime(df_lancamentos['data'])
-                    df_lancamentos = df_lancamentos[
-                        (df_lancamentos['data'] >= data_inicio) &
-                        (df_lancamentos['data'] <= data_fim)
-                    ]
+                df_partidas = carregar_lancamentos(
+                    periodo=(data_inicio, data_fim),
+                    colunas=['data_lancamento', 'historico', 'valor', 'reduz_deb', 'reduz_cred']
+                )
+
+                # Uma linha por conta movimentada (perna de débito e perna de crédito)
+                pernas = []
+                for coluna_conta, coluna_valor in (('reduz_deb', 'valor_debito'), ('reduz_cred', 'valor_credito')):
+                    perna = df_partidas[df_partidas[coluna_conta].notna()]
+                    pernas.append(pd.DataFrame({
+                        'data': perna['data_lancamento'],
+                        'conta': perna[coluna_conta],
+                        'historico': perna['historico'],
+                        coluna_valor: perna['valor'],
+                    }))
+                df_lancamentos = pd.concat(pernas).fillna({'valor_debito': 0.0, 'valor_credito': 0.0})
+                df_lancamentos = df_lancamentos.sort_index(kind='stable').reset_index(drop=True)
 
                 # 1. Balancete de Verificação
                 if incluir_balancete and not df_lancamentos.empty:
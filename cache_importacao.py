@@ -0,0 +1,172 @@
+"""
+Cache persistente da importação de extratos.
+Guarda em Parquet o DataFrame já processado de cada arquivo, com chave no SHA-256 do conteúdo
+do arquivo e na versão dos leitores: reenviar o mesmo arquivo não refaz a leitura. As mensagens
+da leitura (avisos e erros do leitor) ficam ao lado, em JSON, para serem exibidas de novo. O
+tamanho total é limitado e os arquivos menos usados são descartados primeiro (LRU pela data de uso).
+"""
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+import pandas as pd
+
+# Parquet via pyarrow (dependência do Streamlit); sem ele o cache fica desligado
+try:
+    import pyarrow  # noqa: F401
+    CACHE_DISPONIVEL = True
+except ImportError:
+    CACHE_DISPONIVEL = False
+
+logger = logging.getLogger(__name__)
+
+# Configuração (variáveis de ambiente):
+# - CACHE_IMPORTACAO_DIR: pasta do cache ('' desliga o cache)
+# - CACHE_IMPORTACAO_MAX_MB: tamanho máximo da pasta antes de descartar os menos usados
+CACHE_IMPORTACAO_DIR = os.environ.get('CACHE_IMPORTACAO_DIR', '.cache_importacao')
+CACHE_IMPORTACAO_MAX_MB = float(os.environ.get('CACHE_IMPORTACAO_MAX_MB', '256'))
+
+EXTENSAO = '.parquet'
+EXTENSAO_MENSAGENS = '.json'
+
+
+def cache_ativo() -> bool:
+    return CACHE_DISPONIVEL and bool(CACHE_IMPORTACAO_DIR)
+
+
+def chave_cache(file_bytes: bytes, versao, contexto: str = '') -> str:
+    """Chave do arquivo: SHA-256 do conteúdo + versão dos leitores (+ contexto que altera o resultado)."""
+    conteudo = hashlib.sha256(file_bytes).hexdigest()
+    complemento = hashlib.sha256(f"{versao}|{contexto}".encode()).hexdigest()[:16]
+    return f"{conteudo}_{complemento}"
+
+
+def hash_dataframe(df: pd.DataFrame) -> str:
+    """Impressão digital de um DataFrame (para compor o contexto da chave)."""
+    if df is None or df.empty:
+        return ''
+    valores = pd.util.hash_pandas_object(df.astype(str), index=False).values
+    colunas = '|'.join(map(str, df.columns))
+    return hashlib.sha256(valores.tobytes() + colunas.encode()).hexdigest()
+
+
+def _caminho(chave: str) -> str:
+    return os.path.join(CACHE_IMPORTACAO_DIR, chave + EXTENSAO)
+
+
+def _caminho_mensagens(caminho: str) -> str:
+    return caminho[:-len(EXTENSAO)] + EXTENSAO_MENSAGENS
+
+
+def ler_cache(chave: str):
+    """DataFrame guardado na chave, ou None. Um arquivo ilegível é descartado."""
+    if not cache_ativo():
+        return None
+    caminho = _caminho(chave)
+    if not os.path.exists(caminho):
+        return None
+    try:
+        df = pd.read_parquet(caminho)
+        os.utime(caminho)  # Marca o uso (ordem do LRU)
+        return df
+    except Exception as e:
+        logger.warning("Descartando entrada do cache %s: %s", caminho, e)
+        _remover_entrada(caminho)
+        return None
+
+
+def ler_mensagens_cache(chave: str) -> list:
+    """Mensagens [(tipo, texto)] gravadas com a chave (lista vazia se não houver)."""
+    try:
+        with open(_caminho_mensagens(_caminho(chave)), encoding='utf-8') as arquivo:
+            return [(tipo, texto) for tipo, texto in json.load(arquivo)]
+    except (OSError, ValueError, TypeError):
+        return []
+
+
+def gravar_cache(chave: str, df: pd.DataFrame, mensagens=None) -> bool:
+    """
+    Guarda df (e as mensagens [(tipo, texto)] da leitura) na chave, com gravação atômica, e
+    aplica o limite de tamanho. Retorna se gravou.
+    """
+    if not cache_ativo() or df is None or df.empty:
+        return False
+    os.makedirs(CACHE_IMPORTACAO_DIR, exist_ok=True)
+    caminho = _caminho(chave)
+    caminho_mensagens = _caminho_mensagens(caminho)
+    sufixo = f".{uuid.uuid4().hex}.tmp"
+    try:
+        # As mensagens vão antes: um Parquet no lugar nunca fica sem as mensagens da sua leitura
+        if mensagens:
+            with open(caminho_mensagens + sufixo, 'w', encoding='utf-8') as arquivo:
+                json.dump([list(m) for m in mensagens], arquivo, ensure_ascii=False)
+            os.replace(caminho_mensagens + sufixo, caminho_mensagens)
+        else:
+            _remover(caminho_mensagens)
+        df.to_parquet(caminho + sufixo, index=False)
+        os.replace(caminho + sufixo, caminho)
+    except Exception as e:
+        # Tipos que o Parquet não representa (colunas mistas etc.): o arquivo só não fica em cache
+        logger.warning("Não foi possível gravar %s no cache: %s", chave, e)
+        _remover(caminho_mensagens + sufixo)
+        _remover(caminho + sufixo)
+        return False
+    _aplicar_limite()
+    return True
+
+
+def _arquivos_cache() -> list:
+    if not os.path.isdir(CACHE_IMPORTACAO_DIR):
+        return []
+    arquivos = []
+    for nome in os.listdir(CACHE_IMPORTACAO_DIR):
+        if nome.endswith(EXTENSAO):
+            caminho = os.path.join(CACHE_IMPORTACAO_DIR, nome)
+            try:
+                estado = os.stat(caminho)
+            except OSError:
+                continue
+            arquivos.append((estado.st_mtime, estado.st_size, caminho))
+    return arquivos
+
+
+def _aplicar_limite():
+    """Descarta os arquivos usados há mais tempo até o total caber em CACHE_IMPORTACAO_MAX_MB."""
+    limite = CACHE_IMPORTACAO_MAX_MB * 1024 * 1024
+    arquivos = sorted(_arquivos_cache())
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    for _, tamanho, caminho in arquivos:
+        if total <= limite:
+            break
+        _remover_entrada(caminho)
+        total -= tamanho
+
+
+def _remover(caminho: str):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+def _remover_entrada(caminho: str):
+    """Remove o Parquet e as mensagens guardadas com ele."""
+    _remover(caminho)
+    _remover(_caminho_mensagens(caminho))
+
+
+def limpar_cache() -> int:
+    """Remove todo o cache de importação (ex.: após mudar um leitor sem mudar a versão). Retorna quantos arquivos."""
+    arquivos = _arquivos_cache()
+    for _, _, caminho in arquivos:
+        _remover_entrada(caminho)
+    return len(arquivos)
+
+
+def estatisticas_cache() -> dict:
+    """Quantidade de arquivos e tamanho total (MB) do cache."""
+    arquivos = _arquivos_cache()
+    return {'arquivos': len(arquivos), 'tamanho_mb': sum(t for _, t, _ in arquivos) / (1024 * 1024),
+            'limite_mb': CACHE_IMPORTACAO_MAX_MB}
@@ -0,0 +1,183 @@
+# conciliacao_lote.py
+# Conciliação sem navegador (cron/worker): python -m conciliacao_lote run --empresa CNPJ --periodo AAAA-MM
+# Usa apenas o motor (motor_conciliacao) e o banco (db_manager); o adaptador Streamlit fica em conciliacao.py.
+import argparse
+import calendar
+import datetime
+import re
+import sys
+from typing import Tuple
+
+import pandas as pd
+
+from db_manager import (
+    init_db, carregar_lancamentos, carregar_conciliacoes, salvar_conciliacoes, excluir_conciliacoes,
+    carregar_passagens_conciliacao, carregar_cadastro_contas, carregar_extrato_bancario_periodo, carregar_empresa,
+    ORIGENS_SALDOS_DIARIOS, reconstruir_saldos_diarios
+)
+from motor_conciliacao import (
+    MOTORES_CONCILIACAO, MOTOR_CONCILIACAO_PADRAO, CONCILIACAO_WORKERS_ENV, montar_configuracao_passagens,
+    metricas_conciliacao, conciliar_incremental, montar_extrato_conciliacao, montar_contabil_conciliacao
+)
+
+
+# ==============================================================================
+# 1. CONCILIAÇÃO COM O ESTADO GRAVADO
+# ==============================================================================
+
+def carregar_configuracao_passagens() -> dict:
+    """Configuração de passagens cadastrada em passagens_conciliacao (ou PASSAGES_CONFIG)."""
+    return montar_configuracao_passagens(carregar_passagens_conciliacao())
+
+def conciliar_incremental_gravando(df_extrato_vinculado: pd.DataFrame, df_contabil: pd.DataFrame,
+                                   motor: str, workers, configuracao: dict,
+                                   eventos) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Executa motor_conciliacao.conciliar_incremental com o estado de conciliacoes_extrato_contabil:
+    carrega os pares das linhas do extrato, exclui os obsoletos e grava os novos.
+    """
+    # Só o estado das linhas do extrato carregadas (o custo não cresce com o histórico gravado)
+    ids_extrato = df_extrato_vinculado['ID_Unico'] if 'ID_Unico' in df_extrato_vinculado.columns else []
+    df_ofx_conc, df_contabil_conc, pares, obsoletos = conciliar_incremental(
+        df_extrato_vinculado, df_contabil, carregar_conciliacoes(ids_extrato), motor, workers, configuracao, eventos
+    )
+    if obsoletos:
+        excluir_conciliacoes(obsoletos)
+    salvar_conciliacoes(pares)
+    return df_ofx_conc, df_contabil_conc
+
+
+# ==============================================================================
+# 2. LINHA DE COMANDO (EXECUÇÃO SEM NAVEGADOR)
+# ==============================================================================
+
+def _imprimir_evento(evento: dict) -> None:
+    """Eventos do motor na saída padrão (uso em cron/worker)."""
+    prefixo = '' if evento['nivel'] == 'write' else f"[{evento['nivel'].upper()}] "
+    print(f"{prefixo}{evento['mensagem']}", flush=True)
+
+def _validar_empresa(empresa: str) -> dict:
+    """Confere se --empresa (CNPJ ou razão social) é a empresa do banco de dados configurado."""
+    dados = carregar_empresa()
+    if not dados:
+        raise SystemExit("Nenhuma empresa cadastrada neste banco de dados.")
+
+    def so_digitos(texto):
+        return re.sub(r'\D', '', str(texto or ''))
+
+    informado = str(empresa).strip()
+    if so_digitos(informado) and so_digitos(informado) == so_digitos(dados.get('cnpj')):
+        return dados
+    nomes = {str(dados.get(c) or '').strip().lower() for c in ('razao_social', 'nome_fantasia')} - {''}
+    if informado.lower() in nomes:
+        return dados
+    raise SystemExit(
+        f"A empresa '{empresa}' não corresponde à empresa deste banco de dados "
+        f"({dados.get('razao_social')} - {dados.get('cnpj')}). Verifique DATABASE_URL."
+    )
+
+def _intervalo_periodo(periodo: str) -> Tuple[datetime.date, datetime.date]:
+    """Converte 'AAAA-MM' no primeiro e no último dia do mês."""
+    try:
+        inicio = datetime.datetime.strptime(periodo, '%Y-%m').date()
+    except ValueError:
+        raise SystemExit(f"Período inválido: {periodo}. Use o formato AAAA-MM (ex.: 2026-09).")
+    return inicio, inicio.replace(day=calendar.monthrange(inicio.year, inicio.month)[1])
+
+def executar_conciliacao_periodo(data_inicio: datetime.date, data_fim: datetime.date,
+                                 motor: str = MOTOR_CONCILIACAO_PADRAO, workers=None, completo: bool = False,
+                                 eventos=_imprimir_evento) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Concilia, no período, o extrato histórico de todas as contas bancárias vinculadas a uma
+    conta contábil com os lançamentos contábeis dessas contas, gravando o estado da conciliação.
+    Com completo=True o estado salvo do período é descartado e tudo é conciliado de novo.
+    """
+    df_contas = carregar_cadastro_contas()
+    if df_contas.empty or 'Conta Contábil' not in df_contas.columns:
+        raise SystemExit("O Cadastro de Contas está vazio.")
+    df_contas = df_contas[df_contas['Conta Contábil'].notna()]
+
+    df_extrato = montar_extrato_conciliacao(carregar_extrato_bancario_periodo(data_inicio, data_fim), df_contas)
+    df_extrato = df_extrato[df_extrato['Conta_Contábil_Vinculada'] != 'N/A']
+
+    # O contábil é carregado com a folga da maior janela de datas das passagens
+    configuracao = carregar_configuracao_passagens()
+    passagens = [p for lista in [configuracao['padrao'], *configuracao['por_conta'].values()] for p in lista]
+    folga = datetime.timedelta(days=max([p.get('date_tolerance_days', 0) for p in passagens] + [0]))
+    df_lancamentos = carregar_lancamentos(
+        periodo=(data_inicio - folga, data_fim + folga),
+        colunas=['id', 'data_lancamento', 'valor', 'historico', 'reduz_deb', 'reduz_cred']
+    )
+    df_contabil = montar_contabil_conciliacao(df_lancamentos, df_contas['Conta Contábil'].unique())
+
+    if completo and not df_extrato.empty:
+        excluir_conciliacoes(df_extrato['ID_Unico'].astype(str).tolist())
+
+    return conciliar_incremental_gravando(df_extrato, df_contabil, motor, workers, configuracao, eventos)
+
+def _comando_run(args) -> int:
+    """Subcomando 'run': concilia um período inteiro da empresa."""
+    dados = _validar_empresa(args.empresa)
+    data_inicio, data_fim = _intervalo_periodo(args.periodo)
+    print(f"Empresa: {dados.get('razao_social')} ({dados.get('cnpj')}) | Período: {data_inicio:%d/%m/%Y} a {data_fim:%d/%m/%Y}")
+
+    df_ofx_conc, _ = executar_conciliacao_periodo(data_inicio, data_fim, args.motor, args.workers, args.completo)
+
+    if df_ofx_conc.empty:
+        print("Nenhuma transação do extrato no período.")
+        return 0
+
+    resumo = df_ofx_conc.groupby('Conta_Contábil_Vinculada').agg(
+        transacoes=('Conciliado_Contábil', 'size'),
+        conciliadas=('Conciliado_Contábil', lambda s: int((s == 'Sim').sum()))
+    )
+    resumo['pendentes'] = resumo['transacoes'] - resumo['conciliadas']
+    print(resumo.to_string())
+    print(metricas_conciliacao(df_ofx_conc).to_string(index=False))
+
+    if args.saida:
+        if args.saida.lower().endswith('.xlsx'):
+            df_ofx_conc.to_excel(args.saida, index=False)
+        else:
+            df_ofx_conc.to_csv(args.saida, index=False, sep=';', decimal=',')
+        print(f"Resultado salvo em {args.saida}")
+    return 0
+
+def _comando_saldos(args) -> int:
+    """Subcomando 'saldos': reconstrói a tabela de saldos diários materializados."""
+    origens = ORIGENS_SALDOS_DIARIOS if args.origem == 'todas' else (args.origem,)
+    for origem, dias in reconstruir_saldos_diarios(origens).items():
+        print(f"Saldos diários ({origem}): {dias} dias com movimento gravados.")
+    return 0
+
+def main(argv=None) -> int:
+    """Ponto de entrada da linha de comando."""
+    parser = argparse.ArgumentParser(
+        prog='python -m conciliacao_lote',
+        description="Conciliação extrato x contábil sem a interface. O banco de dados é o configurado "
+                    "em DATABASE_URL (ou o SQLite local)."
+    )
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    run = subcomandos.add_parser('run', help="Concilia todas as contas bancárias vinculadas em um período.")
+    run.add_argument('--empresa', required=True, help="CNPJ (ou razão social) da empresa do banco de dados.")
+    run.add_argument('--periodo', required=True, help="Mês a conciliar, no formato AAAA-MM.")
+    run.add_argument('--motor', default=MOTOR_CONCILIACAO_PADRAO, choices=MOTORES_CONCILIACAO)
+    run.add_argument('--workers', default=None,
+                     help=f"Processos em paralelo (padrão: {CONCILIACAO_WORKERS_ENV} ou 1; 'auto' = nº de CPUs).")
+    run.add_argument('--completo', action='store_true',
+                     help="Descarta o estado salvo do período e concilia tudo novamente.")
+    run.add_argument('--saida', help="Arquivo .csv ou .xlsx com o extrato conciliado.")
+    run.set_defaults(func=_comando_run)
+
+    saldos = subcomandos.add_parser('saldos', help="Reconstrói os saldos diários materializados.")
+    saldos.add_argument('--origem', default='todas', choices=('todas', *ORIGENS_SALDOS_DIARIOS))
+    saldos.set_defaults(func=_comando_saldos)
+
+    args = parser.parse_args(argv)
+    init_db()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,24 +8,352 @@ from typing import Tuple
 import re
 import numpy as np
 import os
-import unicodedata
 import pdfplumber
+from openpyxl import load_workbook
 import hashlib
+from collections import Counter
+import multiprocessing
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Importação Absoluta
 # É CRUCIAL que o utils.py esteja na versão mais recente
-from utils import normalizar_numero, safe_parse_date, extrair_conta_ofx_bruta, normalizar_chave_ofx
+from utils import normalizar_numero, safe_parse_date, extrair_conta_ofx_bruta, normalizar_chave_ofx, remover_acentos
+from utils import normalizar_numero_serie, normalizar_chave_ofx_serie, somente_digitos_serie, remover_acentos_serie
+import cache_importacao
+from leitor_ofx import ler_ofx
+
+
+# ==============================================================================
+# NORMALIZAÇÃO COMUM DOS EXTRATOS IMPORTADOS
+# ==============================================================================
+
+# Colunas do extrato padronizado, na ordem em que todos os leitores as entregam
+COLUNAS_EXTRATO = ['Data Lançamento', 'Data Processamento', 'Valor', 'Descrição', 'ID Transacao', 'Tipo',
+                   'Banco_OFX', 'Conta_OFX_Normalizada', 'Entrada', 'Saída']
+
+
+def converter_datas(serie: pd.Series, padrao) -> pd.Series:
+    """
+    safe_parse_date aplicado a uma coluna inteira: os textos distintos são convertidos de uma vez
+    pelo pd.to_datetime (dayfirst); os que ele não reconhece e os demais valores passam pelo
+    safe_parse_date, uma vez por valor distinto.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.date
+    valores = serie.tolist()
+    unicos = list(dict.fromkeys(valores))
+    textos = [valor for valor in unicos if isinstance(valor, str) and valor]
+    convertidas = {}
+    if textos:
+        try:
+            em_lote = pd.to_datetime(pd.Series(textos), dayfirst=True, format='mixed', errors='coerce')
+            convertidas = {texto: data.date() for texto, data in zip(textos, em_lote) if not pd.isna(data)}
+        except (ValueError, TypeError, OverflowError):
+            pass
+    mapa = {valor: convertidas[valor] if valor in convertidas else safe_parse_date(valor, padrao) for valor in unicos}
+    return pd.Series([mapa[valor] for valor in valores], index=serie.index, dtype=object)
+
+
+def _md5_por_linha(partes) -> list:
+    """md5 da concatenação (str) dos valores de cada linha das partes (colunas ou sequências)."""
+    return [hashlib.md5(''.join(map(str, valores)).encode()).hexdigest() for valores in zip(*partes)]
+
+
+def normalizar_extrato_importado(transacoes, campos_id=None) -> pd.DataFrame:
+    """
+    Etapa final comum aos leitores de extrato (OFX, PDF, Excel, CSV), feita por coluna:
+    - monta o DataFrame (lista de dicts, dict de colunas ou DataFrame);
+    - converte em lote as datas que vieram como texto;
+    - gera 'ID Transacao' pelo md5 dos campos_id (nomes de coluna ou sequências, na ordem);
+    - completa 'Data Processamento' e 'Tipo' e calcula 'Entrada'/'Saída' pelo sinal do Valor;
+    - normaliza 'Conta_OFX_Normalizada' e ordena as colunas no padrão (COLUNAS_EXTRATO + extras).
+    """
+    df = transacoes if isinstance(transacoes, pd.DataFrame) else pd.DataFrame(transacoes)
+    if df.empty:
+        return df
+
+    hoje = date.today()
+    for coluna in ('Data Lançamento', 'Data Processamento'):
+        if coluna in df.columns and pd.api.types.infer_dtype(df[coluna], skipna=True) == 'string':
+            df[coluna] = converter_datas(df[coluna], hoje)
+
+    if campos_id is not None:
+        df['ID Transacao'] = _md5_por_linha([df[parte] if isinstance(parte, str) else parte for parte in campos_id])
+    if 'Data Processamento' not in df.columns:
+        df['Data Processamento'] = df['Data Lançamento']
+    if 'Tipo' not in df.columns:
+        df['Tipo'] = np.where(df['Valor'] > 0, 'CREDIT', 'DEBIT')
+
+    # infer_objects: mesmo tipo que o resultado elemento a elemento (ex.: Decimal do OFX continua object)
+    valor = df['Valor']
+    df['Entrada'] = pd.Series(np.where(valor > 0, valor, 0), index=df.index).infer_objects()
+    df['Saída'] = pd.Series(np.where(valor < 0, -valor, 0), index=df.index).infer_objects()
+
+    if 'Conta_OFX_Normalizada' in df.columns:
+        df['Conta_OFX_Normalizada'] = normalizar_chave_ofx_serie(df['Conta_OFX_Normalizada'])
+
+    extras = [coluna for coluna in df.columns if coluna not in COLUNAS_EXTRATO]
+    return df[[coluna for coluna in COLUNAS_EXTRATO if coluna in df.columns] + extras]
 
 
 # ==============================================================================
 # 1. FUNÇÕES DE CARREGAMENTO DO OFX (Extrato Bancário)
 # ==============================================================================
 
-# CACHE TEMPORARIAMENTE DESABILITADO PARA FORÇAR REPROCESSAMENTO
-# @st.cache_data(show_spinner="Processando arquivo OFX...")
+def _ler_ofx_ofxparse(file_bytes):
+    """Leitura pelo ofxparse, para os arquivos que o leitor rápido não trata. Mesmo retorno de ler_ofx."""
+    # Tentar diferentes encodings para lidar com arquivos do Brasil
+    encodings_to_try = ['cp1252', 'latin-1', 'iso-8859-1', 'utf-8']
+    ofx = None
+    last_error = None
+    file_content = None
+
+    for encoding in encodings_to_try:
+        try:
+            # Decodificar com o encoding específico
+            file_content = file_bytes.decode(encoding)
+
+            # Remover acentos para garantir compatibilidade com a biblioteca ofxparse
+            # A biblioteca ofxparse força ASCII internamente, ignorando o cabeçalho
+            file_content = remover_acentos(file_content)
+
+            # Tentar fazer o parsing usando StringIO (texto puro)
+            ofx = OfxParser.parse(StringIO(file_content))
+            break
+        except (UnicodeDecodeError, UnicodeError) as e:
+            last_error = e
+            continue
+        except Exception as e:
+            # Se não for erro de encoding, provavelmente é outro problema
+            last_error = e
+            continue
+
+    if ofx is None:
+        raise Exception(f"Não foi possível decodificar o arquivo OFX. Último erro: {last_error}")
+
+    contas = []
+    for account in ofx.accounts:
+        transaction_list = getattr(getattr(account, 'statement', None), 'transactions', None) or []
+        contas.append({
+            'conta': getattr(account, 'account_id', ''),
+            'banco': getattr(account, 'routing_number', ''),
+            'agencia': getattr(account, 'branch_id', ''),
+            'datas': [t.date for t in transaction_list],
+            'valores': [t.amount for t in transaction_list],
+            'descricoes': [t.payee or t.memo or '' for t in transaction_list],
+            'ids': [t.id for t in transaction_list],
+            'tipos': [t.type for t in transaction_list],
+        })
+    return file_content, contas
+
+
+def _identificar_conta_ofx(conta_raw, banco_identificador, agencia_raw, file_bytes, file_content, file_name, df_cadastro=None):
+    """Aplica as regras por banco à conta lida do OFX. Retorna (banco, conta normalizada)."""
+    # Fallback final para BANKID se ainda for desconhecido, usando regex
+    if banco_identificador in ['Desconhecido', '000', 'Desconhecido_2']:
+        # Usar file_content que já foi decodificado corretamente acima
+        bankid_match = re.search(r'<BANKID>(\d+)', file_content)
+        if bankid_match:
+            banco_identificador = bankid_match.group(1)
+
+    # Fallback: usa a extração bruta do arquivo (DEVE FUNCIONAR PARA O SICREDI)
+    if not conta_raw:
+        conta_raw = extrair_conta_ofx_bruta(file_bytes)
+
+    # --- Limpeza e Normalização Final ---
+    # 1. Limpa o código do banco para ser apenas numérico
+    banco_match = re.search(r'\d+', str(banco_identificador))
+    if banco_match:
+        banco_identificador = banco_match.group(0)
+
+    # Regra especial para Daycoval (707)
+    if banco_identificador == '707':
+        agencia_raw = '0001'
+
+    # Regra especial para Banco do Brasil (001) - Extrai agência e conta do nome do arquivo
+    if banco_identificador == '001':
+        # Tenta extrair do padrão "Extrato<AGENCIA><CONTA>.ofx"
+        # Exemplo: Extrato152371347578.ofx -> agencia=1523, conta=71347578 ou 1347578
+        match_bb = re.search(r'[Ee]xtrato(\d{4})(\d+)', file_name)
+        if match_bb:
+            agencia_raw = match_bb.group(1)  # Primeiros 4 dígitos
+            conta_extraida = match_bb.group(2)  # Resto dos dígitos
+
+            # Remove possível dígito inicial extra (ex: 71347578 -> 1347578)
+            # Verifica se o primeiro dígito da conta_extraida pode ser removido
+            # comparando com o ACCTID do OFX
+            conta_ofx_limpa = re.sub(r'\D', '', str(conta_raw))  # Remove não-dígitos do ACCTID
+
+            # Tenta encontrar correspondência
+            if len(conta_extraida) > len(conta_ofx_limpa) and conta_extraida[1:] == conta_ofx_limpa:
+                # Caso: 71347578 do arquivo vs 1347578 do OFX
+                conta_raw = conta_extraida[1:]  # Remove primeiro dígito
+            elif len(conta_extraida) >= len(conta_ofx_limpa) and conta_extraida[-len(conta_ofx_limpa):] == conta_ofx_limpa:
+                # Caso: a conta do arquivo contém a conta do OFX no final
+                conta_raw = conta_extraida
+            else:
+                # Usa a conta extraída do arquivo como está
+                conta_raw = conta_extraida
+
+    # 2. Limpa o número da conta para extrair apenas a parte numérica relevante
+    numeros_encontrados = re.findall(r'\d+', str(conta_raw))
+    if numeros_encontrados:
+        conta_raw = max(numeros_encontrados, key=len)
+
+    # Regra especial para Bradesco (237) - O Bradesco exporta OFX com dados incompletos
+    # ACCTID vem truncado (ex: "10" ao invés de "108") e não inclui BRANCHID
+    if banco_identificador == '237':
+        # Tentar extrair BRANCHID (agência) do conteúdo - geralmente não existe
+        branchid_match = re.search(r'<BRANCHID>(\d+)', file_content)
+        if branchid_match:
+            agencia_raw = branchid_match.group(1)
+
+        # Tentar extrair ACCTID (conta) do conteúdo
+        acctid_match = re.search(r'<ACCTID>([^<\n\r]+)', file_content)
+        if acctid_match:
+            acctid_full = acctid_match.group(1).strip()
+            # Remover hífen e dígito verificador (ex: "108-1" -> "108")
+            conta_sem_digito = acctid_full.split('-')[0] if '-' in acctid_full else acctid_full
+            # Extrair apenas números
+            numeros = re.findall(r'\d+', conta_sem_digito)
+            if numeros:
+                conta_raw = max(numeros, key=len)
+
+        # IMPORTANTE: O OFX do Bradesco vem incompleto
+        # Tentar buscar no cadastro de contas automaticamente
+        bradesco_incompleto = False
+
+        # DEBUG: Mostrar valores extraídos
+        st.info(f"🔍 DEBUG Bradesco - Valores extraídos do OFX:")
+        st.info(f"   - agencia_raw: '{agencia_raw}' (tipo: {type(agencia_raw).__name__})")
+        st.info(f"   - conta_raw: '{conta_raw}' (tipo: {type(conta_raw).__name__}, tamanho: {len(str(conta_raw))})")
+        st.info(f"   - Cadastro recebido: {df_cadastro is not None and not df_cadastro.empty if df_cadastro is not None else False}")
+
+        if not agencia_raw or len(str(conta_raw)) < 3:
+            bradesco_incompleto = True
+            st.warning(f"⚠️ Detectado: Bradesco com dados incompletos")
+
+            # Tentar encontrar no cadastro de contas
+            conta_encontrada = False
+            if df_cadastro is not None and not df_cadastro.empty:
+                st.info(f"📋 Cadastro disponível com {len(df_cadastro)} linhas")
+
+                # DEBUG: Mostrar códigos de banco disponíveis
+                if 'Codigo_Banco' in df_cadastro.columns:
+                    codigos_unicos = df_cadastro['Codigo_Banco'].unique()
+                    st.info(f"   - Códigos de banco no cadastro: {list(codigos_unicos)}")
+
+                # Filtrar contas do Bradesco no cadastro (aceita '237' ou '0237')
+                contas_bradesco = df_cadastro[df_cadastro['Codigo_Banco'].isin(['237', '0237'])]
+                st.info(f"   - Contas do Bradesco (237/0237) encontradas: {len(contas_bradesco)}")
+
+                if len(contas_bradesco) == 1:
+                    # Se houver apenas uma conta do Bradesco, usar essa
+                    agencia_raw = contas_bradesco.iloc[0]['Agencia']
+                    conta_cadastro = contas_bradesco.iloc[0]['Conta']
+                    # Remover dígito verificador se houver
+                    conta_raw = conta_cadastro.split('-')[0] if '-' in str(conta_cadastro) else conta_cadastro
+                    conta_encontrada = True
+                    st.success(f"✅ Dados do Bradesco corrigidos automaticamente usando o Cadastro de Contas:")
+                    st.success(f"   - Agência: {agencia_raw} | Conta: {conta_raw}")
+                elif len(contas_bradesco) > 1:
+                    st.warning(f"⚠️ Encontradas {len(contas_bradesco)} contas do Bradesco no cadastro. Não foi possível determinar qual usar automaticamente.")
+            else:
+                st.error(f"❌ Cadastro de contas NÃO disponível (df_cadastro={'None' if df_cadastro is None else 'vazio'})")
+
+            if not conta_encontrada:
+                # Usar o ACCTID original como identificador temporário
+                conta_raw = f"BRADESCO_OFX_{acctid_full}" if acctid_match else "BRADESCO_OFX_DESCONHECIDO"
+                st.error(f"⚠️ ATENÇÃO: Arquivo {file_name} do Bradesco contém dados INCOMPLETOS no OFX!")
+                st.error(f"   - Agência no OFX: {agencia_raw or 'NÃO INFORMADA'}")
+                st.error(f"   - Conta no OFX: {acctid_full if acctid_match else 'NÃO INFORMADA'}")
+                st.info(f"   💡 IMPORTANTE: O Bradesco exporta OFX com dados truncados.")
+                st.warning(f"   📋 RECOMENDAÇÃO: Use os arquivos CSV do Bradesco ao invés de OFX, pois os CSVs contêm agência e conta completas.")
+                st.warning(f"   📋 SOLUÇÃO: Importe o Cadastro de Contas com uma única conta do Bradesco (Código 237, Agência 2115, Conta 108) e reimporte este arquivo.")
+
+    # 3. Normalização da Chave OFX (Agência + Conta)
+    agencia_normalizada = normalizar_numero(agencia_raw).zfill(4) if agencia_raw else ''
+
+    # Evita duplicar a agência se já estiver na conta (comum no Sicredi)
+    if banco_identificador == '748' and agencia_normalizada and conta_raw.startswith(agencia_normalizada):
+         chave_bruta = conta_raw
+    else:
+         chave_bruta = agencia_normalizada + conta_raw
+
+    conta_normalizada = normalizar_chave_ofx(chave_bruta)
+
+    # Garante a string do Banco
+    banco_identificador = str(banco_identificador).strip()
+    if not banco_identificador or not banco_identificador.isdigit():
+        banco_identificador = '000' # Usa um código padrão se tudo falhar
+
+    return banco_identificador, conta_normalizada
+
+
+def _data_transacao_ofx(data_hora, padrao):
+    """safe_parse_date para a data/hora do OFX, sem passar pelo pandas no caso comum."""
+    if data_hora is not None and pd.Timestamp.min <= data_hora <= pd.Timestamp.max:
+        return data_hora.date()
+    return safe_parse_date(data_hora, padrao)
+
+
+def _transacoes_conta_ofx(conta, banco_identificador, conta_normalizada, file_name):
+    """Filtra as transações de uma conta (período principal, marcadores 'SALDO DO DIA') e retorna as colunas."""
+    # Detectar período principal do extrato e filtrar transações
+    hoje = date.today()
+    datas = [_data_transacao_ofx(d, hoje) for d in conta['datas']]
+
+    # Analisar todas as datas para identificar o período principal do extrato
+    periodo_principal = None
+    periodos = Counter((dt.year, dt.month) for dt in datas)
+    if periodos:
+        # Identificar o período com mais transações (período principal do extrato)
+        periodo_principal = max(periodos, key=periodos.get)
+        periodo_ano, periodo_mes = periodo_principal
+        total_periodo_principal = periodos[periodo_principal]
+        total_outros_periodos = sum(v for k, v in periodos.items() if k != periodo_principal)
+
+        # Se há transações de outros períodos, avisar o usuário
+        if len(periodos) > 1 and total_outros_periodos > 0:
+            outros_periodos_str = ', '.join([f"{m:02d}/{a}" for (a, m), count in periodos.items() if (a, m) != periodo_principal])
+            st.warning(f"⚠️ Arquivo {file_name} contém transações de múltiplos períodos. "
+                      f"Importando APENAS {total_periodo_principal} transações de {periodo_mes:02d}/{periodo_ano}. "
+                      f"Ignorando {total_outros_periodos} transações de outros períodos: {outros_periodos_str}")
+        else:
+            st.success(f"✓ Importando {total_periodo_principal} transações do período {periodo_mes:02d}/{periodo_ano}")
+
+    # Ignora transações de "SALDO DO DIA" da Caixa (são apenas marcadores) e as de fora do período principal
+    manter = [
+        'SALDO DO DIA' not in descricao.upper() and (dt.year, dt.month) == periodo_principal
+        for dt, descricao in zip(datas, conta['descricoes'])
+    ]
+
+    def filtrar(valores):
+        return [valor for valor, ok in zip(valores, manter) if ok]
+
+    datas = filtrar(datas)
+    total = len(datas)
+    return {
+        'Data Lançamento': datas,
+        # A data de processamento é a própria data de lançamento (DTPOSTED)
+        'Data Processamento': list(datas),
+        'Valor': filtrar(conta['valores']),
+        'Descrição': filtrar(conta['descricoes']),
+        'ID Transacao': filtrar(conta['ids']),
+        'Tipo': filtrar(conta['tipos']),
+        'Banco_OFX': [banco_identificador] * total,
+        'Conta_OFX_Normalizada': [conta_normalizada] * total,
+    }
+
+
+# Sem st.cache_data: a importação usa o cache persistente por conteúdo do arquivo (cache_importacao)
 def importar_extrato_ofx(file_bytes, file_name, df_cadastro=None):
     """Lê um arquivo OFX, extrai transações e retorna um DataFrame padronizado.
 
+    Usa o leitor rápido (leitor_ofx) e recorre ao ofxparse nos arquivos que ele não trata.
+
     Args:
         file_bytes: Bytes do arquivo OFX
         file_name: Nome do arquivo
@@ -33,319 +361,33 @@ def importar_extrato_ofx(file_bytes, file_name, df_cadastro=None):
     """
     st.info("Processando arquivo OFX...")
     try:
-        # Tentar diferentes encodings para lidar com arquivos do Brasil
-        encodings_to_try = ['cp1252', 'latin-1', 'iso-8859-1', 'utf-8']
-        ofx = None
-        last_error = None
-        file_content = None
-
-        for encoding in encodings_to_try:
-            try:
-                # Decodificar com o encoding específico
-                file_content = file_bytes.decode(encoding)
-
-                # Remover acentos para garantir compatibilidade com a biblioteca ofxparse
-                # A biblioteca ofxparse força ASCII internamente, ignorando o cabeçalho
-                def remove_accents(text):
-                    nfd = unicodedata.normalize('NFD', text)
-                    return ''.join(char for char in nfd if unicodedata.category(char) != 'Mn')
+        leitura = ler_ofx(file_bytes)
+        if leitura is None:
+            leitura = _ler_ofx_ofxparse(file_bytes)
+        file_content, contas = leitura
 
-                file_content = remove_accents(file_content)
-
-                # Tentar fazer o parsing usando StringIO (texto puro)
-                ofx = OfxParser.parse(StringIO(file_content))
-                break
-            except (UnicodeDecodeError, UnicodeError) as e:
-                last_error = e
-                continue
-            except Exception as e:
-                # Se não for erro de encoding, provavelmente é outro problema
-                last_error = e
-                continue
+        colunas = None
+        for conta in contas:
+            banco_identificador, conta_normalizada = _identificar_conta_ofx(
+                conta['conta'], conta['banco'], conta['agencia'], file_bytes, file_content, file_name, df_cadastro)
 
-        if ofx is None:
-            raise Exception(f"Não foi possível decodificar o arquivo OFX. Último erro: {last_error}")
-
-        transactions = []
-
-        # Tenta extrair a conta bruta do arquivo como fallback de primeira (GARANTIA SICREDI)
-        conta_raw_bruta = extrair_conta_ofx_bruta(file_bytes)
-
-        for account in ofx.accounts:
-
-            # 1. Extração da Conta e Banco (Robusta e com Fallback Bruto)
-            banco_identificador = 'Desconhecido'
-            conta_raw = ''
-            agencia_raw = ''
-
-            # Tenta encontrar a estrutura de dados de conta
-            account_data = None
-            if hasattr(account, 'bank_account'):
-                account_data = account.bank_account
-            elif hasattr(account, 'statement_account'):
-                account_data = account.statement_account
-            elif hasattr(account, 'statement') and hasattr(account.statement, 'statement_account'):
-                account_data = account.statement.statement_account
-
-            # --- Extração da Conta ---
-            # Tenta primeiro os atributos diretos do account (ofxparse padrão)
-            conta_raw = getattr(account, 'account_id', '') or getattr(account, 'number', '')
-            banco_identificador = getattr(account, 'routing_number', 'Desconhecido')
-            agencia_raw = getattr(account, 'branch_id', '')
-
-            # Fallback para account_data (se existir)
-            if account_data and not conta_raw:
-                conta_raw = getattr(account_data, 'number', '') or getattr(account_data, 'id', '')
-            if account_data and banco_identificador == 'Desconhecido':
-                banco_identificador = getattr(account_data, 'bankid', 'Desconhecido')
-            if account_data and not agencia_raw:
-                agencia_raw = getattr(account_data, 'branchid', '')
-
-            # Prioridade para o nome do banco se for uma instituição conhecida (ex: Sicredi)
-            if hasattr(account, 'institution') and hasattr(account.institution, 'org'):
-                org_name = account.institution.org.lower()
-                if 'sicredi' in org_name:
-                    banco_identificador = '748'
-
-            # Fallback final para BANKID se ainda for desconhecido, usando regex
-            if banco_identificador in ['Desconhecido', '000', 'Desconhecido_2']:
-                # Usar file_content que já foi decodificado corretamente acima
-                bankid_match = re.search(r'<BANKID>(\d+)', file_content)
-                if bankid_match:
-                    banco_identificador = bankid_match.group(1)
-
-            # 1b. Fallback 1: Tenta extrair da propriedade ID da conta (ACCTID)
-            if not conta_raw:
-                conta_raw = getattr(account, 'id', '')
-
-            # 1c. Fallback 2: Usa a extração bruta do arquivo (DEVE FUNCIONAR PARA O SICREDI)
-            if not conta_raw:
-                conta_raw = conta_raw_bruta
-
-            # 1d. Fallback de Banco (Instituição)
-            if banco_identificador == 'Desconhecido' and hasattr(account, 'institution'):
-                banco_identificador = getattr(account.institution, 'fid', 'Desconhecido_2')
-
-            # --- Limpeza e Normalização Final ---
-            # 1. Limpa o código do banco para ser apenas numérico
-            banco_match = re.search(r'\d+', str(banco_identificador))
-            if banco_match:
-                banco_identificador = banco_match.group(0)
-
-            # Regra especial para Daycoval (707)
-            if banco_identificador == '707':
-                agencia_raw = '0001'
-
-            # Regra especial para Banco do Brasil (001) - Extrai agência e conta do nome do arquivo
-            if banco_identificador == '001':
-                # Tenta extrair do padrão "Extrato<AGENCIA><CONTA>.ofx"
-                # Exemplo: Extrato152371347578.ofx -> agencia=1523, conta=71347578 ou 1347578
-                match_bb = re.search(r'[Ee]xtrato(\d{4})(\d+)', file_name)
-                if match_bb:
-                    agencia_raw = match_bb.group(1)  # Primeiros 4 dígitos
-                    conta_extraida = match_bb.group(2)  # Resto dos dígitos
-
-                    # Remove possível dígito inicial extra (ex: 71347578 -> 1347578)
-                    # Verifica se o primeiro dígito da conta_extraida pode ser removido
-                    # comparando com o ACCTID do OFX
-                    conta_ofx_limpa = re.sub(r'\D', '', str(conta_raw))  # Remove não-dígitos do ACCTID
-
-                    # Tenta encontrar correspondência
-                    if len(conta_extraida) > len(conta_ofx_limpa) and conta_extraida[1:] == conta_ofx_limpa:
-                        # Caso: 71347578 do arquivo vs 1347578 do OFX
-                        conta_raw = conta_extraida[1:]  # Remove primeiro dígito
-                    elif len(conta_extraida) >= len(conta_ofx_limpa) and conta_extraida[-len(conta_ofx_limpa):] == conta_ofx_limpa:
-                        # Caso: a conta do arquivo contém a conta do OFX no final
-                        conta_raw = conta_extraida
-                    else:
-                        # Usa a conta extraída do arquivo como está
-                        conta_raw = conta_extraida
-
-            # 2. Limpa o número da conta para extrair apenas a parte numérica relevante
-            numeros_encontrados = re.findall(r'\d+', str(conta_raw))
-            if numeros_encontrados:
-                conta_raw = max(numeros_encontrados, key=len)
-
-            # Regra especial para Bradesco (237) - O Bradesco exporta OFX com dados incompletos
-            # ACCTID vem truncado (ex: "10" ao invés de "108") e não inclui BRANCHID
-            if banco_identificador == '237':
-                # Tentar extrair BRANCHID (agência) do conteúdo - geralmente não existe
-                branchid_match = re.search(r'<BRANCHID>(\d+)', file_content)
-                if branchid_match:
-                    agencia_raw = branchid_match.group(1)
-
-                # Tentar extrair ACCTID (conta) do conteúdo
-                acctid_match = re.search(r'<ACCTID>([^<\n\r]+)', file_content)
-                if acctid_match:
-                    acctid_full = acctid_match.group(1).strip()
-                    # Remover hífen e dígito verificador (ex: "108-1" -> "108")
-                    conta_sem_digito = acctid_full.split('-')[0] if '-' in acctid_full else acctid_full
-                    # Extrair apenas números
-                    numeros = re.findall(r'\d+', conta_sem_digito)
-                    if numeros:
-                        conta_raw = max(numeros, key=len)
-
-                # IMPORTANTE: O OFX do Bradesco vem incompleto
-                # Tentar buscar no cadastro de contas automaticamente
-                bradesco_incompleto = False
-
-                # DEBUG: Mostrar valores extraídos
-                st.info(f"🔍 DEBUG Bradesco - Valores extraídos do OFX:")
-                st.info(f"   - agencia_raw: '{agencia_raw}' (tipo: {type(agencia_raw).__name__})")
-                st.info(f"   - conta_raw: '{conta_raw}' (tipo: {type(conta_raw).__name__}, tamanho: {len(str(conta_raw))})")
-                st.info(f"   - Cadastro recebido: {df_cadastro is not None and not df_cadastro.empty if df_cadastro is not None else False}")
-
-                if not agencia_raw or len(str(conta_raw)) < 3:
-                    bradesco_incompleto = True
-                    st.warning(f"⚠️ Detectado: Bradesco com dados incompletos")
-
-                    # Tentar encontrar no cadastro de contas
-                    conta_encontrada = False
-                    if df_cadastro is not None and not df_cadastro.empty:
-                        st.info(f"📋 Cadastro disponível com {len(df_cadastro)} linhas")
-
-                        # DEBUG: Mostrar códigos de banco disponíveis
-                        if 'Codigo_Banco' in df_cadastro.columns:
-                            codigos_unicos = df_cadastro['Codigo_Banco'].unique()
-                            st.info(f"   - Códigos de banco no cadastro: {list(codigos_unicos)}")
-
-                        # Filtrar contas do Bradesco no cadastro (aceita '237' ou '0237')
-                        contas_bradesco = df_cadastro[df_cadastro['Codigo_Banco'].isin(['237', '0237'])]
-                        st.info(f"   - Contas do Bradesco (237/0237) encontradas: {len(contas_bradesco)}")
-
-                        if len(contas_bradesco) == 1:
-                            # Se houver apenas uma conta do Bradesco, usar essa
-                            agencia_raw = contas_bradesco.iloc[0]['Agencia']
-                            conta_cadastro = contas_bradesco.iloc[0]['Conta']
-                            # Remover dígito verificador se houver
-                            conta_raw = conta_cadastro.split('-')[0] if '-' in str(conta_cadastro) else conta_cadastro
-                            conta_encontrada = True
-                            st.success(f"✅ Dados do Bradesco corrigidos automaticamente usando o Cadastro de Contas:")
-                            st.success(f"   - Agência: {agencia_raw} | Conta: {conta_raw}")
-                        elif len(contas_bradesco) > 1:
-                            st.warning(f"⚠️ Encontradas {len(contas_bradesco)} contas do Bradesco no cadastro. Não foi possível determinar qual usar automaticamente.")
-                    else:
-                        st.error(f"❌ Cadastro de contas NÃO disponível (df_cadastro={'None' if df_cadastro is None else 'vazio'})")
-
-                    if not conta_encontrada:
-                        # Usar o ACCTID original como identificador temporário
-                        conta_raw = f"BRADESCO_OFX_{acctid_full}" if acctid_match else "BRADESCO_OFX_DESCONHECIDO"
-                        st.error(f"⚠️ ATENÇÃO: Arquivo {file_name} do Bradesco contém dados INCOMPLETOS no OFX!")
-                        st.error(f"   - Agência no OFX: {agencia_raw or 'NÃO INFORMADA'}")
-                        st.error(f"   - Conta no OFX: {acctid_full if acctid_match else 'NÃO INFORMADA'}")
-                        st.info(f"   💡 IMPORTANTE: O Bradesco exporta OFX com dados truncados.")
-                        st.warning(f"   📋 RECOMENDAÇÃO: Use os arquivos CSV do Bradesco ao invés de OFX, pois os CSVs contêm agência e conta completas.")
-                        st.warning(f"   📋 SOLUÇÃO: Importe o Cadastro de Contas com uma única conta do Bradesco (Código 237, Agência 2115, Conta 108) e reimporte este arquivo.")
-
-            # 3. Normalização da Chave OFX (Agência + Conta)
-            agencia_normalizada = normalizar_numero(agencia_raw).zfill(4) if agencia_raw else ''
-
-            # Evita duplicar a agência se já estiver na conta (comum no Sicredi)
-            if banco_identificador == '748' and agencia_normalizada and conta_raw.startswith(agencia_normalizada):
-                 chave_bruta = conta_raw
-            else:
-                 chave_bruta = agencia_normalizada + conta_raw
-
-            conta_normalizada = normalizar_chave_ofx(chave_bruta)
-
-            # Garante a string do Banco
-            banco_identificador = str(banco_identificador).strip()
-            if not banco_identificador or not banco_identificador.isdigit():
-                banco_identificador = '000' # Usa um código padrão se tudo falhar
-
-            # --- 2. Busca pela Lista de Transações (ROBUSTA) ---
-            transaction_list = []
-            if account_data and hasattr(account_data, 'transactions'):
-                transaction_list = account_data.transactions
-            if not transaction_list and hasattr(account, 'statement') and hasattr(account.statement, 'transactions'):
-                transaction_list = account.statement.transactions
-            if not transaction_list and hasattr(account, 'transactions'):
-                transaction_list = account.transactions
-
-            if not transaction_list:
+            if not conta['datas']:
                 st.error(
                     f"ERRO: Nenhuma transação encontrada para a conta '{conta_normalizada}' no arquivo {file_name}. O OFX não pôde ser lido corretamente.")
                 continue
 
-            # 3. Processamento das transações
-            total_original = len(transaction_list)
-            total_saldo_dia = 0
-            total_processadas = 0
-
-            # Detectar período principal do extrato e filtrar transações
-            from datetime import datetime, timedelta
-            hoje = date.today()
-
-            # Analisar todas as datas para identificar o período principal do extrato
-            periodo_mes = None
-            periodo_ano = None
-
-            if len(transaction_list) > 0:
-                # Contar transações por mês/ano
-                periodos = {}
-                for t in transaction_list:
-                    dt = safe_parse_date(t.date, hoje)
-                    periodo_key = (dt.year, dt.month)
-                    periodos[periodo_key] = periodos.get(periodo_key, 0) + 1
-
-                # Identificar o período com mais transações (período principal do extrato)
-                if periodos:
-                    periodo_principal = max(periodos, key=periodos.get)
-                    periodo_ano, periodo_mes = periodo_principal
-                    total_periodo_principal = periodos[periodo_principal]
-                    total_outros_periodos = sum(v for k, v in periodos.items() if k != periodo_principal)
-
-                    # Se há transações de outros períodos, avisar o usuário
-                    if len(periodos) > 1 and total_outros_periodos > 0:
-                        outros_periodos_str = ', '.join([f"{m:02d}/{a}" for (a, m), count in periodos.items() if (a, m) != periodo_principal])
-                        st.warning(f"⚠️ Arquivo {file_name} contém transações de múltiplos períodos. "
-                                  f"Importando APENAS {total_periodo_principal} transações de {periodo_mes:02d}/{periodo_ano}. "
-                                  f"Ignorando {total_outros_periodos} transações de outros períodos: {outros_periodos_str}")
-                    else:
-                        st.success(f"✓ Importando {total_periodo_principal} transações do período {periodo_mes:02d}/{periodo_ano}")
-
-            transacoes_filtradas = 0
-            for t in transaction_list:
-                # Ignora transações de "SALDO DO DIA" da Caixa (são apenas marcadores)
-                descricao = t.payee or t.memo or ''
-                if 'SALDO DO DIA' in descricao.upper():
-                    total_saldo_dia += 1
-                    continue
-
-                data_lancamento = safe_parse_date(t.date, date.today())
-                data_processamento = safe_parse_date(getattr(t, 'date_user', t.date), data_lancamento)
-
-                # Filtrar transações fora do período principal
-                if periodo_mes and periodo_ano:
-                    if data_lancamento.year != periodo_ano or data_lancamento.month != periodo_mes:
-                        transacoes_filtradas += 1
-                        continue
-
-                transactions.append({
-                    'Data Lançamento': data_lancamento,
-                    'Data Processamento': data_processamento,
-                    'Valor': t.amount,
-                    'Descrição': descricao,
-                    'ID Transacao': t.id,
-                    'Tipo': t.type,
-                    'Banco_OFX': banco_identificador,
-                    'Conta_OFX_Normalizada': conta_normalizada
-                })
-                total_processadas += 1
-
-            # Mostra informações de processamento se houver filtros aplicados
-            # if total_saldo_dia > 0:
-            #     st.info(f"Arquivo: {file_name} | {total_processadas} transações válidas ({total_saldo_dia} marcadores 'SALDO DO DIA' filtrados)")
+            parte = _transacoes_conta_ofx(conta, banco_identificador, conta_normalizada, file_name)
+            if colunas is None:
+                colunas = parte
+            else:
+                for nome, valores in parte.items():
+                    colunas[nome].extend(valores)
 
-        if not transactions:
+        if not colunas or not colunas['Valor']:
             st.error(f"Arquivo {file_name}: Nenhuma transação foi processada.")
             return pd.DataFrame()
 
-        df = pd.DataFrame(transactions)
-        df['Entrada'] = df['Valor'].apply(lambda x: x if x > 0 else 0)
-        df['Saída'] = df['Valor'].apply(lambda x: abs(x) if x < 0 else 0)
-
-        return df
+        return normalizar_extrato_importado(colunas)
 
     except Exception as e:
         st.error(f"Erro crítico ao processar o arquivo OFX ({file_name}): {e}")
@@ -417,24 +459,11 @@ def importar_extrato_excel_daycoval(file_bytes, file_name):
         chave_bruta = agencia_raw + conta_raw
         df['Conta_OFX_Normalizada'] = normalizar_chave_ofx(chave_bruta)
 
-        # Gerar ID único para cada transação (hash de data + descrição + valor + conta + índice)
-        import hashlib
-        def gerar_id_transacao(row):
-            id_str = f"{row['Data Lançamento']}{row['Descrição']}{row['Valor']}{chave_bruta}{row.name}"
-            return hashlib.md5(id_str.encode()).hexdigest()
-
-        df['ID Transacao'] = df.apply(gerar_id_transacao, axis=1)
-        df['Tipo'] = df['Valor'].apply(lambda x: 'CREDIT' if x > 0 else 'DEBIT')
-        df['Data Processamento'] = df['Data Lançamento']
-
-        # Adicionar colunas de Entrada e Saída
-        df['Entrada'] = df['Valor'].apply(lambda x: x if x > 0 else 0)
-        df['Saída'] = df['Valor'].apply(lambda x: abs(x) if x < 0 else 0)
-
-        # Selecionar e ordenar colunas no padrão do sistema (igual ao OFX)
-        df = df[['Data Lançamento', 'Data Processamento', 'Valor', 'Descrição',
-                 'ID Transacao', 'Tipo', 'Banco_OFX', 'Conta_OFX_Normalizada',
-                 'Entrada', 'Saída']]
+        # Colunas no padrão do sistema (igual ao OFX); ID único para cada transação
+        # (hash de data + descrição + valor + conta + índice), Tipo, Entrada e Saída
+        df = normalizar_extrato_importado(
+            df[['Data Lançamento', 'Valor', 'Descrição', 'Banco_OFX', 'Conta_OFX_Normalizada']],
+            campos_id=['Data Lançamento', 'Descrição', 'Valor', [chave_bruta] * len(df), df.index])
 
         st.success(f"Arquivo Excel Daycoval '{file_name}' importado: {len(df)} transações")
         return df
@@ -447,45 +476,186 @@ def importar_extrato_excel_daycoval(file_bytes, file_name):
 
 # CACHE TEMPORARIAMENTE DESABILITADO
 # @st.cache_data
-def importar_multiplos_extratos(uploaded_files, df_cadastro=None):
-    """Importa múltiplos arquivos de extrato (OFX, PDF, Excel) e concatena em um único DataFrame.
+# Processos usados na importação de vários arquivos (variável de ambiente IMPORTACAO_WORKERS):
+# número de processos, 'auto' (padrão) = nº de CPUs, 1 = sequencial no próprio processo
+IMPORTACAO_WORKERS_ENV = 'IMPORTACAO_WORKERS'
 
-    Args:
-        uploaded_files: Lista de arquivos enviados
-        df_cadastro: DataFrame do cadastro de contas (opcional, para corrigir dados incompletos do Bradesco)
+# Versão dos leitores de extrato (OFX, PDF, Excel): faz parte da chave do cache de importação.
+# Incrementar ao mudar a lógica de qualquer leitor, para que arquivos já lidos sejam reprocessados.
+VERSAO_LEITORES_EXTRATO = 2
+
+# Mensagens do Streamlit que os processos de trabalho registram e a sessão exibe depois
+_MENSAGENS_ST = ('success', 'info', 'warning', 'error', 'exception')
+_captura_st_lock = threading.Lock()
+
+
+def importar_arquivo_extrato(file_bytes, file_name, df_cadastro=None):
     """
-    all_dfs = []
-    for file in uploaded_files:
-        file_bytes = file.getvalue()
-        file_name = file.name
-        df = pd.DataFrame()
-
-        if file_name.lower().endswith(('.ofx', '.ofc')):
-            df = importar_extrato_ofx(file_bytes, file_name, df_cadastro=df_cadastro)
-        elif file_name.lower().endswith(('.xls', '.xlsx')):
-            df = importar_extrato_excel_daycoval(file_bytes, file_name)
-        elif file_name.lower().endswith('.pdf'):
-            try:
-                with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-                    if not pdf.pages:
-                        st.error(f"O arquivo PDF '{file_name}' não tem páginas.")
-                        continue
+    Importa um arquivo de extrato (OFX, PDF ou Excel) conforme o formato. O PDF é aberto uma
+    única vez: o banco é detectado pela primeira página e o documento vai aberto para o leitor.
+    """
+    nome = file_name.lower()
+    if nome.endswith(('.ofx', '.ofc')):
+        return importar_extrato_ofx(file_bytes, file_name, df_cadastro=df_cadastro)
+    if nome.endswith(('.xls', '.xlsx')):
+        return importar_extrato_excel_daycoval(file_bytes, file_name)
+    if nome.endswith('.pdf'):
+        try:
+            with pdfplumber.open(BytesIO(file_bytes)) as pdf:
+                if not pdf.pages:
+                    st.error(f"O arquivo PDF '{file_name}' não tem páginas.")
+                    return pd.DataFrame()
+
+                first_page_text = (pdf.pages[0].extract_text() or '').lower()
+
+                if 'sicredi' in first_page_text:
+                    st.success("PDF do Sicredi detectado.")
+                    return importar_extrato_pdf_sicredi(file_bytes, file_name, _pdf=pdf)
+                elif 'santander' in first_page_text or 'extrato consolidado' in first_page_text:
+                    st.success("PDF do Santander detectado.")
+                    return importar_extrato_pdf_santander(file_bytes, file_name, _pdf=pdf)
+                else:
+                    st.warning(f"O arquivo PDF '{file_name}' não é de um banco suportado e foi ignorado.")
+        except Exception as e:
+            st.warning(f"Não foi possível ler o PDF '{file_name}'. Erro: {e}")
+    return pd.DataFrame()
 
-                    first_page_text = pdf.pages[0].extract_text()
 
-                    if 'sicredi' in first_page_text.lower():
-                        st.success("PDF do Sicredi detectado.")
-                        df = importar_extrato_pdf_sicredi(file_bytes, file_name)
-                    elif 'santander' in first_page_text.lower() or 'extrato consolidado' in first_page_text.lower():
-                        st.success("PDF do Santander detectado.")
-                        df = importar_extrato_pdf_santander(file_bytes, file_name)
-                    else:
-                        st.warning(f"O arquivo PDF '{file_name}' não é de um banco suportado e foi ignorado.")
+@contextmanager
+def _capturar_mensagens_st(exibir: bool):
+    """
+    Registra as mensagens st.<tipo> (_MENSAGENS_ST) emitidas nesta thread e entrega a lista
+    [(tipo, texto)]. Com exibir, elas também saem no Streamlit; as de outras threads passam direto.
+    Uma captura por vez, para que as funções originais sejam restauradas na ordem certa.
+    """
+    mensagens = []
+    thread = threading.get_ident()
+
+    def capturar(tipo, original):
+        def funcao(corpo, *args, **kwargs):
+            if threading.get_ident() != thread:
+                return original(corpo, *args, **kwargs)
+            mensagens.append((tipo, str(corpo)))
+            return original(corpo, *args, **kwargs) if exibir else None
+        return funcao
+
+    with _captura_st_lock:
+        originais = {tipo: getattr(st, tipo) for tipo in _MENSAGENS_ST}
+        for tipo, original in originais.items():
+            setattr(st, tipo, capturar(tipo, original))
+        try:
+            yield mensagens
+        finally:
+            for tipo, original in originais.items():
+                setattr(st, tipo, original)
+
+
+def _importar_arquivo_processo(file_bytes, file_name, df_cadastro=None):
+    """Executado em um processo de trabalho: importa um arquivo e devolve (df, mensagens do st)."""
+    with _capturar_mensagens_st(exibir=False) as mensagens:
+        try:
+            df = importar_arquivo_extrato(file_bytes, file_name, df_cadastro)
+        except Exception as e:
+            mensagens.append(('error', f"Erro ao importar o arquivo '{file_name}': {e}"))
+            df = pd.DataFrame()
+    return df, mensagens
+
+
+def resolver_workers_importacao(workers=None, arquivos: int = None) -> int:
+    """Processos da importação: parâmetro explícito, senão IMPORTACAO_WORKERS, senão nº de CPUs (limitado a arquivos)."""
+    if workers is None:
+        workers = os.environ.get(IMPORTACAO_WORKERS_ENV, 'auto')
+    if str(workers).strip().lower() in ('0', 'auto'):
+        workers = os.cpu_count() or 1
+    try:
+        workers = max(int(workers), 1)
+    except (TypeError, ValueError):
+        raise ValueError(f"Número de workers inválido: {workers}")
+    return min(workers, arquivos) if arquivos else workers
+
+
+def _chave_cache_arquivo(file_bytes, file_name, hash_cadastro: str) -> str:
+    """Chave do cache de importação; no OFX o cadastro entra na chave (corrige dados do Bradesco)."""
+    contexto = hash_cadastro if file_name.lower().endswith(('.ofx', '.ofc')) else ''
+    return cache_importacao.chave_cache(file_bytes, VERSAO_LEITORES_EXTRATO, contexto)
+
+
+def importar_extratos_em_paralelo(arquivos, df_cadastro=None, workers=None):
+    """
+    Importa arquivos [(file_bytes, file_name), ...] em um ProcessPoolExecutor e entrega
+    (posição, file_name, df, mensagens) à medida que cada arquivo termina (gerador).
+    Arquivos já lidos antes (mesmo conteúdo e versão dos leitores) vêm do cache de importação
+    sem reprocessar, com as mensagens da leitura original; os lidos agora são gravados nele.
+    Com um único processo, importa aqui mesmo e as mensagens já saem direto no Streamlit.
+    """
+    arquivos = list(arquivos)
+    hash_cadastro = cache_importacao.hash_dataframe(df_cadastro) if cache_importacao.cache_ativo() else ''
+    chaves = [_chave_cache_arquivo(file_bytes, file_name, hash_cadastro) for file_bytes, file_name in arquivos]
+
+    pendentes = []
+    for posicao, (file_bytes, file_name) in enumerate(arquivos):
+        df = cache_importacao.ler_cache(chaves[posicao])
+        if df is None:
+            pendentes.append(posicao)
+        else:
+            mensagens = cache_importacao.ler_mensagens_cache(chaves[posicao])
+            mensagens.append(('info', f"Arquivo '{file_name}' já importado antes: {len(df)} transações lidas do cache."))
+            yield posicao, file_name, df, mensagens
+
+    if not pendentes:
+        return
+    workers = resolver_workers_importacao(workers, len(pendentes))
+    if workers <= 1:
+        for posicao in pendentes:
+            file_bytes, file_name = arquivos[posicao]
+            with _capturar_mensagens_st(exibir=True) as mensagens:
+                df = importar_arquivo_extrato(file_bytes, file_name, df_cadastro)
+            cache_importacao.gravar_cache(chaves[posicao], df, mensagens)
+            yield posicao, file_name, df, []
+        return
+
+    # spawn: um fork do servidor do Streamlit (multithread) herdaria o pool de conexões e locks ocupados
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futuros = {
+            executor.submit(_importar_arquivo_processo, *arquivos[posicao], df_cadastro): posicao
+            for posicao in pendentes
+        }
+        for futuro in as_completed(futuros):
+            posicao = futuros[futuro]
+            file_name = arquivos[posicao][1]
+            try:
+                df, mensagens = futuro.result()
+                cache_importacao.gravar_cache(chaves[posicao], df, mensagens)
             except Exception as e:
-                st.warning(f"Não foi possível ler o PDF '{file_name}'. Erro: {e}")
+                df, mensagens = pd.DataFrame(), [('error', f"Erro ao importar o arquivo '{file_name}': {e}")]
+            yield posicao, file_name, df, mensagens
 
-        if not df.empty:
-            all_dfs.append(df)
+
+def importar_multiplos_extratos(uploaded_files, df_cadastro=None, workers=None):
+    """Importa múltiplos arquivos de extrato (OFX, PDF, Excel) e concatena em um único DataFrame.
+
+    Args:
+        uploaded_files: Lista de arquivos enviados
+        df_cadastro: DataFrame do cadastro de contas (opcional, para corrigir dados incompletos do Bradesco)
+        workers: processos em paralelo (padrão: IMPORTACAO_WORKERS ou nº de CPUs; 1 = sequencial)
+    """
+    arquivos = [(file.getvalue(), file.name) for file in uploaded_files]
+    resultados = [None] * len(arquivos)
+    progresso = st.progress(0.0, text="Importando arquivos...") if len(arquivos) > 1 else None
+
+    # Resultados e erros de cada arquivo aparecem assim que ele termina
+    for concluidos, (posicao, file_name, df, mensagens) in enumerate(
+            importar_extratos_em_paralelo(arquivos, df_cadastro, workers), start=1):
+        for tipo, texto in mensagens:
+            getattr(st, 'error' if tipo == 'exception' else tipo)(texto)
+        resultados[posicao] = df
+        if progresso is not None:
+            progresso.progress(concluidos / len(arquivos), text=f"{concluidos}/{len(arquivos)} arquivos ({file_name})")
+    if progresso is not None:
+        progresso.empty()
+
+    # Concatena na ordem de envio, independente da ordem de término
+    all_dfs = [df for df in resultados if df is not None and not df.empty]
 
     if all_dfs:
         df_final = pd.concat(all_dfs, ignore_index=True)
@@ -494,7 +664,7 @@ def importar_multiplos_extratos(uploaded_files, df_cadastro=None):
             df_final['Banco_OFX'] = df_final['Banco_OFX'].astype(str).replace(['None', 'none', 'nan'], 'Desconhecido')
 
         if 'Conta_OFX_Normalizada' in df_final.columns:
-            df_final['Conta_OFX_Normalizada'] = df_final['Conta_OFX_Normalizada'].apply(normalizar_chave_ofx)
+            df_final['Conta_OFX_Normalizada'] = normalizar_chave_ofx_serie(df_final['Conta_OFX_Normalizada'])
 
         return df_final
     return pd.DataFrame()
@@ -504,14 +674,77 @@ def importar_multiplos_extratos(uploaded_files, df_cadastro=None):
 # 2. FUNÇÃO DE CARREGAMENTO DO EXTRATO CONTÁBIL
 # ==============================================================================
 
-def tratar_lancamentos_problematicos(df):
+# Regras para lançamentos com débito = crédito na mesma conta (avaliadas em ordem; vale a primeira que casar).
+# - conta: conta reduzida que aparece no débito e no crédito
+# - estorno: True = só com 'estorno' no histórico, False = só sem, None = tanto faz
+# - acao: 'excluir' remove o lançamento; 'ajustar' troca a conta do lado indicado ('Deb' ou 'Cred')
+# Para incluir/alterar regras sem mexer no código, crie o CSV apontado por REGRAS_LANCAMENTOS_ARQUIVO
+# (separador ';', colunas conta;estorno;acao;lado;nova_conta;novo_nome, estorno = sim/nao/vazio).
+# Quando o arquivo existe, ele substitui a tabela abaixo.
+REGRAS_LANCAMENTOS_PROBLEMATICOS = [
+    {'conta': 395, 'estorno': True, 'acao': 'excluir'},
+    {'conta': 8, 'estorno': None, 'acao': 'ajustar', 'lado': 'Deb', 'nova_conta': 302, 'novo_nome': 'CAIXA GERAL'},
+    {'conta': 395, 'estorno': False, 'acao': 'ajustar', 'lado': 'Cred', 'nova_conta': 70, 'novo_nome': 'AJUSTE CONTABIL'},
+]
+REGRAS_LANCAMENTOS_ARQUIVO = os.environ.get('REGRAS_LANCAMENTOS_ARQUIVO', 'regras_lancamentos.csv')
+
+
+def carregar_regras_lancamentos(caminho=None):
+    """Regras de lançamentos problemáticos: as do CSV configurado, se existir, senão as padrão."""
+    caminho = REGRAS_LANCAMENTOS_ARQUIVO if caminho is None else caminho
+    if not caminho or not os.path.exists(caminho):
+        return REGRAS_LANCAMENTOS_PROBLEMATICOS
+
+    try:
+        tabela = pd.read_csv(caminho, sep=';', dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        tabela.columns = [str(col).strip().lower() for col in tabela.columns]
+        regras = []
+        for linha in tabela.to_dict('records'):
+            estorno = remover_acentos(linha.get('estorno', '').strip().lower())
+            lado = linha.get('lado', '').strip().lower()
+            regra = {
+                'conta': int(float(linha['conta'])),
+                'estorno': True if estorno in ('sim', 's', 'true', '1') else False if estorno in ('nao', 'n', 'false', '0') else None,
+                'acao': linha['acao'].strip().lower(),
+            }
+            if regra['acao'] == 'ajustar':
+                regra['lado'] = 'Deb' if lado.startswith('d') else 'Cred'
+                regra['nova_conta'] = int(float(linha['nova_conta']))
+                regra['novo_nome'] = linha.get('novo_nome', '').strip()
+            elif regra['acao'] != 'excluir':
+                raise ValueError(f"ação desconhecida '{regra['acao']}'")
+            regras.append(regra)
+        return regras
+    except Exception as e:
+        st.warning(f"⚠️ Regras de lançamentos em '{caminho}' inválidas ({e}). Usando as regras padrão.")
+        return REGRAS_LANCAMENTOS_PROBLEMATICOS
+
+
+def _avisar_lancamentos_tratados(contagens):
+    """Mensagens do tratamento de lançamentos problemáticos (contagens de tratar_lancamentos_problematicos)."""
+    if contagens['excluidos']:
+        regras_excluir = contagens['regras_excluir']
+        contas_txt = '/'.join(dict.fromkeys(str(r['conta']) for r in regras_excluir))
+        de_estorno = 'de estorno ' if all(r.get('estorno') for r in regras_excluir) else ''
+        st.info(f"🗑️ {contagens['excluidos']} lançamentos {de_estorno}(conta {contas_txt} deb/cred) foram excluídos automaticamente.")
+
+    if contagens['ajustados'] > 0:
+        st.info(f"✏️ {contagens['ajustados']} lançamentos com débito=crédito na mesma conta foram ajustados automaticamente.")
+
+
+def tratar_lancamentos_problematicos(df, regras=None, contagens=None):
     """
     Aplica regras de tratamento para lançamentos com débito = crédito na mesma conta.
 
-    Regras:
+    Regras padrão (REGRAS_LANCAMENTOS_PROBLEMATICOS):
     1. Conta 8 em débito e crédito: débito 302 (CAIXA GERAL), crédito 8
     2. Conta 395 em débito e crédito (sem 'estorno'): débito 395, crédito 70 (AJUSTE CONTABIL)
     3. Conta 395 em débito e crédito + 'estorno' no histórico: EXCLUIR lançamento
+
+    Os lançamentos são resumidos em uma única passada de groupby por 'ID Lancamento' e as
+    regras viram máscaras booleanas (custo linear no tamanho do extrato).
+    Se contagens (dict) for informado, as contagens são acumuladas nele em vez de exibidas
+    (importação em lotes: uma mensagem só no final).
     """
     if df.empty:
         return df
@@ -520,7 +753,7 @@ def tratar_lancamentos_problematicos(df):
     def normalizar_conta(valor):
         try:
             return int(float(valor))
-        except (ValueError, TypeError):
+        except (ValueError, TypeError, OverflowError):
             return None
 
     # Função auxiliar para verificar se o histórico contém 'estorno'
@@ -533,120 +766,151 @@ def tratar_lancamentos_problematicos(df):
     if 'ID Lancamento' not in df.columns:
         return df
 
-    ids_para_excluir = []
-    registros_modificados = 0
+    regras = carregar_regras_lancamentos() if regras is None else regras
 
-    for id_lanc in df['ID Lancamento'].dropna().unique():
-        grupo_idx = df[df['ID Lancamento'] == id_lanc].index
-        grupo = df.loc[grupo_idx]
+    # Grupo de cada linha (-1 = sem ID, fica de fora)
+    grupo = df.groupby('ID Lancamento', sort=False, dropna=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    com_id = grupo >= 0
+    if not com_id.any():
+        return df
 
-        # Pegar contas de débito e crédito
-        reduz_deb_vals = grupo['ReduzDeb'].dropna().unique()
-        reduz_cred_vals = grupo['ReduzCred'].dropna().unique()
+    # Resumo por lançamento: contas distintas de débito/crédito e o histórico da primeira linha
+    contas = pd.DataFrame({'deb': df['ReduzDeb'].to_numpy(), 'cred': df['ReduzCred'].to_numpy()})[com_id]
+    resumo = contas.groupby(grupo[com_id]).agg(
+        n_deb=('deb', 'nunique'), deb=('deb', 'first'), n_cred=('cred', 'nunique'), cred=('cred', 'first'))
+    _, primeiras = np.unique(grupo[com_id], return_index=True)
+    if 'Historico' in df.columns:
+        historicos = df['Historico'].to_numpy()[np.flatnonzero(com_id)[primeiras]]
+    else:
+        historicos = [''] * len(resumo)
+    estorno = pd.Series(historicos, index=resumo.index).map(contem_estorno).astype(bool)
+
+    # Processar apenas se tem 1 débito e 1 crédito, e débito = crédito
+    conta_deb = resumo['deb'].map(normalizar_conta)
+    conta_cred = resumo['cred'].map(normalizar_conta)
+    elegivel = ((resumo['n_deb'] == 1) & (resumo['n_cred'] == 1)
+                & conta_deb.notna() & conta_cred.notna() & (conta_deb == conta_cred))
+
+    # Primeira regra que casar com cada lançamento
+    regra_do_grupo = pd.Series(-1, index=resumo.index)
+    for i, regra in enumerate(regras):
+        casa = elegivel & (regra_do_grupo < 0) & (conta_deb == regra['conta'])
+        if regra.get('estorno') is not None:
+            casa &= estorno == regra['estorno']
+        regra_do_grupo[casa] = i
+    regra_da_linha = np.full(len(df), -1)
+    regra_da_linha[com_id] = regra_do_grupo.to_numpy()[grupo[com_id]]
+
+    avisar = contagens is None
+    if contagens is None:
+        contagens = {}
+    contagens.setdefault('excluidos', 0)
+    contagens.setdefault('regras_excluir', [])
+    contagens.setdefault('ajustados', 0)
+    linhas_excluir = np.zeros(len(df), dtype=bool)
+    for i, regra in enumerate(regras):
+        n_grupos = int((regra_do_grupo == i).sum())
+        if n_grupos == 0:
+            continue
+        linhas = regra_da_linha == i
+        if regra['acao'] == 'excluir':
+            linhas_excluir |= linhas
+            contagens['excluidos'] += n_grupos
+            if regra not in contagens['regras_excluir']:
+                contagens['regras_excluir'].append(regra)
+        else:
+            # Altera só as linhas do lado ajustado (ex.: linha de débito para conta 302)
+            lado = regra['lado']
+            nome_col = 'NomeContaD' if lado == 'Deb' else 'NomeContaC'
+            alvo = linhas & df[f'Reduz{lado}'].notna().to_numpy()
+            df.loc[alvo, f'Reduz{lado}'] = regra['nova_conta']
+            df.loc[alvo, nome_col] = regra['novo_nome']
+            contagens['ajustados'] += n_grupos
 
-        # Processar apenas se tem 1 débito e 1 crédito
-        if len(reduz_deb_vals) == 1 and len(reduz_cred_vals) == 1:
-            conta_deb = normalizar_conta(reduz_deb_vals[0])
-            conta_cred = normalizar_conta(reduz_cred_vals[0])
+    # Excluir lançamentos marcados
+    if linhas_excluir.any():
+        df = df[~linhas_excluir]
 
-            # Só processar se débito = crédito
-            if conta_deb is not None and conta_cred is not None and conta_deb == conta_cred:
-                historico = grupo['Historico'].iloc[0] if 'Historico' in grupo.columns else ''
+    if avisar:
+        _avisar_lancamentos_tratados(contagens)
 
-                # REGRA 3: Conta 395 + 'estorno' no histórico = EXCLUIR
-                if conta_deb == 395 and contem_estorno(historico):
-                    ids_para_excluir.append(id_lanc)
-                    continue
+    return df
 
-                # REGRA 1: Conta 8 em débito e crédito -> débito 302, crédito 8
-                elif conta_deb == 8:
-                    # Alterar linha de débito para conta 302
-                    for idx in grupo_idx:
-                        if pd.notna(df.loc[idx, 'ReduzDeb']):
-                            df.loc[idx, 'ReduzDeb'] = 302
-                            df.loc[idx, 'NomeContaD'] = 'CAIXA GERAL'
-                    registros_modificados += 1
-
-                # REGRA 2: Conta 395 em débito e crédito (sem estorno) -> débito 395, crédito 70
-                elif conta_deb == 395:
-                    # Alterar linha de crédito para conta 70
-                    for idx in grupo_idx:
-                        if pd.notna(df.loc[idx, 'ReduzCred']):
-                            df.loc[idx, 'ReduzCred'] = 70
-                            df.loc[idx, 'NomeContaC'] = 'AJUSTE CONTABIL'
-                    registros_modificados += 1
 
-    # Excluir lançamentos marcados
-    if ids_para_excluir:
-        df = df[~df['ID Lancamento'].isin(ids_para_excluir)]
-        st.info(f"🗑️ {len(ids_para_excluir)} lançamentos de estorno (conta 395 deb/cred) foram excluídos automaticamente.")
+# Mapeamento dos nomes de coluna do extrato contábil (após title-case e sem espaços)
+MAPA_COLUNAS_CONTABIL = {
+    'Data': 'Data Lançamento',
+    'Idlancamento': 'ID Lancamento',
+    'Descricao': 'Historico',
+    'Reduzdeb': 'ReduzDeb',
+    'Nomecontad': 'NomeContaD',
+    'Reduzcred': 'ReduzCred',
+    'Nomecontac': 'NomeContaC'
+}
 
-    if registros_modificados > 0:
-        st.info(f"✏️ {registros_modificados} lançamentos com débito=crédito na mesma conta foram ajustados automaticamente.")
+# Colunas do CSV lidas como texto: a inferência de tipo (por arquivo ou por bloco) mudaria os valores
+COLUNAS_CONTABIL_TEXTO = ('Data Lançamento', 'Valor', 'ReduzDeb', 'ReduzCred', 'ID Lancamento')
 
-    return df
 
+def _nome_coluna_contabil(col):
+    """Nome padronizado de uma coluna do extrato contábil."""
+    col = str(col).strip().title().replace(' ', '')
+    return MAPA_COLUNAS_CONTABIL.get(col, col)
 
-@st.cache_data(show_spinner="Lendo Extrato Contábil...")
-def ler_extrato_contabil(uploaded_file):
-    """Lê o arquivo Excel/CSV do extrato contábil e retorna um DataFrame padronizado."""
-    file_extension = uploaded_file.name.split('.')[-1].lower()
 
-    try:
-        if file_extension in ['xlsx', 'xls']:
-            df = pd.read_excel(uploaded_file, engine='openpyxl')
-        elif file_extension == 'csv':
-            uploaded_file.seek(0)
-            try:
-                df = pd.read_csv(uploaded_file, sep=';', encoding='latin1', on_bad_lines='skip')
-            except Exception:
-                uploaded_file.seek(0)
-                df = pd.read_csv(uploaded_file, sep=',', encoding='utf-8', on_bad_lines='skip')
-        else:
-            st.error("Formato de arquivo contábil não suportado. Use .xlsx, .xls ou .csv.")
-            return pd.DataFrame()
+def _converter_valores_contabil(serie):
+    """
+    Valores do extrato contábil em float. Textos com vírgula ('1.500,00') ou só com pontos de
+    milhar ('1.500') seguem o formato brasileiro; os demais ('1500.00') são lidos como estão.
+    Decide por valor, não pelo tipo da coluna, para dar o mesmo resultado lendo em lotes.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return pd.to_numeric(serie, errors='coerce')
+    texto = serie.astype(object).where(serie.notna()).astype(str).str.strip()
+    brasileiro = (texto.str.contains(',', regex=False) | texto.str.fullmatch(r'[+-]?\d{1,3}(\.\d{3})+')).fillna(False)
+    texto = texto.where(~brasileiro, texto.str.replace('.', '', regex=False)).str.replace(',', '.', regex=False)
+    return pd.to_numeric(texto, errors='coerce')
 
-    except Exception as e:
-        st.error(f"Erro na leitura do arquivo contábil: {e}")
-        return pd.DataFrame()
 
-    df.columns = [str(col).strip().title().replace(' ', '') for col in df.columns]
+def _colunas_texto_csv_contabil(uploaded_file, sep, encoding):
+    """dtype do read_csv: as colunas de COLUNAS_CONTABIL_TEXTO do cabeçalho do arquivo como texto."""
+    uploaded_file.seek(0)
+    cabecalho = pd.read_csv(uploaded_file, sep=sep, encoding=encoding, nrows=0).columns
+    uploaded_file.seek(0)
+    return {col: str for col in cabecalho if _nome_coluna_contabil(col) in COLUNAS_CONTABIL_TEXTO}
+
 
-    # Mapeamento e criação das colunas necessárias
-    df.rename(columns={
-        'Data': 'Data Lançamento',
-        'Idlancamento': 'ID Lancamento',
-        'Descricao': 'Historico',
-        'Reduzdeb': 'ReduzDeb',
-        'Nomecontad': 'NomeContaD',
-        'Reduzcred': 'ReduzCred',
-        'Nomecontac': 'NomeContaC'
-    }, inplace=True)
+def _padronizar_colunas_contabil(df):
+    """Padroniza os nomes das colunas do extrato contábil; retorna None (com mensagem) se faltar alguma obrigatória."""
+    df.columns = [_nome_coluna_contabil(col) for col in df.columns]
 
     colunas_necessarias = ['Data Lançamento', 'Valor', 'Historico', 'ReduzDeb', 'NomeContaD', 'ReduzCred', 'NomeContaC']
     if not all(col in df.columns for col in colunas_necessarias):
         st.error(f"Colunas obrigatórias não encontradas no arquivo contábil. Esperadas: {colunas_necessarias}")
         st.info(f"Colunas encontradas após o processamento: {list(df.columns)}")
-        return pd.DataFrame()
+        return None
+    return df
 
-    if 'Historico' in df.columns:
-        def strip_accents(text):
-            if not isinstance(text, str):
-                return ""
-            return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
 
-        historico_normalized = df['Historico'].astype(str).str.strip().str.lower().apply(strip_accents)
+def _normalizar_extrato_contabil(df, contagens=None):
+    """Tipo de lançamento, datas, valores e tratamento de lançamentos problemáticos (colunas já padronizadas)."""
+    if 'Historico' in df.columns:
+        historico_normalized = remover_acentos_serie(df['Historico'].astype(str).str.strip().str.lower())
 
         cond1 = historico_normalized.str.startswith('lancamento')
         cond2 = historico_normalized.str.startswith('estorno da contabilizacao do lancamento')
 
         df['Tipo Lancamento'] = np.where(cond1 | cond2, 'Inclusão', 'Baixa')
 
-    df['Data Lançamento'] = df['Data Lançamento'].apply(lambda x: safe_parse_date(x, date.today()))
+    df['Data Lançamento'] = converter_datas(df['Data Lançamento'], date.today())
 
-    if df['Valor'].dtype == 'object':
-        df['Valor'] = df['Valor'].str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
-    df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
+    df['Valor'] = _converter_valores_contabil(df['Valor'])
+
+    # Contas lidas como texto: numéricas quando todas forem números (as regras gravam códigos inteiros)
+    for col in ('ReduzDeb', 'ReduzCred'):
+        if pd.api.types.is_string_dtype(df[col]):
+            numeros = pd.to_numeric(df[col], errors='coerce')
+            df[col] = numeros if numeros.notna().sum() == df[col].notna().sum() else df[col].astype(object)
 
     df.dropna(subset=['Data Lançamento', 'Valor'], inplace=True)
 
@@ -657,7 +921,7 @@ def ler_extrato_contabil(uploaded_file):
     # TRATAMENTO DE LANÇAMENTOS PROBLEMÁTICOS
     # Aplica regras para corrigir débito = crédito na mesma conta
     # =====================================================
-    df = tratar_lancamentos_problematicos(df)
+    df = tratar_lancamentos_problematicos(df, contagens=contagens)
 
     # Gera um ID único para o lote de importação (não usado como chave primária)
     # df['ID Lancamento'] = range(1, len(df) + 1)
@@ -665,6 +929,150 @@ def ler_extrato_contabil(uploaded_file):
     return df
 
 
+@st.cache_data(show_spinner="Lendo Extrato Contábil...")
+def ler_extrato_contabil(uploaded_file):
+    """Lê o arquivo Excel/CSV do extrato contábil e retorna um DataFrame padronizado."""
+    file_extension = uploaded_file.name.split('.')[-1].lower()
+
+    try:
+        if file_extension in ['xlsx', 'xls']:
+            df = pd.read_excel(uploaded_file, engine='openpyxl')
+        elif file_extension == 'csv':
+            try:
+                df = pd.read_csv(uploaded_file, sep=';', encoding='latin1', on_bad_lines='skip',
+                                 dtype=_colunas_texto_csv_contabil(uploaded_file, ';', 'latin1'))
+            except Exception:
+                df = pd.read_csv(uploaded_file, sep=',', encoding='utf-8', on_bad_lines='skip',
+                                 dtype=_colunas_texto_csv_contabil(uploaded_file, ',', 'utf-8'))
+        else:
+            st.error("Formato de arquivo contábil não suportado. Use .xlsx, .xls ou .csv.")
+            return pd.DataFrame()
+
+    except Exception as e:
+        st.error(f"Erro na leitura do arquivo contábil: {e}")
+        return pd.DataFrame()
+
+    df = _padronizar_colunas_contabil(df)
+    if df is None:
+        return pd.DataFrame()
+
+    return _normalizar_extrato_contabil(df)
+
+
+# Importação em lotes do extrato contábil (arquivos grandes, ex.: exportação anual do ERP)
+# - LOTE_EXTRATO_CONTABIL: linhas por lote
+# - LIMITE_EXTRATO_CONTABIL_MB: a partir deste tamanho de arquivo a tela sugere a importação em lotes
+LOTE_EXTRATO_CONTABIL = int(os.environ.get('LOTE_EXTRATO_CONTABIL', '50000'))
+LIMITE_EXTRATO_CONTABIL_MB = float(os.environ.get('LIMITE_EXTRATO_CONTABIL_MB', '20'))
+
+
+def _blocos_csv_contabil(uploaded_file, tamanho_lote):
+    """Blocos crus do CSV (pd.read_csv com chunksize) e a fração lida: ';' em latin1, ou ',' em utf-8 se o primeiro falhar."""
+    tamanho_arquivo = len(uploaded_file.getvalue())
+    for sep, encoding in ((';', 'latin1'), (',', 'utf-8')):
+        try:
+            texto = _colunas_texto_csv_contabil(uploaded_file, sep, encoding)
+            leitor = pd.read_csv(uploaded_file, sep=sep, encoding=encoding, on_bad_lines='skip',
+                                 chunksize=tamanho_lote, dtype=texto)
+            primeiro = next(leitor, None)
+        except Exception:
+            if sep == ',':
+                raise
+            continue
+        if primeiro is None:
+            return
+        yield primeiro, min(uploaded_file.tell() / tamanho_arquivo, 1.0) if tamanho_arquivo else None
+        for bloco in leitor:
+            yield bloco, min(uploaded_file.tell() / tamanho_arquivo, 1.0) if tamanho_arquivo else None
+        return
+
+
+def _blocos_xlsx_contabil(uploaded_file, tamanho_lote):
+    """Blocos crus da primeira planilha, lida em streaming (openpyxl read_only) com a 1ª linha como cabeçalho."""
+    uploaded_file.seek(0)
+    planilha = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        aba = planilha.worksheets[0]
+        total = aba.max_row  # Dimensão declarada no arquivo (pode faltar)
+        linhas = aba.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        colunas = [f"Unnamed: {i}" if col is None else col for i, col in enumerate(cabecalho)]
+        bloco = []
+        lidas = 1
+        for linha in linhas:
+            lidas += 1
+            if not any(valor is not None for valor in linha):
+                continue  # Linhas vazias (read_excel também as descarta)
+            bloco.append(linha)
+            if len(bloco) >= tamanho_lote:
+                yield pd.DataFrame(bloco, columns=colunas), min(lidas / total, 1.0) if total else None
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=colunas), 1.0
+    finally:
+        planilha.close()
+
+
+def _blocos_xls_contabil(uploaded_file, tamanho_lote):
+    """Formato antigo não tem leitura em streaming: lê inteiro e só o processamento é em lotes."""
+    uploaded_file.seek(0)
+    df = pd.read_excel(uploaded_file, engine='openpyxl')
+    for inicio in range(0, len(df), tamanho_lote):
+        yield df.iloc[inicio:inicio + tamanho_lote].copy(), min((inicio + tamanho_lote) / len(df), 1.0)
+
+
+def ler_extrato_contabil_em_lotes(uploaded_file, tamanho_lote=None):
+    """
+    Lê o extrato contábil em lotes de até tamanho_lote linhas (CSV por chunksize, xlsx em streaming),
+    padronizando e tratando cada lote como ler_extrato_contabil, sem carregar o arquivo inteiro.
+    Gera DataFrames; df.attrs['progresso'] traz a fração aproximada do arquivo já lida (ou None).
+    As linhas do último 'ID Lancamento' de um lote seguem para o próximo, para que as regras de
+    lançamentos problemáticos vejam o lançamento completo (o arquivo deve vir agrupado por ID).
+    Um erro de leitura no meio do arquivo é propagado: quem grava os lotes decide o que informar.
+    """
+    tamanho_lote = tamanho_lote or LOTE_EXTRATO_CONTABIL
+    leitores = {'csv': _blocos_csv_contabil, 'xlsx': _blocos_xlsx_contabil, 'xls': _blocos_xls_contabil}
+    file_extension = uploaded_file.name.split('.')[-1].lower()
+    if file_extension not in leitores:
+        st.error("Formato de arquivo contábil não suportado. Use .xlsx, .xls ou .csv.")
+        return
+
+    contagens = {}
+    pendente = None
+    progresso = None
+    for bloco, progresso in leitores[file_extension](uploaded_file, tamanho_lote):
+        df = _padronizar_colunas_contabil(bloco)
+        if df is None:
+            return
+        if pendente is not None:
+            df = pd.concat([pendente, df], ignore_index=True)
+            pendente = None
+
+        # Lançamento que pode continuar no próximo bloco fica pendente
+        if 'ID Lancamento' in df.columns and len(df) and pd.notna(df['ID Lancamento'].iloc[-1]):
+            continua = (df['ID Lancamento'] == df['ID Lancamento'].iloc[-1]).to_numpy()
+            pendente = df[continua].reset_index(drop=True)
+            if continua.all():
+                continue
+            df = df[~continua].reset_index(drop=True)
+
+        df = _normalizar_extrato_contabil(df, contagens)
+        if not df.empty:
+            df.attrs['progresso'] = progresso
+            yield df
+
+    if pendente is not None:
+        df = _normalizar_extrato_contabil(pendente, contagens)
+        if not df.empty:
+            df.attrs['progresso'] = 1.0 if progresso is not None else None
+            yield df
+
+    if contagens:
+        _avisar_lancamentos_tratados(contagens)
+
+
 # ==============================================================================
 # 3. FUNÇÃO DE CARREGAMENTO DO CADASTRO DE CONTAS (FINALIZADO COM MAPA DE ÍNDICE E SEM CABEÇALHO)
 # ==============================================================================
@@ -718,15 +1126,15 @@ def ler_cadastro_contas(uploaded_file):
 
     # Formata Codigo_Banco e Agencia com zeros à esquerda
     if 'Codigo_Banco' in df.columns:
-        df['Codigo_Banco'] = df['Codigo_Banco'].apply(lambda x: re.sub(r'\D', '', str(x)).zfill(3))
+        df['Codigo_Banco'] = somente_digitos_serie(df['Codigo_Banco']).str.zfill(3)
     if 'Agencia' in df.columns:
-        df['Agencia'] = df['Agencia'].apply(lambda x: re.sub(r'\D', '', str(x)).zfill(4))
+        df['Agencia'] = somente_digitos_serie(df['Agencia']).str.zfill(4)
 
-    # Cria a chave combinada e aplica a normalização centralizada
-    df['Agencia_Normalizada'] = df['Agencia'].apply(lambda x: normalizar_numero(x).zfill(4))
-    df['Conta_Cadastro_Preenchida'] = df['Conta'].apply(lambda x: normalizar_numero(x, is_conta_cadastro=True))
+    # Cria a chave combinada e aplica a normalização centralizada (operações por coluna)
+    df['Agencia_Normalizada'] = normalizar_numero_serie(df['Agencia']).str.zfill(4)
+    df['Conta_Cadastro_Preenchida'] = normalizar_numero_serie(df['Conta'], is_conta_cadastro=True)
     chave_bruta = df['Agencia_Normalizada'].astype(str) + df['Conta_Cadastro_Preenchida'].astype(str)
-    df['Conta_OFX_Normalizada'] = chave_bruta.apply(normalizar_chave_ofx)
+    df['Conta_OFX_Normalizada'] = normalizar_chave_ofx_serie(chave_bruta)
 
 
     if 'Conta Contábil' in df.columns:
@@ -1129,16 +1537,26 @@ def _format_valor_brasileiro(valor_str):
     except (ValueError, TypeError):
         return 0.0
 
+def _abrir_pdf(file_bytes, pdf=None):
+    """Context manager do documento: o já aberto (fechado por quem abriu) ou um novo a partir dos bytes."""
+    if pdf is not None:
+        return nullcontext(pdf)
+    return pdfplumber.open(BytesIO(file_bytes))
+
 @st.cache_data(show_spinner="Processando arquivo PDF...")
-def importar_extrato_pdf_sicredi(file_bytes, file_name):
-    """Lê um extrato de conta do Sicredi em PDF e retorna um DataFrame padronizado."""
+def importar_extrato_pdf_sicredi(file_bytes, file_name, _pdf=None):
+    """
+    Lê um extrato de conta do Sicredi em PDF e retorna um DataFrame padronizado.
+    _pdf: documento pdfplumber já aberto (evita reabrir o arquivo; fora da chave do cache).
+    """
     transactions = []
+    documentos = []  # Nº do documento de cada transação (compõe o ID)
     agencia = None
     conta = None
     banco_identificador = '748' # Sicredi
 
     try:
-        with pdfplumber.open(BytesIO(file_bytes)) as pdf:
+        with _abrir_pdf(file_bytes, _pdf) as pdf:
             # Extrair agência e conta da primeira página
             page_one_text = pdf.pages[0].extract_text()
             
@@ -1175,39 +1593,34 @@ def importar_extrato_pdf_sicredi(file_bytes, file_name):
                     if not data_str or not valor_str:
                         continue
 
-                    data_lancamento = safe_parse_date(data_str, date.today())
+                    # Data convertida em lote (normalizar_extrato_importado)
                     valor = _format_valor_brasileiro(valor_str)
-                    
-                    # Gerar ID de transação único
-                    id_transacao_str = f"{data_lancamento}{desc}{valor}{doc}"
-                    id_transacao = hashlib.md5(id_transacao_str.encode('utf-8')).hexdigest()
-
                     transactions.append({
-                        'Data Lançamento': data_lancamento,
+                        'Data Lançamento': data_str,
                         'Valor': valor,
                         'Descrição': desc,
-                        'ID Transacao': id_transacao,
-                        'Tipo': 'CREDIT' if valor > 0 else 'DEBIT',
                         'Banco_OFX': banco_identificador,
                         'Conta_OFX_Normalizada': conta_normalizada
                     })
+                    documentos.append(doc)
 
         if not transactions:
             st.error(f"Arquivo {file_name}: Nenhuma transação foi processada do PDF.")
             return pd.DataFrame()
 
-        df = pd.DataFrame(transactions)
-        df['Entrada'] = df['Valor'].apply(lambda x: x if x > 0 else 0)
-        df['Saída'] = df['Valor'].apply(lambda x: abs(x) if x < 0 else 0)
-
-        return df
+        # ID de transação único: hash de data + descrição + valor + documento
+        return normalizar_extrato_importado(transactions, campos_id=[
+            'Data Lançamento', [t['Descrição'] for t in transactions], 'Valor', documentos])
 
     except Exception as e:
         st.error(f"Erro crítico ao processar o arquivo PDF ({file_name}): {e}")
         return pd.DataFrame()
 
-def importar_extrato_pdf_santander(file_bytes, file_name):
-    """Lê um extrato de conta do Santander em PDF e retorna um DataFrame padronizado."""
+def importar_extrato_pdf_santander(file_bytes, file_name, _pdf=None):
+    """
+    Lê um extrato de conta do Santander em PDF e retorna um DataFrame padronizado.
+    _pdf: documento pdfplumber já aberto (evita reabrir o arquivo).
+    """
     st.info(f"Iniciando processamento do Santander para o arquivo: {file_name}")
     transactions = []
     banco_identificador = '033'
@@ -1308,7 +1721,7 @@ def importar_extrato_pdf_santander(file_bytes, file_name):
         return -valor_abs if tipo_trans == 'DEBIT' else valor_abs
 
     try:
-        with pdfplumber.open(BytesIO(file_bytes)) as pdf:
+        with _abrir_pdf(file_bytes, _pdf) as pdf:
             # Extrair ano do extrato
             current_year = str(date.today().year)
             try:
@@ -1325,7 +1738,6 @@ def importar_extrato_pdf_santander(file_bytes, file_name):
             active_conta_normalizada = None
             current_trans = None  # Transação que pode continuar entre páginas
             in_movimentacao = False  # Flag global para controlar se está processando movimentação
-            trans_index = 0  # Contador para garantir unicidade dos IDs
 
             for page_num, page in enumerate(pdf.pages):
                 page_text = page.extract_text()
@@ -1339,20 +1751,13 @@ def importar_extrato_pdf_santander(file_bytes, file_name):
                             # Finalizar valor com sinal correto baseado na descrição completa
                             valor_final = _finalizar_valor_transacao(current_trans['descricao'], current_trans['valor_str'])
 
-                            full_date = safe_parse_date(f"{current_trans['data']}/{current_year}", date.today())
-                            id_transacao = hashlib.md5(
-                                f"{full_date}{current_trans['descricao']}{valor_final}{active_conta_normalizada}{trans_index}".encode()
-                            ).hexdigest()
                             transactions.append({
-                                'Data Lançamento': full_date,
+                                'Data Lançamento': f"{current_trans['data']}/{current_year}",
                                 'Valor': valor_final,
                                 'Descrição': current_trans['descricao'],
-                                'ID Transacao': id_transacao,
-                                'Tipo': 'CREDIT' if valor_final > 0 else 'DEBIT',
                                 'Banco_OFX': banco_identificador,
                                 'Conta_OFX_Normalizada': active_conta_normalizada
                             })
-                            trans_index += 1
 
                     # Reset para nova conta
                     current_trans = None
@@ -1493,21 +1898,14 @@ def importar_extrato_pdf_santander(file_bytes, file_name):
                                     # Finalizar valor com sinal correto baseado na descrição completa
                                     valor_final = _finalizar_valor_transacao(current_trans['descricao'], current_trans['valor_str'])
 
-                                    full_date = safe_parse_date(f"{current_trans['data']}/{current_year}", date.today())
-                                    id_transacao = hashlib.md5(
-                                        f"{full_date}{current_trans['descricao']}{valor_final}{active_conta_normalizada}{trans_index}".encode()
-                                    ).hexdigest()
                                     transactions.append({
-                                        'Data Lançamento': full_date,
+                                        'Data Lançamento': f"{current_trans['data']}/{current_year}",
                                         'Valor': valor_final,
                                         'Descrição': current_trans['descricao'],
-                                        'ID Transacao': id_transacao,
-                                        'Tipo': 'CREDIT' if valor_final > 0 else 'DEBIT',
                                         'Banco_OFX': banco_identificador,
                                         'Conta_OFX_Normalizada': active_conta_normalizada
                                     })
-                                    trans_index += 1
-                                    # print(f"[DEBUG] SALVOU COM DATA trans #{trans_index}: {current_trans['data']} | {valor_final}")
+                                    # print(f"[DEBUG] SALVOU COM DATA trans #{len(transactions)}: {current_trans['data']} | {valor_final}")
                                 except Exception as e:
                                     # print(f"[DEBUG] ERRO ao salvar: {e}")
                                     pass
@@ -1563,20 +1961,13 @@ def importar_extrato_pdf_santander(file_bytes, file_name):
                                         # Finalizar valor com sinal correto baseado na descrição completa
                                         valor_final = _finalizar_valor_transacao(current_trans['descricao'], current_trans['valor_str'])
 
-                                        full_date = safe_parse_date(f"{current_trans['data']}/{current_year}", date.today())
-                                        id_transacao = hashlib.md5(
-                                            f"{full_date}{current_trans['descricao']}{valor_final}{active_conta_normalizada}{trans_index}".encode()
-                                        ).hexdigest()
                                         transactions.append({
-                                            'Data Lançamento': full_date,
+                                            'Data Lançamento': f"{current_trans['data']}/{current_year}",
                                             'Valor': valor_final,
                                             'Descrição': current_trans['descricao'],
-                                            'ID Transacao': id_transacao,
-                                            'Tipo': 'CREDIT' if valor_final > 0 else 'DEBIT',
                                             'Banco_OFX': banco_identificador,
                                             'Conta_OFX_Normalizada': active_conta_normalizada
                                         })
-                                        trans_index += 1
                                     current_trans = None
                                 continue
 
@@ -1595,21 +1986,14 @@ def importar_extrato_pdf_santander(file_bytes, file_name):
                                         # Finalizar valor com sinal correto baseado na descrição completa
                                         valor_final = _finalizar_valor_transacao(current_trans['descricao'], current_trans['valor_str'])
 
-                                        full_date = safe_parse_date(f"{current_trans['data']}/{current_year}", date.today())
-                                        id_transacao = hashlib.md5(
-                                            f"{full_date}{current_trans['descricao']}{valor_final}{active_conta_normalizada}{trans_index}".encode()
-                                        ).hexdigest()
                                         transactions.append({
-                                            'Data Lançamento': full_date,
+                                            'Data Lançamento': f"{current_trans['data']}/{current_year}",
                                             'Valor': valor_final,
                                             'Descrição': current_trans['descricao'],
-                                            'ID Transacao': id_transacao,
-                                            'Tipo': 'CREDIT' if valor_final > 0 else 'DEBIT',
                                             'Banco_OFX': banco_identificador,
                                             'Conta_OFX_Normalizada': active_conta_normalizada
                                         })
-                                        trans_index += 1
-                                        # print(f"[DEBUG] SALVOU trans #{trans_index}: {current_trans['data']} | {valor_final}")
+                                        # print(f"[DEBUG] SALVOU trans #{len(transactions)}: {current_trans['data']} | {valor_final}")
 
                                 # Iniciar nova transação na mesma data
                                 current_trans = {'data': current_trans['data'], 'descricao': desc_parte, 'valor_str': valor_str}
@@ -1630,20 +2014,13 @@ def importar_extrato_pdf_santander(file_bytes, file_name):
                     # Finalizar valor com sinal correto baseado na descrição completa
                     valor_final = _finalizar_valor_transacao(current_trans['descricao'], current_trans['valor_str'])
 
-                    full_date = safe_parse_date(f"{current_trans['data']}/{current_year}", date.today())
-                    id_transacao = hashlib.md5(
-                        f"{full_date}{current_trans['descricao']}{valor_final}{active_conta_normalizada}{trans_index}".encode()
-                    ).hexdigest()
                     transactions.append({
-                        'Data Lançamento': full_date,
+                        'Data Lançamento': f"{current_trans['data']}/{current_year}",
                         'Valor': valor_final,
                         'Descrição': current_trans['descricao'],
-                        'ID Transacao': id_transacao,
-                        'Tipo': 'CREDIT' if valor_final > 0 else 'DEBIT',
                         'Banco_OFX': banco_identificador,
                         'Conta_OFX_Normalizada': active_conta_normalizada
                     })
-                    trans_index += 1
 
         if not transactions:
             st.error(f"Nenhuma transação foi extraída do arquivo {file_name}")
@@ -1651,12 +2028,10 @@ def importar_extrato_pdf_santander(file_bytes, file_name):
 
         st.success(f"{len(transactions)} transações do Santander extraídas do arquivo {file_name}")
 
-        df = pd.DataFrame(transactions)
-        df['Entrada'] = df['Valor'].apply(lambda x: x if x > 0 else 0)
-        df['Saída'] = df['Valor'].apply(lambda x: abs(x) if x < 0 else 0)
-        df['Data Processamento'] = df['Data Lançamento']
-
-        return df
+        # Datas em lote; ID único: hash de data + descrição + valor + conta + posição da transação
+        return normalizar_extrato_importado(transactions, campos_id=[
+            'Data Lançamento', [t['Descrição'] for t in transactions], 'Valor',
+            [t['Conta_OFX_Normalizada'] for t in transactions], range(len(transactions))])
 
     except Exception as e:
         st.error(f"Erro crítico ao processar o PDF do Santander: {e}")
@@ -1680,7 +2055,6 @@ def importar_extrato_csv_bradesco(file_bytes, file_name):
     - Linha de Total
     - Linhas de rodapé
     """
-    import hashlib
     from utils import normalizar_chave_ofx
 
     try:
@@ -1825,46 +2199,42 @@ def importar_extrato_csv_bradesco(file_bytes, file_name):
                 valor = 0.0
                 tipo_transacao = 'CREDIT'
 
-            # Converter data
-            try:
-                data_obj = pd.to_datetime(data_str, format='%d/%m/%Y').date()
-            except:
-                continue
-
-            # Criar ID único para a transação (hash de data + descrição + valor + conta)
-            id_str = f"{data_obj}{lancamento}{valor}{conta_ofx}"
-            id_transacao = hashlib.md5(id_str.encode()).hexdigest()
-
-            # Normalizar a conta OFX (remover hífens e espaços)
-            conta_normalizada = normalizar_chave_ofx(conta_ofx)
-
             transactions.append({
-                'Data Lançamento': data_obj,
-                'Data Processamento': data_obj,  # Mesmo valor da data de lançamento
+                'Data Lançamento': data_str,  # Convertida em lote abaixo
                 'Descrição': lancamento,
                 'Valor': valor,
-                'ID Transacao': id_transacao,
                 'Tipo': tipo_transacao,
                 'Banco_OFX': '237',  # Código do Bradesco
-                'Conta_OFX_Normalizada': conta_normalizada,
-                'Arquivo': file_name,
-                'Entrada': credito,
-                'Saída': debito
+                'Arquivo': file_name
             })
 
-        if not transactions:
+        df = pd.DataFrame(transactions)
+        if not df.empty:
+            # Converter datas (as inválidas, ex.: 31/02, são descartadas)
+            df['Data Lançamento'] = pd.to_datetime(df['Data Lançamento'], format='%d/%m/%Y', errors='coerce')
+            df = df.dropna(subset=['Data Lançamento'])
+            df['Data Lançamento'] = df['Data Lançamento'].dt.date
+
+        if df.empty:
             st.warning(f"Nenhuma transação encontrada no arquivo {file_name}")
             return pd.DataFrame()
 
-        df = pd.DataFrame(transactions)
+        # Normalizar a conta OFX (remover hífens e espaços)
+        df['Conta_OFX_Normalizada'] = normalizar_chave_ofx(conta_ofx)
 
-        # Debug: contar créditos e débitos
-        num_creditos = len([t for t in transactions if t['Tipo'] == 'CREDIT'])
-        num_debitos = len([t for t in transactions if t['Tipo'] == 'DEBIT'])
-        total_creditos = sum([t['Valor'] for t in transactions if t['Tipo'] == 'CREDIT'])
-        total_debitos = sum([abs(t['Valor']) for t in transactions if t['Tipo'] == 'DEBIT'])
+        # Criar ID único para a transação (hash de data + descrição + valor + conta)
+        df = normalizar_extrato_importado(df.reset_index(drop=True), campos_id=[
+            'Data Lançamento', 'Descrição', 'Valor', [conta_ofx] * len(df)])
 
-        st.success(f"✅ {len(transactions)} transações importadas do arquivo {file_name}")
+        # Debug: contar créditos e débitos
+        creditos = df['Tipo'] == 'CREDIT'
+        debitos = df['Tipo'] == 'DEBIT'
+        num_creditos = int(creditos.sum())
+        num_debitos = int(debitos.sum())
+        total_creditos = df.loc[creditos, 'Valor'].sum()
+        total_debitos = df.loc[debitos, 'Valor'].abs().sum()
+
+        st.success(f"✅ {len(df)} transações importadas do arquivo {file_name}")
         st.info(f"📊 Créditos: {num_creditos} (R$ {total_creditos:,.2f}) | Débitos: {num_debitos} (R$ {total_debitos:,.2f})")
 
         return df
@@ -2,7 +2,12 @@
 Módulo de conexão com banco de dados.
 Suporta SQLite (local) e PostgreSQL (produção/nuvem).
 """
+import csv
+import io
+import math
 import os
+import threading
+import time
 from contextlib import contextmanager
 
 # Tenta carregar variáveis de ambiente do .env (desenvolvimento local)
@@ -19,12 +24,22 @@ IS_PRODUCTION = DATABASE_URL is not None
 if IS_PRODUCTION:
     import psycopg2
     from psycopg2.extras import RealDictCursor
+    from psycopg2.pool import ThreadedConnectionPool, PoolError
 else:
     import sqlite3
 
 # Nome do arquivo SQLite para desenvolvimento local
 SQLITE_FILE = 'conciliacao_db.sqlite'
 
+# Pool de conexões (variáveis de ambiente):
+# - DB_POOL_MIN / DB_POOL_MAX: conexões mantidas abertas / limite de conexões simultâneas (PostgreSQL)
+# - DB_POOL_TIMEOUT: segundos de espera por uma conexão livre antes de falhar
+# - DB_POOL_PING_SEGUNDOS: conexões ociosas há mais tempo que isso são testadas (SELECT 1) antes do uso
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_PING_SEGUNDOS = float(os.environ.get('DB_POOL_PING_SEGUNDOS', '30'))
+
 # Engine SQLAlchemy (para pandas.to_sql)
 _sqlalchemy_engine = None
 
@@ -38,7 +53,12 @@ def get_sqlalchemy_engine():
             url = DATABASE_URL
             if url.startswith('postgres://'):
                 url = url.replace('postgres://', 'postgresql://', 1)
-            _sqlalchemy_engine = create_engine(url)
+            # Mesmos limites do pool do psycopg2, com teste da conexão antes do uso
+            pool_size = max(DB_POOL_MIN, 1)
+            _sqlalchemy_engine = create_engine(
+                url, pool_size=pool_size, max_overflow=max(DB_POOL_MAX - pool_size, 0),
+                pool_timeout=DB_POOL_TIMEOUT, pool_pre_ping=True
+            )
         else:
             _sqlalchemy_engine = create_engine(f'sqlite:///{SQLITE_FILE}')
     return _sqlalchemy_engine
@@ -130,7 +150,7 @@ class AdaptedConnection:
 
 
 def get_connection():
-    """Retorna uma conexão com o banco de dados apropriado."""
+    """Retorna uma conexão nova (fora do pool) com o banco de dados apropriado."""
     if IS_PRODUCTION:
         # PostgreSQL na nuvem
         url = DATABASE_URL
@@ -142,15 +162,307 @@ def get_connection():
         return sqlite3.connect(SQLITE_FILE)
 
 
+class _PoolConexoes:
+    """
+    Base dos pools: contabiliza checkouts, espera e descartes. obter() entrega uma conexão pronta
+    e devolver() desfaz o que não foi confirmado (como o close() fazia) e a devolve ao pool.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metricas = {'checkouts': 0, 'espera_total_s': 0.0, 'espera_max_s': 0.0,
+                          'criadas': 0, 'descartadas': 0, 'timeouts': 0}
+
+    def _registrar_checkout(self, espera: float):
+        with self._lock:
+            self._metricas['checkouts'] += 1
+            self._metricas['espera_total_s'] += espera
+            self._metricas['espera_max_s'] = max(self._metricas['espera_max_s'], espera)
+
+    def _contar(self, chave: str):
+        with self._lock:
+            self._metricas[chave] += 1
+
+    def metricas(self) -> dict:
+        with self._lock:
+            metricas = dict(self._metricas)
+        checkouts = metricas['checkouts']
+        metricas['espera_media_s'] = metricas['espera_total_s'] / checkouts if checkouts else 0.0
+        return metricas
+
+
+class _PoolPostgres(_PoolConexoes):
+    """ThreadedConnectionPool com limite de espera, teste de conexões ociosas e métricas."""
+    def __init__(self, url: str, minimo: int, maximo: int, timeout: float, ping_segundos: float):
+        super().__init__()
+        self._url = url
+        self._minimo = minimo
+        self._maximo = maximo
+        self._timeout = timeout
+        self._ping_segundos = ping_segundos
+        self._pool = None
+        self._vagas = threading.BoundedSemaphore(maximo)
+        self._ultimo_uso = {}
+        self._em_uso = 0
+        self._ociosas = 0
+
+    def _garantir_pool(self):
+        with self._lock:
+            if self._pool is None or self._pool.closed:
+                self._pool = ThreadedConnectionPool(self._minimo, self._maximo, self._url)
+                self._metricas['criadas'] += self._minimo
+                self._ociosas = self._minimo
+            return self._pool
+
+    def _retirar_ociosa(self) -> bool:
+        """Desconta uma conexão ociosa antes do getconn(); True se o pool vai abrir uma nova."""
+        with self._lock:
+            if self._ociosas == 0:
+                self._metricas['criadas'] += 1
+                return True
+            self._ociosas -= 1
+            return False
+
+    def _conexao_valida(self, conn) -> bool:
+        if conn.closed:
+            return False
+        ultimo_uso = self._ultimo_uso.get(id(conn))
+        if ultimo_uso is None or time.monotonic() - ultimo_uso < self._ping_segundos:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def obter(self):
+        inicio = time.perf_counter()
+        # O semáforo faz a espera que o ThreadedConnectionPool não faz (ele falha na hora quando esgotado)
+        if not self._vagas.acquire(timeout=self._timeout):
+            self._contar('timeouts')
+            raise PoolError(f"Nenhuma conexão livre no pool após {self._timeout:g}s (DB_POOL_MAX={self._maximo}).")
+        try:
+            pool = self._garantir_pool()
+            self._retirar_ociosa()
+            conn = pool.getconn()
+            if not self._conexao_valida(conn):
+                self._contar('descartadas')
+                pool.putconn(conn, close=True)
+                self._retirar_ociosa()
+                conn = pool.getconn()
+        except Exception:
+            self._vagas.release()
+            raise
+        with self._lock:
+            self._em_uso += 1
+        self._registrar_checkout(time.perf_counter() - inicio)
+        return conn
+
+    def devolver(self, conn):
+        descartar = bool(conn.closed)
+        if not descartar:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                descartar = True
+        if descartar:
+            self._contar('descartadas')
+        self._ultimo_uso[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=descartar)
+        except PoolError:
+            # Pool fechado por fechar() enquanto a conexão estava em uso
+            conn.close()
+        else:
+            # Como o putconn(): guarda até `minimo` conexões ociosas e fecha as demais
+            with self._lock:
+                if not descartar and self._ociosas < self._minimo:
+                    self._ociosas += 1
+        finally:
+            with self._lock:
+                self._em_uso -= 1
+            self._vagas.release()
+
+    def fechar(self):
+        with self._lock:
+            if self._pool is not None and not self._pool.closed:
+                self._pool.closeall()
+            self._ociosas = 0
+            self._ultimo_uso.clear()
+
+    def metricas(self) -> dict:
+        metricas = super().metricas()
+        pool = self._pool
+        with self._lock:
+            metricas.update({
+                'backend': 'postgresql', 'minimo': self._minimo, 'maximo': self._maximo,
+                'abertas': 0 if pool is None or pool.closed else self._ociosas + self._em_uso,
+                'em_uso': self._em_uso,
+            })
+        return metricas
+
+
+class _PoolSQLite(_PoolConexoes):
+    """
+    Uma conexão SQLite reaproveitada por thread. Uso aninhado na mesma thread (uma função de banco
+    chamando outra dentro do with) recebe uma conexão temporária, para não misturar transações.
+    """
+    def __init__(self, arquivo: str, ping_segundos: float):
+        super().__init__()
+        self._arquivo = arquivo
+        self._ping_segundos = ping_segundos
+        self._local = threading.local()
+        self._conexoes = {}
+        self._geracao = 0
+        self._em_uso = 0
+
+    def _conectar(self):
+        self._contar('criadas')
+        # check_same_thread=False só para permitir que fechar() encerre conexões de outras threads
+        return sqlite3.connect(self._arquivo, check_same_thread=False)
+
+    def _conexao_valida(self, conn) -> bool:
+        if time.monotonic() - getattr(self._local, 'ultimo_uso', 0.0) < self._ping_segundos:
+            return True
+        try:
+            conn.execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def obter(self):
+        inicio = time.perf_counter()
+        local = self._local
+        if getattr(local, 'em_uso', False):
+            conn = self._conectar()
+            temporaria = True
+        else:
+            temporaria = False
+            conn = getattr(local, 'conn', None)
+            if conn is not None and (local.geracao != self._geracao or not self._conexao_valida(conn)):
+                self._contar('descartadas')
+                self._descartar(conn)
+                conn = None
+            if conn is None:
+                conn = self._conectar()
+                local.conn, local.geracao = conn, self._geracao
+                with self._lock:
+                    self._conexoes[threading.get_ident()] = conn
+                    self._remover_threads_encerradas()
+            local.em_uso = True
+        with self._lock:
+            self._em_uso += 1
+        self._registrar_checkout(time.perf_counter() - inicio)
+        return conn, temporaria
+
+    def devolver(self, conn, temporaria: bool):
+        with self._lock:
+            self._em_uso -= 1
+        if temporaria:
+            conn.close()
+            return
+        local = self._local
+        local.em_uso = False
+        local.ultimo_uso = time.monotonic()
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            local.conn = None
+            self._descartar(conn)
+            return
+        if local.geracao != self._geracao:
+            local.conn = None
+            self._descartar(conn)
+
+    def _descartar(self, conn):
+        with self._lock:
+            for ident, registrada in list(self._conexoes.items()):
+                if registrada is conn:
+                    del self._conexoes[ident]
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _remover_threads_encerradas(self):
+        vivas = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in self._conexoes if i not in vivas]:
+            try:
+                self._conexoes.pop(ident).close()
+            except sqlite3.Error:
+                pass
+
+    def fechar(self):
+        """Fecha as conexões de todas as threads (ex.: antes de apagar o arquivo do banco)."""
+        with self._lock:
+            self._geracao += 1
+            conexoes = list(self._conexoes.values())
+            self._conexoes.clear()
+        for conn in conexoes:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def metricas(self) -> dict:
+        metricas = super().metricas()
+        with self._lock:
+            metricas.update({'backend': 'sqlite', 'abertas': len(self._conexoes), 'em_uso': self._em_uso})
+        return metricas
+
+
+_pool_conexoes = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool():
+    """Cria (uma vez por processo) o pool de conexões do banco atual."""
+    global _pool_conexoes
+    if _pool_conexoes is None:
+        with _pool_lock:
+            if _pool_conexoes is None:
+                if IS_PRODUCTION:
+                    url = DATABASE_URL
+                    if url.startswith('postgres://'):
+                        url = url.replace('postgres://', 'postgresql://', 1)
+                    _pool_conexoes = _PoolPostgres(url, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_PING_SEGUNDOS)
+                else:
+                    _pool_conexoes = _PoolSQLite(SQLITE_FILE, DB_POOL_PING_SEGUNDOS)
+    return _pool_conexoes
+
+
+def metricas_pool() -> dict:
+    """Métricas do pool: checkouts, espera (total/média/máxima), conexões abertas, em uso, criadas e descartadas."""
+    return _obter_pool().metricas()
+
+
+def fechar_conexoes():
+    """Fecha todas as conexões do pool e da engine SQLAlchemy (necessário antes de apagar o arquivo SQLite)."""
+    global _sqlalchemy_engine
+    _obter_pool().fechar()
+    if _sqlalchemy_engine is not None:
+        _sqlalchemy_engine.dispose()
+        _sqlalchemy_engine = None
+
+
 @contextmanager
 def get_db_connection():
-    """Context manager para conexão com o banco (com adaptação automática de queries)."""
-    conn = get_connection()
-    adapted = AdaptedConnection(conn)
-    try:
-        yield adapted
-    finally:
-        conn.close()
+    """Context manager para conexão com o banco (com adaptação automática de queries), servida pelo pool."""
+    pool = _obter_pool()
+    if IS_PRODUCTION:
+        conn = pool.obter()
+        try:
+            yield AdaptedConnection(conn)
+        finally:
+            pool.devolver(conn)
+    else:
+        conn, temporaria = pool.obter()
+        try:
+            yield AdaptedConnection(conn)
+        finally:
+            pool.devolver(conn, temporaria)
 
 
 def execute_query(query, params=None, fetch=False, fetchone=False, commit=True):
@@ -178,6 +490,159 @@ def execute_query(query, params=None, fetch=False, fetchone=False, commit=True):
         return result
 
 
+# Marcador de nulo no CSV enviado ao COPY (o vazio fica para o texto vazio)
+NULO_COPY = '\\N'
+
+
+def _valor_copy(valor):
+    """Valor de uma célula no CSV do COPY (None/NaN viram NULO_COPY)."""
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return NULO_COPY
+    return valor
+
+
+def _copiar_para_temporaria(cursor, tabela: str, colunas: list, linhas: list) -> str:
+    """PostgreSQL: cria uma tabela temporária com as colunas de tabela e a carrega via COPY (CSV)."""
+    lista_colunas = ', '.join(colunas)
+    temporaria = f"_lote_{tabela}"
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for linha in linhas:
+        escritor.writerow([_valor_copy(valor) for valor in linha])
+    buffer.seek(0)
+
+    cursor.execute(f"DROP TABLE IF EXISTS {temporaria}")
+    cursor.execute(f"CREATE TEMP TABLE {temporaria} AS SELECT {lista_colunas} FROM {tabela} WITH NO DATA")
+    cursor.copy_expert(
+        f"COPY {temporaria} ({lista_colunas}) FROM STDIN WITH (FORMAT csv, NULL '{NULO_COPY}')", buffer
+    )
+    return temporaria
+
+
+def _metricas_lote(chave: str, linhas: list, afetadas: int, inicio: float) -> dict:
+    """Métricas de uma carga em lote (chave é o nome da contagem: inseridas/atualizadas)."""
+    segundos = time.perf_counter() - inicio
+    return {
+        'linhas': len(linhas),
+        chave: afetadas,
+        'segundos': segundos,
+        'linhas_por_segundo': len(linhas) / segundos if segundos > 0 else float(len(linhas)),
+    }
+
+
+def inserir_em_lote(conn, tabela: str, colunas, linhas, chave_conflito: str = None) -> dict:
+    """
+    Insere linhas (tuplas na ordem de colunas) em lote, na transação corrente de conn (sem commit).
+    - PostgreSQL: COPY ... FROM STDIN (CSV) para uma tabela temporária e um único
+      INSERT ... SELECT na tabela final (ON CONFLICT (chave_conflito) DO NOTHING, se informada).
+    - SQLite: um executemany preparado (INSERT OR IGNORE, se houver chave_conflito).
+    Retorna métricas: linhas, inseridas, segundos e linhas_por_segundo.
+    """
+    colunas = list(colunas)
+    linhas = list(linhas)
+    lista_colunas = ', '.join(colunas)
+    raw = conn.get_raw_connection() if hasattr(conn, 'get_raw_connection') else conn
+    inicio = time.perf_counter()
+
+    if not linhas:
+        inseridas = 0
+    elif IS_PRODUCTION:
+        cursor = raw.cursor()
+        temporaria = _copiar_para_temporaria(cursor, tabela, colunas, linhas)
+        conflito = f" ON CONFLICT ({chave_conflito}) DO NOTHING" if chave_conflito else ''
+        cursor.execute(f"INSERT INTO {tabela} ({lista_colunas}) SELECT {lista_colunas} FROM {temporaria}{conflito}")
+        inseridas = cursor.rowcount
+        cursor.execute(f"DROP TABLE {temporaria}")
+    else:
+        comando = 'INSERT OR IGNORE' if chave_conflito else 'INSERT'
+        placeholders = ', '.join(['?'] * len(colunas))
+        antes = raw.total_changes
+        raw.cursor().executemany(f"{comando} INTO {tabela} ({lista_colunas}) VALUES ({placeholders})", linhas)
+        inseridas = raw.total_changes - antes
+
+    return _metricas_lote('inseridas', linhas, inseridas, inicio)
+
+
+def atualizar_em_lote(conn, tabela: str, colunas, linhas, chave: str = 'id') -> dict:
+    """
+    Atualiza linhas (tuplas na ordem de colunas, incluindo a coluna chave) em lote, na
+    transação corrente de conn (sem commit). As demais colunas são gravadas onde chave coincide.
+    - PostgreSQL: COPY para uma tabela temporária e um único UPDATE ... FROM.
+    - SQLite: um executemany preparado (UPDATE ... WHERE chave = ?).
+    Retorna métricas: linhas, atualizadas, segundos e linhas_por_segundo.
+    """
+    colunas = list(colunas)
+    linhas = list(linhas)
+    if chave not in colunas:
+        raise ValueError(f"A coluna chave '{chave}' deve estar entre as colunas do lote.")
+    alteradas = [col for col in colunas if col != chave]
+    raw = conn.get_raw_connection() if hasattr(conn, 'get_raw_connection') else conn
+    inicio = time.perf_counter()
+
+    if not linhas or not alteradas:
+        atualizadas = 0
+    elif IS_PRODUCTION:
+        cursor = raw.cursor()
+        temporaria = _copiar_para_temporaria(cursor, tabela, colunas, linhas)
+        atribuicoes = ', '.join(f"{col} = l.{col}" for col in alteradas)
+        cursor.execute(f"UPDATE {tabela} AS t SET {atribuicoes} FROM {temporaria} AS l WHERE t.{chave} = l.{chave}")
+        atualizadas = cursor.rowcount
+        cursor.execute(f"DROP TABLE {temporaria}")
+    else:
+        atribuicoes = ', '.join(f"{col} = ?" for col in alteradas)
+        posicao_chave = colunas.index(chave)
+        parametros = [
+            tuple(v for i, v in enumerate(linha) if i != posicao_chave) + (linha[posicao_chave],)
+            for linha in linhas
+        ]
+        antes = raw.total_changes
+        raw.cursor().executemany(f"UPDATE {tabela} SET {atribuicoes} WHERE {chave} = ?", parametros)
+        atualizadas = raw.total_changes - antes
+
+    return _metricas_lote('atualizadas', linhas, atualizadas, inicio)
+
+
+def upsert_em_lote(conn, tabela: str, colunas, linhas, chaves) -> dict:
+    """
+    Insere ou atualiza linhas (tuplas na ordem de colunas) pela chave única chaves, em lote,
+    na transação corrente de conn (sem commit). A tabela precisa de um índice único em chaves.
+    - PostgreSQL: COPY para uma tabela temporária e um único INSERT ... ON CONFLICT DO UPDATE.
+    - SQLite: um executemany preparado (INSERT ... ON CONFLICT DO UPDATE).
+    Retorna métricas: linhas, gravadas, segundos e linhas_por_segundo.
+    """
+    colunas = list(colunas)
+    linhas = list(linhas)
+    chaves = [chaves] if isinstance(chaves, str) else list(chaves)
+    lista_colunas = ', '.join(colunas)
+    lista_chaves = ', '.join(chaves)
+    alteradas = [col for col in colunas if col not in chaves]
+    acao = ('DO UPDATE SET ' + ', '.join(f"{col} = excluded.{col}" for col in alteradas)) if alteradas else 'DO NOTHING'
+    raw = conn.get_raw_connection() if hasattr(conn, 'get_raw_connection') else conn
+    inicio = time.perf_counter()
+
+    if not linhas:
+        gravadas = 0
+    elif IS_PRODUCTION:
+        cursor = raw.cursor()
+        temporaria = _copiar_para_temporaria(cursor, tabela, colunas, linhas)
+        cursor.execute(
+            f"INSERT INTO {tabela} ({lista_colunas}) SELECT {lista_colunas} FROM {temporaria} "
+            f"ON CONFLICT ({lista_chaves}) {acao}"
+        )
+        gravadas = cursor.rowcount
+        cursor.execute(f"DROP TABLE {temporaria}")
+    else:
+        placeholders = ', '.join(['?'] * len(colunas))
+        antes = raw.total_changes
+        raw.cursor().executemany(
+            f"INSERT INTO {tabela} ({lista_colunas}) VALUES ({placeholders}) ON CONFLICT ({lista_chaves}) {acao}",
+            linhas
+        )
+        gravadas = raw.total_changes - antes
+
+    return _metricas_lote('gravadas', linhas, gravadas, inicio)
+
+
 def adapt_schema_for_postgres(schema_sql):
     """
     Adapta SQL de criação de schema do SQLite para PostgreSQL.
@@ -0,0 +1,84 @@
+"""
+Acesso assíncrono ao banco de dados.
+Executa as funções de acesso (db_manager) em threads, com asyncio, sobre o mesmo pool de
+conexões de database.py: consultas independentes (por exemplo, uma por conta bancária)
+rodam ao mesmo tempo e o tempo total fica limitado pela consulta mais lenta.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import DB_POOL_MAX
+
+# Streamlit: as threads de trabalho herdam o contexto da execução (cache, spinners, mensagens)
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
+# Consultas simultâneas (variável de ambiente DB_CONSULTAS_CONCORRENTES). No PostgreSQL cada
+# consulta ocupa uma conexão do pool; no SQLite cada thread mantém a sua conexão.
+DB_CONSULTAS_CONCORRENTES = int(os.environ.get('DB_CONSULTAS_CONCORRENTES', str(DB_POOL_MAX)))
+
+# Executor fixo: as threads (e as conexões SQLite por thread) são reaproveitadas entre execuções
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obter_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(DB_CONSULTAS_CONCORRENTES, 1),
+                                           thread_name_prefix='db_async')
+        return _executor
+
+
+def _com_contexto(funcao):
+    """Envolve funcao para rodar em outra thread com o contexto Streamlit da thread atual."""
+    contexto = get_script_run_ctx() if get_script_run_ctx else None
+    if contexto is None:
+        return funcao
+
+    def executar(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), contexto)
+        return funcao(*args, **kwargs)
+    return executar
+
+
+async def executar(funcao, *args, **kwargs):
+    """Executa uma função de acesso ao banco (síncrona) em uma thread do executor, sem bloquear o loop."""
+    loop = asyncio.get_running_loop()
+    funcao = _com_contexto(funcao)
+    return await loop.run_in_executor(_obter_executor(), lambda: funcao(*args, **kwargs))
+
+
+async def reunir(chamadas: dict) -> dict:
+    """
+    Executa ao mesmo tempo as chamadas {chave: função sem argumentos} e retorna {chave: resultado}.
+    Se alguma falhar, a exceção é propagada depois que todas terminarem.
+    """
+    chaves = list(chamadas)
+    resultados = await asyncio.gather(*(executar(chamadas[chave]) for chave in chaves), return_exceptions=True)
+    for resultado in resultados:
+        if isinstance(resultado, BaseException):
+            raise resultado
+    return dict(zip(chaves, resultados))
+
+
+def executar_concorrente(chamadas: dict) -> dict:
+    """
+    Versão síncrona de reunir (para o Streamlit e a CLI). Ex.:
+        executar_concorrente({conta: partial(carregar_extrato_bancario_historico, conta, ini, fim) for conta in contas})
+    """
+    if not chamadas:
+        return {}
+    chamadas = {chave: _com_contexto(funcao) for chave, funcao in chamadas.items()}
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(reunir(chamadas))
+    # Já existe um loop nesta thread (ex.: notebook): roda o gather em outra thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, reunir(chamadas)).result()
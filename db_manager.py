@@ -1,7 +1,10 @@
 import sqlite3
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import json
+import re
+import time
 import numpy as np
 import streamlit as st
 from contextlib import contextmanager
@@ -10,7 +13,8 @@ from contextlib import contextmanager
 from database import (
     get_db_connection, IS_PRODUCTION, get_placeholder,
     execute_query, adapt_schema_for_postgres, get_connection,
-    get_sqlalchemy_engine, adapt_query
+    get_sqlalchemy_engine, adapt_query, fechar_conexoes, inserir_em_lote, atualizar_em_lote,
+    upsert_em_lote
 )
 
 # O nome do arquivo do banco de dados SQLite (usado apenas localmente)
@@ -38,6 +42,10 @@ PARCELAMENTOS_TABLE = 'parcelamentos'
 PARCELAMENTO_DEBITOS_TABLE = 'parcelamento_debitos'
 PARCELAMENTO_PARCELAS_TABLE = 'parcelamento_parcelas'
 PARCELAMENTO_PAGAMENTOS_TABLE = 'parcelamento_pagamentos'
+CONCILIACOES_TABLE = 'conciliacoes_extrato_contabil'
+PASSAGENS_CONCILIACAO_TABLE = 'passagens_conciliacao'
+SCHEMA_VERSION_TABLE = 'schema_version'
+SALDOS_DIARIOS_TABLE = 'saldos_diarios'
 
 # Mapeamento centralizado de colunas (inclui versoes minusculas para PostgreSQL)
 CADASTRO_COLS_DB_TO_DF = {
@@ -398,6 +406,38 @@ def init_db():
             except Exception:
                 conn.rollback()  # Coluna já existe
 
+        # Tabela de estado da conciliação (pares extrato x contábil já conciliados)
+        # Os hashes guardam a "impressão digital" das linhas no momento do match,
+        # permitindo detectar linhas editadas desde a última execução.
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {CONCILIACOES_TABLE} (
+                id_unico TEXT NOT NULL,
+                id_contabil INTEGER NOT NULL,
+                passagem TEXT,
+                hash_extrato TEXT,
+                hash_contabil TEXT,
+                data_contabil TEXT,
+                data_conciliacao TEXT,
+                PRIMARY KEY (id_unico, id_contabil)
+            )
+        ''')
+        conn.commit()
+
+        # Configuração das passagens de conciliação (conta_contabil vazia = padrão da empresa)
+        # parametros: JSON com tolerance, date_tolerance_days e os parâmetros específicos do tipo
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {PASSAGENS_CONCILIACAO_TABLE} (
+                id {AUTO_INCREMENT},
+                conta_contabil TEXT,
+                ordem INTEGER NOT NULL,
+                nome TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                parametros TEXT,
+                ativo INTEGER DEFAULT 1
+            )
+        ''')
+        conn.commit()
+
         # Renomear tipo_conta para tipo para compatibilidade
         try:
             c.execute(f"ALTER TABLE {PLANO_CONTAS_TABLE} RENAME COLUMN tipo_conta TO tipo")
@@ -407,6 +447,131 @@ def init_db():
 
         conn.commit()
 
+        # Alterações de schema posteriores ao esquema base acima
+        aplicar_migracoes(conn)
+
+
+# ==============================================================================
+# MIGRAÇÕES DE SCHEMA
+# ==============================================================================
+# Cada migração: (versão, descrição, passos). Um passo é um comando SQL ou uma função
+# que recebe o cursor. Os passos precisam ser idempotentes (IF NOT EXISTS etc.), pois um
+# banco antigo pode já ter parte do schema. As versões aplicadas ficam em SCHEMA_VERSION_TABLE;
+# novas alterações de schema entram aqui, sempre com versão maior que a última.
+MIGRACOES = [
+    (1, "Índice do extrato por conta e data (carregar_extrato_bancario_historico)", [
+        f"CREATE INDEX IF NOT EXISTS idx_extrato_conta_data ON {EXTRATO_BANCARIO_TABLE} (Conta_OFX_Normalizada, Data_Lancamento)",
+        f"CREATE INDEX IF NOT EXISTS idx_extrato_data ON {EXTRATO_BANCARIO_TABLE} (Data_Lancamento)",
+    ]),
+    (2, "Índices dos lançamentos contábeis por conta de débito/crédito, data e idlancamento", [
+        f"CREATE INDEX IF NOT EXISTS idx_lancamentos_deb_data ON {LANCAMENTOS_CONTABEIS_TABLE} (reduz_deb, data_lancamento)",
+        f"CREATE INDEX IF NOT EXISTS idx_lancamentos_cred_data ON {LANCAMENTOS_CONTABEIS_TABLE} (reduz_cred, data_lancamento)",
+        f"CREATE INDEX IF NOT EXISTS idx_lancamentos_data ON {LANCAMENTOS_CONTABEIS_TABLE} (data_lancamento)",
+        f"CREATE INDEX IF NOT EXISTS idx_lancamentos_idlancamento ON {LANCAMENTOS_CONTABEIS_TABLE} (idlancamento)",
+    ]),
+    (3, "Índice do estado da conciliação por lançamento contábil", [
+        f"CREATE INDEX IF NOT EXISTS idx_conciliacoes_id_contabil ON {CONCILIACOES_TABLE} (id_contabil)",
+    ]),
+    (4, "Códigos reduzidos e idlancamento dos lançamentos sem '.0' e sem espaços (filtro por conta no banco)", [
+        f"UPDATE {LANCAMENTOS_CONTABEIS_TABLE} SET reduz_deb = TRIM(reduz_deb) WHERE reduz_deb <> TRIM(reduz_deb)",
+        f"UPDATE {LANCAMENTOS_CONTABEIS_TABLE} SET reduz_cred = TRIM(reduz_cred) WHERE reduz_cred <> TRIM(reduz_cred)",
+        lambda c: _remover_sufixo_zero_codigos(c),
+    ]),
+    (5, "Saldos diários materializados por conta (extrato e contábil)", [
+        f'''
+            CREATE TABLE IF NOT EXISTS {SALDOS_DIARIOS_TABLE} (
+                origem TEXT NOT NULL,
+                conta TEXT NOT NULL,
+                data DATE NOT NULL,
+                movimento REAL NOT NULL,
+                saldo_acumulado REAL NOT NULL,
+                PRIMARY KEY (origem, conta, data)
+            )
+        ''',
+        lambda c: _reconstruir_saldos_diarios(c, ORIGENS_SALDOS_DIARIOS),
+    ]),
+    (6, "Chaves únicas do cadastro de contas e do plano de contas (gravação por upsert)", [
+        lambda c: _garantir_chave_unica(c, CADASTRO_CONTAS_TABLE, ['Codigo_Banco', 'Conta_OFX_Normalizada']),
+        lambda c: _garantir_chave_unica(c, PLANO_CONTAS_TABLE, ['codigo']),
+    ]),
+    (7, "Saldos diários contábeis recalculados (débito e crédito na mesma conta contam uma vez)", [
+        lambda c: _reconstruir_saldos_diarios(c, ('contabil',)),
+    ]),
+]
+
+
+def _remover_sufixo_zero_codigos(c):
+    """Tira o sufixo '.0', '.00'... dos códigos reduzidos e do idlancamento, com o mesmo padrão de normalizar_codigos_conta."""
+    if not IS_PRODUCTION:
+        # SQLite não tem regexp_replace: registra um equivalente na conexão da migração
+        c.connection.create_function(
+            'regexp_replace', 3, lambda texto, padrao, novo: texto if texto is None else re.sub(padrao, novo, texto)
+        )
+    for coluna in ('reduz_deb', 'reduz_cred', 'idlancamento'):
+        c.execute(f"UPDATE {LANCAMENTOS_CONTABEIS_TABLE} SET {coluna} = regexp_replace({coluna}, '\\.0+$', '') "
+                  f"WHERE {coluna} LIKE '%.%0'")
+
+
+def _garantir_chave_unica(c, tabela: str, chaves: list):
+    """Remove linhas repetidas na chave (fica a última gravada) e cria o índice único usado pelos upserts."""
+    lista_chaves = ', '.join(chaves)
+    if IS_PRODUCTION:
+        iguais = ' AND '.join(f"a.{col} IS NOT DISTINCT FROM b.{col}" for col in chaves)
+        c.execute(f"DELETE FROM {tabela} a USING {tabela} b WHERE {iguais} AND a.ctid < b.ctid")
+    else:
+        c.execute(f"DELETE FROM {tabela} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {tabela} GROUP BY {lista_chaves})")
+    c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{tabela}_chave ON {tabela} ({lista_chaves})")
+
+
+def versoes_aplicadas(conn) -> set:
+    """Versões de migração já registradas no banco."""
+    c = conn.cursor()
+    c.execute(f"SELECT versao FROM {SCHEMA_VERSION_TABLE}")
+    return {int(row[0]) for row in c.fetchall()}
+
+
+def aplicar_migracoes(conn, migracoes: list = None) -> list:
+    """
+    Aplica, em ordem e cada uma em sua transação, as migrações ainda não registradas.
+    Retorna as versões aplicadas nesta chamada. Se outro processo registrar a mesma versão
+    ao mesmo tempo, a migração é considerada aplicada; qualquer outro erro é propagado.
+    """
+    migracoes = MIGRACOES if migracoes is None else migracoes
+    c = conn.cursor()
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT,
+            aplicada_em TEXT
+        )
+    ''')
+    conn.commit()
+
+    aplicadas = versoes_aplicadas(conn)
+    novas = []
+    for versao, descricao, passos in sorted(migracoes, key=lambda m: m[0]):
+        if versao in aplicadas:
+            continue
+        try:
+            for passo in passos:
+                if callable(passo):
+                    passo(c)
+                else:
+                    c.execute(passo)
+            c.execute(
+                f"INSERT INTO {SCHEMA_VERSION_TABLE} (versao, descricao, aplicada_em) VALUES ({PH}, {PH}, {PH})",
+                (versao, descricao, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            conn.commit()
+            novas.append(versao)
+            print(f"DEBUG: migração {versao} aplicada: {descricao}")
+        except Exception:
+            conn.rollback()
+            if versao in versoes_aplicadas(conn):
+                continue  # Aplicada em paralelo por outro processo
+            raise
+    return novas
+
 
 # ==============================================================================
 # FUNÇÕES DE CADASTRO DE CONTAS BANCÁRIAS
@@ -419,7 +584,9 @@ def carregar_cadastro_contas() -> pd.DataFrame:
         with get_db_connection() as conn:
             # Query simples sem GROUP BY (PostgreSQL nao suporta GROUP BY parcial)
             query = f"SELECT DISTINCT * FROM {CADASTRO_CONTAS_TABLE} ORDER BY agencia, conta"
-            df = pd.read_sql_query(query, _get_raw_conn(conn), dtype={'data_inicial_saldo': str, 'codigo_banco': str})
+            # SQLite preserva a caixa dos nomes das colunas; PostgreSQL retorna minusculas
+            colunas_texto = ('data_inicial_saldo', 'codigo_banco') if IS_PRODUCTION else ('Data_Inicial_Saldo', 'Codigo_Banco')
+            df = pd.read_sql_query(query, _get_raw_conn(conn), dtype={c: str for c in colunas_texto})
             # Normaliza nomes das colunas (PostgreSQL retorna minusculas)
             df.rename(columns=CADASTRO_COLS_DB_TO_DF, inplace=True)
     except Exception as e:
@@ -433,49 +600,122 @@ def carregar_cadastro_contas() -> pd.DataFrame:
 
     return df
 
-def salvar_cadastro_contas(df: pd.DataFrame):
-    """Salva o DataFrame de cadastro no BD, usando uma estratégia de DELETE + APPEND."""
-    db_cols = ['Agencia', 'Conta', 'Conta_OFX_Normalizada', 'Conta_Contabil', 'Conta_Contabil_Negativo', 'Saldo_Inicial', 'Data_Inicial_Saldo', 'Codigo_Banco', 'Path_Logo']
+def _valor_sql(valor):
+    """Valor de uma célula como parâmetro SQL (nulos viram None, escalares numpy viram Python)."""
+    if valor is None or (not isinstance(valor, (list, tuple)) and pd.isna(valor)):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return str(valor)
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
 
-    # Usa SQLAlchemy engine para to_sql
-    engine = get_sqlalchemy_engine()
 
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        # Limpa a tabela antes de inserir novos dados
-        c.execute(f"DELETE FROM {CADASTRO_CONTAS_TABLE}")
-        conn.commit()
+def _valor_comparavel(valor):
+    """Forma canônica de um valor para comparar o DataFrame com o que está no banco."""
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    if isinstance(valor, bool):
+        return str(int(valor))
+    if isinstance(valor, (int, float)):
+        return str(float(valor))
+    return str(valor)
 
-        if df.empty:
-            st.warning(f"Tabela '{CADASTRO_CONTAS_TABLE}' foi limpa, pois o DataFrame fornecido esta vazio.")
-            return
 
-        if 'Conta_OFX_Normalizada' in df.columns:
-            df_final = df.copy()
-            df_final.rename(columns=CADASTRO_COLS_DF_TO_DB, inplace=True)
+def _nulos_como_none(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas object com None em todos os nulos (DataFrame.map reinfere o tipo e volta None para NaN)."""
+    df = df.astype(object)
+    return df.where(df.notna(), None)
 
-            for col in db_cols:
-                if col not in df_final.columns:
-                    df_final[col] = None
 
-            if 'Saldo_Inicial' in df_final.columns:
-                df_final['Saldo_Inicial'] = df_final['Saldo_Inicial'].astype(str).str.replace(',', '.', regex=False)
-                df_final['Saldo_Inicial'] = pd.to_numeric(df_final['Saldo_Inicial'], errors='coerce').fillna(0.0)
-            if 'Data_Inicial_Saldo' in df_final.columns:
-                df_final['Data_Inicial_Saldo'] = df_final['Data_Inicial_Saldo'].astype(object)
+def _chave_texto(df: pd.DataFrame, chaves: list) -> pd.Series:
+    """Chave composta como texto (nulos distintos do texto vazio), para comparar linhas entre DataFrames."""
+    chave = pd.Series('', index=df.index, dtype=object)
+    for i, col in enumerate(chaves):
+        chave = chave + ('\x1f' if i else '') + df[col].map(lambda v: '\x00' if v is None else v).astype(object)
+    return chave
 
-            df_final = df_final[db_cols]
-            df_final.drop_duplicates(subset=['Codigo_Banco', 'Conta_OFX_Normalizada'], keep='last', inplace=True)
 
-            # PostgreSQL usa nomes de colunas em minusculas
-            if IS_PRODUCTION:
-                df_final.columns = [col.lower() for col in df_final.columns]
+def _sincronizar_tabela(conn, tabela: str, df: pd.DataFrame, chaves: list) -> dict:
+    """
+    Grava df como o novo conteúdo de tabela, na transação corrente de conn (sem commit),
+    escrevendo só o que mudou: chaves ausentes de df são excluídas e linhas novas ou
+    alteradas vão em um único upsert_em_lote. Retorna {'gravadas': n, 'excluidas': m}.
+    """
+    c = conn.cursor()
+    colunas = list(df.columns)
+    c.execute(f"SELECT {', '.join(colunas)} FROM {tabela}")
+    df_atual = pd.DataFrame(c.fetchall(), columns=colunas)
+
+    novo = _nulos_como_none(df.drop_duplicates(subset=chaves, keep='last').map(_valor_sql))
+    comparavel_novo = _nulos_como_none(novo.map(_valor_comparavel))
+    comparavel_atual = _nulos_como_none(_nulos_como_none(df_atual.map(_valor_sql)).map(_valor_comparavel))
+    chave_novo = _chave_texto(comparavel_novo, chaves)
+    chave_atual = _chave_texto(comparavel_atual, chaves)
+
+    comparavel_atual = comparavel_atual.set_index(chave_atual)
+    comparavel_atual = comparavel_atual[~comparavel_atual.index.duplicated(keep='last')]
+    existente = chave_novo.isin(comparavel_atual.index).values
+    anterior = comparavel_atual.reindex(chave_novo[existente].values)
+    mudou = pd.Series(True, index=novo.index)
+    mudou[existente] = (comparavel_novo[existente].values != anterior.values).any(axis=1)
+    alteradas = novo[mudou]
+
+    # Chaves com nulo não disparam o ON CONFLICT: a linha antiga é excluída antes do upsert
+    chave_nula = alteradas[chaves].isna().any(axis=1)
+    excluir = list(chave_atual[~chave_atual.isin(chave_novo)].drop_duplicates())
+    excluir += list(chave_novo[mudou & existente & chave_nula.reindex(novo.index, fill_value=False)])
+    if excluir:
+        operador = 'IS NOT DISTINCT FROM' if IS_PRODUCTION else 'IS'
+        condicao = ' AND '.join(f"{col} {operador} ?" for col in chaves)
+        valores = _nulos_como_none(df_atual[chaves].map(_valor_sql))
+        chaves_excluir = set(excluir)
+        linhas_excluir = valores[chave_atual.isin(chaves_excluir).values].drop_duplicates()
+        c.executemany(f"DELETE FROM {tabela} WHERE {condicao}", list(linhas_excluir.itertuples(index=False, name=None)))
+
+    metricas = upsert_em_lote(conn, tabela, colunas, alteradas.itertuples(index=False, name=None), chaves)
+    return {'gravadas': metricas['gravadas'], 'excluidas': len(set(excluir))}
 
-            # Anexa o dataframe limpo e processado (usa SQLAlchemy engine)
-            df_final.to_sql(CADASTRO_CONTAS_TABLE, engine, if_exists='append', index=False)
-            st.success("Cadastro salvo no banco de dados.")
-        else:
-            st.error("Erro: DataFrame de cadastro nao possui a coluna 'Conta_OFX_Normalizada'.")
+
+def salvar_cadastro_contas(df: pd.DataFrame):
+    """
+    Salva o DataFrame de cadastro no BD por upsert na chave (Codigo_Banco, Conta_OFX_Normalizada):
+    só as contas novas ou alteradas são gravadas e as que saíram do DataFrame são excluídas,
+    tudo em uma única transação.
+    """
+    db_cols = ['Agencia', 'Conta', 'Conta_OFX_Normalizada', 'Conta_Contabil', 'Conta_Contabil_Negativo', 'Saldo_Inicial', 'Data_Inicial_Saldo', 'Codigo_Banco', 'Path_Logo']
+
+    if not df.empty and 'Conta_OFX_Normalizada' not in df.columns:
+        st.error("Erro: DataFrame de cadastro nao possui a coluna 'Conta_OFX_Normalizada'.")
+        return
+
+    df_final = df.copy()
+    df_final.rename(columns=CADASTRO_COLS_DF_TO_DB, inplace=True)
+    for col in db_cols:
+        if col not in df_final.columns:
+            df_final[col] = None
+
+    if not df_final.empty:
+        df_final['Saldo_Inicial'] = df_final['Saldo_Inicial'].astype(str).str.replace(',', '.', regex=False)
+        df_final['Saldo_Inicial'] = pd.to_numeric(df_final['Saldo_Inicial'], errors='coerce').fillna(0.0)
+        df_final['Data_Inicial_Saldo'] = df_final['Data_Inicial_Saldo'].astype(object)
+    df_final = df_final[db_cols]
+
+    with get_db_connection() as conn:
+        try:
+            resultado = _sincronizar_tabela(conn, CADASTRO_CONTAS_TABLE, df_final, ['Codigo_Banco', 'Conta_OFX_Normalizada'])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            st.error(f"Erro ao salvar o cadastro de contas: {e}")
+            return
+
+    carregar_cadastro_contas.clear()
+    if df.empty:
+        st.warning(f"Tabela '{CADASTRO_CONTAS_TABLE}' foi limpa, pois o DataFrame fornecido esta vazio.")
+    else:
+        st.success(f"Cadastro salvo no banco de dados ({resultado['gravadas']} gravada(s), {resultado['excluidas']} excluida(s)).")
+    return resultado
 
 def salvar_contas_ofx_faltantes(df_ofx: pd.DataFrame, df_cadastro_atual: pd.DataFrame, df_bancos: pd.DataFrame):
     """
@@ -574,14 +814,27 @@ def carregar_plano_contas() -> pd.DataFrame:
         return pd.DataFrame()
 
 def salvar_plano_contas(df: pd.DataFrame):
-    """Salva o DataFrame do plano de contas no banco de dados."""
-    engine = get_sqlalchemy_engine()
-    df_save = df.copy()
-    # PostgreSQL usa nomes de colunas em minusculas
-    if IS_PRODUCTION:
-        df_save.columns = [col.lower() for col in df_save.columns]
-    df_save.to_sql(PLANO_CONTAS_TABLE, engine, if_exists='replace', index=False)
+    """
+    Salva o DataFrame do plano de contas no banco de dados por upsert na chave codigo:
+    só as contas novas ou alteradas são gravadas e as que saíram do DataFrame são excluídas,
+    tudo em uma única transação. Colunas que não existem na tabela são ignoradas.
+    """
+    with get_db_connection() as conn:
+        try:
+            c = conn.cursor()
+            c.execute(f"SELECT * FROM {PLANO_CONTAS_TABLE} LIMIT 0")
+            colunas_tabela = {desc[0].lower(): desc[0] for desc in c.description}
+            df_save = df.rename(columns={col: colunas_tabela.get(str(col).lower(), col) for col in df.columns})
+            df_save = df_save[[col for col in df_save.columns if str(col).lower() in colunas_tabela]]
+            df_save = df_save.dropna(subset=['codigo'])
+            resultado = _sincronizar_tabela(conn, PLANO_CONTAS_TABLE, df_save, ['codigo'])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            st.error(f"Erro ao salvar o plano de contas: {e}")
+            return
     carregar_plano_contas.clear()
+    return resultado
 
 def excluir_conta_plano(codigo: str) -> bool:
     """Exclui uma conta do plano de contas pelo código."""
@@ -681,8 +934,20 @@ def buscar_conta_plano(codigo: str) -> dict:
 # ==============================================================================
 # FUNÇÕES DE LANÇAMENTOS CONTÁBEIS
 # ==============================================================================
-def salvar_lancamentos_contabeis(df: pd.DataFrame):
-    """Salva o DataFrame de lançamentos contabeis no BD."""
+def _contas_datas_lancamentos(c, coluna: str, valores) -> tuple:
+    """Contas (débito e crédito) e datas das linhas selecionadas, para atualizar os saldos diários."""
+    valores = list(valores)
+    if not valores:
+        return [], []
+    c.execute(
+        f"SELECT reduz_deb, reduz_cred, data_lancamento FROM {LANCAMENTOS_CONTABEIS_TABLE} "
+        f"WHERE {coluna} IN ({', '.join([PH] * len(valores))})", valores
+    )
+    linhas = c.fetchall()
+    return [l[0] for l in linhas] + [l[1] for l in linhas], [l[2] for l in linhas] * 2
+
+def _preparar_lancamentos_contabeis(df: pd.DataFrame) -> pd.DataFrame:
+    """DataFrame do extrato contábil no formato da tabela (colunas, códigos de conta e datas normalizados)."""
     cols_map = {
         'Data Lançamento': 'data_lancamento',
         'Historico': 'historico',
@@ -704,50 +969,235 @@ def salvar_lancamentos_contabeis(df: pd.DataFrame):
         else:
             df_save[db_col] = None  # Adiciona a coluna com nulos se nao existir
 
-    engine = get_sqlalchemy_engine()
-    df_save.to_sql(LANCAMENTOS_CONTABEIS_TABLE, engine, if_exists='append', index=False)
+    df_save['reduz_deb'] = normalizar_codigos_conta(df_save['reduz_deb'])
+    df_save['reduz_cred'] = normalizar_codigos_conta(df_save['reduz_cred'])
+    # Mesmo texto do idlancamento qualquer que seja o tipo inferido na leitura (101, 101.0, '101')
+    df_save['idlancamento'] = normalizar_codigos_conta(df_save['idlancamento'])
+    df_save['data_lancamento'] = pd.to_datetime(df_save['data_lancamento'], errors='coerce').dt.strftime('%Y-%m-%d')
+    return df_save
+
+
+def _gravar_lancamentos_contabeis(conn, df_save: pd.DataFrame, saldos: bool = True) -> dict:
+    """
+    Carga em lote (COPY no PostgreSQL) na transação corrente de conn (sem commit) e, com saldos,
+    a atualização dos saldos diários das contas gravadas.
+    """
+    linhas = [tuple(row) for row in df_save.astype(object).where(df_save.notna(), None).values]
+    metricas = inserir_em_lote(conn, LANCAMENTOS_CONTABEIS_TABLE, df_save.columns, linhas)
+    if saldos:
+        atualizar_saldos_diarios(
+            conn.cursor(), 'contabil',
+            list(df_save['reduz_deb']) + list(df_save['reduz_cred']), list(df_save['data_lancamento']) * 2
+        )
+    return metricas
+
+
+def _menor_data_por_conta(df_save: pd.DataFrame, desde_por_conta: dict) -> None:
+    """Acumula em desde_por_conta a menor data_lancamento de cada conta (débito ou crédito) de df_save."""
+    tocadas = pd.DataFrame({
+        'conta': pd.concat([df_save['reduz_deb'], df_save['reduz_cred']], ignore_index=True),
+        'data': pd.concat([df_save['data_lancamento']] * 2, ignore_index=True),
+    }).dropna()
+    for conta, data in tocadas.groupby('conta')['data'].min().items():
+        desde_por_conta[conta] = min(data, desde_por_conta.get(conta, data))
+
+
+def salvar_lancamentos_contabeis(df: pd.DataFrame):
+    """Salva o DataFrame de lançamentos contabeis no BD. Retorna as métricas da carga (inserir_em_lote)."""
+    df_save = _preparar_lancamentos_contabeis(df)
+
+    with get_db_connection() as conn:
+        try:
+            metricas = _gravar_lancamentos_contabeis(conn, df_save)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
     carregar_lancamentos_contabeis.clear()
+    carregar_lancamentos.clear()
+    return metricas
+
+
+def _idlancamentos_existentes(c, idlancamentos, id_maximo) -> set:
+    """idlancamento (texto) dentre os informados que já estavam na tabela até o id id_maximo."""
+    valores = pd.Series(idlancamentos).dropna().astype(str).unique().tolist()
+    if not valores or not id_maximo:
+        return set()
+    existentes = set()
+    for inicio in range(0, len(valores), 500):
+        parte = valores[inicio:inicio + 500]
+        c.execute(
+            f"SELECT DISTINCT idlancamento FROM {LANCAMENTOS_CONTABEIS_TABLE} "
+            f"WHERE id <= {PH} AND idlancamento IN ({', '.join([PH] * len(parte))})", [id_maximo] + parte
+        )
+        existentes.update(str(linha[0]) for linha in c.fetchall())
+    return existentes
 
-def salvar_lancamentos_editados(df_editado: pd.DataFrame):
-    """Atualiza os lançamentos contábeis no banco de dados a partir de um DataFrame editado."""
-    if df_editado.empty:
-        return
+
+def salvar_lancamentos_contabeis_em_lotes(lotes, ao_gravar=None) -> dict:
+    """
+    Salva os lançamentos contábeis lote a lote (iterável de DataFrames), cada lote em sua própria
+    transação: a memória fica limitada ao tamanho do lote. Lançamentos (idlancamento) que já estavam
+    no BD antes da carga são ignorados, então reenviar o arquivo após uma falha retoma de onde parou.
+    ao_gravar(df_lote, metricas) é chamado após cada lote, com as métricas acumuladas.
+    Os saldos diários são atualizados uma vez, no fim (também após uma falha, para os lotes já
+    gravados); se essa atualização falhar, reconstruir_saldos_diarios() os refaz.
+    Retorna as métricas: lotes, linhas, inseridas, ignoradas, segundos e linhas_por_segundo.
+    """
+    metricas = {'lotes': 0, 'linhas': 0, 'inseridas': 0, 'ignoradas': 0, 'segundos': 0.0, 'linhas_por_segundo': 0.0}
+    inicio = time.perf_counter()
+    desde_por_conta = {}
 
     with get_db_connection() as conn:
         c = conn.cursor()
-        for _, row in df_editado.iterrows():
+        c.execute(f"SELECT COALESCE(MAX(id), 0) FROM {LANCAMENTOS_CONTABEIS_TABLE}")
+        id_inicial = c.fetchone()[0]
+        try:
+            for df_lote in lotes:
+                df_save = _preparar_lancamentos_contabeis(df_lote)
+
+                # Deduplicação: lançamentos gravados antes desta carga não são inseridos de novo
+                existentes = _idlancamentos_existentes(c, df_save['idlancamento'], id_inicial)
+                if existentes:
+                    repetidos = (df_save['idlancamento'].notna() & df_save['idlancamento'].astype(str).isin(existentes)).to_numpy()
+                    df_save = df_save[~repetidos]
+                    metricas['ignoradas'] += int(repetidos.sum())
+
+                metricas_lote = _gravar_lancamentos_contabeis(conn, df_save, saldos=False)
+                conn.commit()
+                _menor_data_por_conta(df_save, desde_por_conta)
+
+                metricas['lotes'] += 1
+                metricas['linhas'] += len(df_lote)
+                metricas['inseridas'] += metricas_lote['inseridas']
+                metricas['segundos'] = time.perf_counter() - inicio
+                metricas['linhas_por_segundo'] = metricas['linhas'] / metricas['segundos'] if metricas['segundos'] > 0 else float(metricas['linhas'])
+                if ao_gravar is not None:
+                    ao_gravar(df_lote, dict(metricas))
+            atualizar_saldos_diarios(c, 'contabil', list(desde_por_conta), list(desde_por_conta.values()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Os lotes já confirmados ficam no BD mesmo se um lote posterior falhar: acerta os saldos deles
             try:
-                # Converte a data para o formato YYYY-MM-DD
-                data_formatada = pd.to_datetime(row['Data'], dayfirst=True).strftime('%Y-%m-%d')
-                
-                query = f"""
-                    UPDATE {LANCAMENTOS_CONTABEIS_TABLE} SET
-                        data_lancamento = ?,
-                        historico = ?,
-                        valor = ?,
-                        reduz_deb = ?,
-                        nome_conta_d = ?,
-                        reduz_cred = ?,
-                        nome_conta_c = ?,
-                        origem = ?
-                    WHERE id = ?
-                """
-                params = (
-                    data_formatada,
-                    row['Histórico'],
-                    row['Valor'],
-                    row['Débito'],
-                    row['Nome Conta Débito'],
-                    row['Crédito'],
-                    row['Nome Conta Crédito'],
-                    row['Origem'],
-                    row['id']
-                )
-                c.execute(query, params)
+                atualizar_saldos_diarios(c, 'contabil', list(desde_por_conta), list(desde_por_conta.values()))
+                conn.commit()
             except Exception as e:
-                st.error(f"Erro ao atualizar o lançamento com ID {row.get('id', 'N/A')}: {e}")
-        conn.commit()
-        carregar_lancamentos_contabeis.clear()
+                conn.rollback()
+                print(f"DEBUG: Erro ao atualizar saldos diários após a carga em lotes (use reconstruir_saldos_diarios): {e}")
+            raise
+        finally:
+            carregar_lancamentos_contabeis.clear()
+            carregar_lancamentos.clear()
+    return metricas
+
+# Colunas do grid de edição (4.x) -> colunas de LANCAMENTOS_CONTABEIS_TABLE
+COLUNAS_EDICAO_LANCAMENTOS = {
+    'id': 'id',
+    'Data': 'data_lancamento',
+    'Histórico': 'historico',
+    'Valor': 'valor',
+    'Débito': 'reduz_deb',
+    'Nome Conta Débito': 'nome_conta_d',
+    'Crédito': 'reduz_cred',
+    'Nome Conta Crédito': 'nome_conta_c',
+    'Origem': 'origem',
+}
+
+
+def _sem_id_lancamento(df: pd.DataFrame) -> pd.Series:
+    """Linhas do grid sem id (ex.: linhas novas), que não existem no banco para atualizar."""
+    return pd.to_numeric(df['id'], errors='coerce').isna()
+
+
+def _normalizar_edicao_lancamentos(df: pd.DataFrame) -> pd.DataFrame:
+    """Grid de edição no formato da tabela: datas YYYY-MM-DD, valor float, códigos normalizados, nulos como None."""
+    df = df.loc[~_sem_id_lancamento(df), list(COLUNAS_EDICAO_LANCAMENTOS)].rename(columns=COLUNAS_EDICAO_LANCAMENTOS)
+    datas = df['data_lancamento']
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas = pd.to_datetime(datas.astype(object), dayfirst=True, format='mixed', errors='coerce')
+    df = df.assign(
+        id=pd.to_numeric(df['id']).astype(int),
+        data_lancamento=datas.dt.strftime('%Y-%m-%d').astype(object),
+        valor=pd.to_numeric(df['valor'], errors='coerce').astype(float),
+        reduz_deb=normalizar_codigos_conta(df['reduz_deb']),
+        reduz_cred=normalizar_codigos_conta(df['reduz_cred']),
+    )
+    return df.astype(object).where(df.notna(), None)
+
+
+def _linhas_alteradas(df_novo: pd.DataFrame, df_atual: pd.DataFrame) -> pd.DataFrame:
+    """Linhas de df_novo (por id) que diferem de df_atual em alguma coluna; ids ausentes de df_atual são ignorados."""
+    df_atual = df_atual.drop_duplicates('id').set_index('id')
+    df_novo = df_novo[df_novo['id'].isin(df_atual.index)].drop_duplicates('id', keep='last')
+    atual = df_atual.reindex(df_novo['id'])[[col for col in df_novo.columns if col != 'id']]
+    novo = df_novo.set_index('id')[atual.columns]
+    diferente = ~(novo.eq(atual) | (novo.isna() & atual.isna()))
+    return df_novo[diferente.any(axis=1).values]
+
+
+def salvar_lancamentos_editados(df_editado: pd.DataFrame, df_original: pd.DataFrame = None) -> int:
+    """
+    Atualiza os lançamentos contábeis a partir de um DataFrame editado (colunas de COLUNAS_EDICAO_LANCAMENTOS).
+    Só as linhas que mudaram em relação a df_original (mesmo formato) são gravadas; sem df_original,
+    a comparação é feita com o que está no banco. Um único UPDATE em lote e um único commit.
+    Retorna a quantidade de lançamentos alterados.
+    """
+    if df_editado.empty:
+        return 0
+
+    sem_id = _sem_id_lancamento(df_editado)
+    if sem_id.any():
+        st.warning(f"{int(sem_id.sum())} linha(s) sem ID ignorada(s): novos lançamentos são incluídos em '4.1 Adicionar Lançamento'.")
+        df_editado = df_editado[~sem_id]
+        if df_editado.empty:
+            return 0
+
+    df_novo = _normalizar_edicao_lancamentos(df_editado)
+    datas_invalidas = df_novo['data_lancamento'].isna() & df_editado['Data'].notna().values
+    if datas_invalidas.any():
+        st.error(f"Data inválida nos lançamentos com ID {df_novo.loc[datas_invalidas, 'id'].tolist()}; não foram atualizados.")
+        df_novo = df_novo[~datas_invalidas]
+
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        if df_original is not None:
+            df_atual = _normalizar_edicao_lancamentos(df_original)
+        else:
+            ids = df_novo['id'].tolist()
+            colunas = ', '.join(COLUNAS_EDICAO_LANCAMENTOS.values())
+            linhas = []
+            for inicio in range(0, len(ids), 900):
+                lote = ids[inicio:inicio + 900]
+                c.execute(f"SELECT {colunas} FROM {LANCAMENTOS_CONTABEIS_TABLE} "
+                          f"WHERE id IN ({','.join('?' for _ in lote)})", lote)
+                linhas += c.fetchall()
+            df_atual = pd.DataFrame(linhas, columns=list(COLUNAS_EDICAO_LANCAMENTOS.values()))
+            df_atual = df_atual.assign(id=df_atual['id'].astype(int), valor=df_atual['valor'].astype(float))
+            df_atual = df_atual.astype(object).where(df_atual.notna(), None)
+
+        df_alterado = _linhas_alteradas(df_novo, df_atual)
+        if df_alterado.empty:
+            return 0
+
+        try:
+            # Saldos diários: contas e datas antes e depois da edição
+            contas_alteradas, datas_alteradas = _contas_datas_lancamentos(c, 'id', df_alterado['id'].tolist())
+            metricas = atualizar_em_lote(conn, LANCAMENTOS_CONTABEIS_TABLE, df_alterado.columns,
+                                         df_alterado.itertuples(index=False, name=None))
+            contas_alteradas += df_alterado['reduz_deb'].tolist() + df_alterado['reduz_cred'].tolist()
+            datas_alteradas += df_alterado['data_lancamento'].tolist() * 2
+            atualizar_saldos_diarios(c, 'contabil', contas_alteradas, datas_alteradas)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            st.error(f"Erro ao atualizar os lançamentos editados: {e}")
+            return 0
+
+    carregar_lancamentos_contabeis.clear()
+    carregar_lancamentos.clear()
+    st.info(f"{metricas['atualizadas']} lançamento(s) alterado(s) de {len(df_editado)} editado(s).")
+    return metricas['atualizadas']
 
 def excluir_lancamentos_por_ids(ids: list):
     """Exclui lançamentos contábeis do banco de dados com base em uma lista de IDs."""
@@ -758,47 +1208,60 @@ def excluir_lancamentos_por_ids(ids: list):
         c = conn.cursor()
         try:
             # Cria uma string de placeholders (?, ?, ?) para a cláusula IN
+            contas_alteradas, datas_alteradas = _contas_datas_lancamentos(c, 'id', ids)
             placeholders = ','.join('?' for _ in ids)
             query = f"DELETE FROM {LANCAMENTOS_CONTABEIS_TABLE} WHERE id IN ({placeholders})"
             c.execute(query, ids)
+            atualizar_saldos_diarios(c, 'contabil', contas_alteradas, datas_alteradas)
             conn.commit()
             st.success(f"{len(ids)} lançamento(s) excluído(s) com sucesso.")
             carregar_lancamentos_contabeis.clear() # Invalida o cache
             carregar_lancamentos_contabeis.clear()
+            carregar_lancamentos.clear()
         except Exception as e:
             st.error(f"Erro ao excluir lançamentos: {e}")
 
 def excluir_lancamentos_por_idlancamentos(idlancamentos):
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        contas_alteradas, datas_alteradas = _contas_datas_lancamentos(cursor, 'idlancamento', idlancamentos)
         placeholders = ','.join([PH for _ in idlancamentos])
         cursor.execute(f"DELETE FROM {LANCAMENTOS_CONTABEIS_TABLE} WHERE idlancamento IN ({placeholders})", idlancamentos)
+        atualizar_saldos_diarios(cursor, 'contabil', contas_alteradas, datas_alteradas)
         conn.commit()
         carregar_lancamentos_contabeis.clear()
+        carregar_lancamentos.clear()
     return True
 
 
 
 def salvar_partidas_lancamento(partidas):
-    print(f"DEBUG: Partidas recebidas para salvar: {partidas}")
+    """Insere as partidas (lista de dicts) em lote, com um único executemany e um único commit."""
+    print(f"DEBUG: {len(partidas)} partidas recebidas para salvar")
+    if not partidas:
+        return True
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        for partida in partidas:
-            query = f"""
-                INSERT INTO {LANCAMENTOS_CONTABEIS_TABLE}
-                (idlancamento, data_lancamento, historico, valor, tipo_lancamento, reduz_deb, nome_conta_d, reduz_cred, nome_conta_c, origem)
-                VALUES ({PH}, {PH}, {PH}, {PH}, {PH}, {PH}, {PH}, {PH}, {PH}, {PH})
-            """
-            cursor.execute(query, (
-                partida['idlancamento'], partida['data_lancamento'], partida['historico'],
-                partida['valor'], partida['tipo_lancamento'], partida['reduz_deb'],
-                partida['nome_conta_d'], partida['reduz_cred'], partida['nome_conta_c'],
-                partida['origem']
-            ))
+        query = f"""
+            INSERT INTO {LANCAMENTOS_CONTABEIS_TABLE}
+            (idlancamento, data_lancamento, historico, valor, tipo_lancamento, reduz_deb, nome_conta_d, reduz_cred, nome_conta_c, origem)
+            VALUES ({PH}, {PH}, {PH}, {PH}, {PH}, {PH}, {PH}, {PH}, {PH}, {PH})
+        """
+        reduz_deb = normalizar_codigos_conta(pd.Series([p['reduz_deb'] for p in partidas], dtype=object))
+        reduz_cred = normalizar_codigos_conta(pd.Series([p['reduz_cred'] for p in partidas], dtype=object))
+        cursor.executemany(query, [(
+            partida['idlancamento'], partida['data_lancamento'], partida['historico'],
+            float(partida['valor']), partida['tipo_lancamento'], deb,
+            partida['nome_conta_d'], cred, partida['nome_conta_c'],
+            partida['origem']
+        ) for partida, deb, cred in zip(partidas, reduz_deb, reduz_cred)])
+        datas = [partida['data_lancamento'] for partida in partidas]
+        atualizar_saldos_diarios(cursor, 'contabil', list(reduz_deb) + list(reduz_cred), datas * 2)
 
         conn.commit()
         carregar_lancamentos_contabeis.clear()
+        carregar_lancamentos.clear()
     return True
 
 
@@ -814,14 +1277,154 @@ def carregar_lancamentos_contabeis() -> pd.DataFrame:
         print(f"DEBUG: Erro ao carregar lançamentos contábeis: {e}") # Depuração
         return pd.DataFrame()
 
+# Colunas de LANCAMENTOS_CONTABEIS_TABLE aceitas na projeção de carregar_lancamentos
+COLUNAS_LANCAMENTOS = (
+    'id', 'idlancamento', 'data_lancamento', 'historico', 'valor', 'tipo_lancamento',
+    'reduz_deb', 'nome_conta_d', 'reduz_cred', 'nome_conta_c', 'origem'
+)
+
+
+def normalizar_codigos_conta(codigos: pd.Series) -> pd.Series:
+    """Códigos reduzidos como texto, sem espaços e sem o '.0' de valores lidos como float; vazios viram None."""
+    texto = codigos.astype(object).where(codigos.notna(), None)
+    texto = texto.map(lambda v: v if v is None else str(v).strip())
+    texto = texto.str.replace(r'\.0+$', '', regex=True)
+    return texto.where(~texto.isin(['', 'nan', 'None', 'NaN']), None)
+
+
+@st.cache_data(show_spinner="Carregando lançamentos contábeis...", ttl=300)
+def carregar_lancamentos(periodo=None, contas=None, origens=None, colunas=None,
+                         decrescente: bool = False) -> pd.DataFrame:
+    """
+    Carrega lançamentos contábeis com os filtros aplicados no banco.
+    - periodo: (data_inicio, data_fim), datas inclusivas; None em uma ponta deixa o intervalo aberto.
+    - contas: códigos reduzidos presentes no débito OU no crédito.
+    - origens: valores aceitos da coluna origem.
+    - colunas: projeção (subconjunto de COLUNAS_LANCAMENTOS); padrão, todas.
+    Tipos: data_lancamento datetime64 (sem hora), valor float e reduz_deb/reduz_cred normalizados
+    (texto sem '.0'). Ordem por data e id (decrescente se pedido).
+    """
+    colunas = list(COLUNAS_LANCAMENTOS if colunas is None else colunas)
+    invalidas = [col for col in colunas if col not in COLUNAS_LANCAMENTOS]
+    if invalidas:
+        raise ValueError(f"Colunas inválidas para lançamentos contábeis: {invalidas}")
+
+    filtros, params = [], []
+    data_inicio, data_fim = periodo if periodo is not None else (None, None)
+    if data_inicio is not None:
+        filtros.append(f"data_lancamento >= {PH}")
+        params.append(pd.Timestamp(data_inicio).strftime('%Y-%m-%d'))
+    if data_fim is not None:
+        # Limite exclusivo no dia seguinte: cobre datas gravadas com hora ('AAAA-MM-DD 00:00:00')
+        filtros.append(f"data_lancamento < {PH}")
+        params.append((pd.Timestamp(data_fim) + timedelta(days=1)).strftime('%Y-%m-%d'))
+    if contas is not None:
+        contas = [c for c in normalizar_codigos_conta(pd.Series(list(contas), dtype=object)).dropna().unique()]
+        if not contas:
+            return pd.DataFrame(columns=colunas)
+        marcadores = ', '.join([PH] * len(contas))
+        filtros.append(f"(reduz_deb IN ({marcadores}) OR reduz_cred IN ({marcadores}))")
+        params.extend(contas + contas)
+    if origens is not None:
+        origens = list(origens)
+        if not origens:
+            return pd.DataFrame(columns=colunas)
+        filtros.append(f"origem IN ({', '.join([PH] * len(origens))})")
+        params.extend(origens)
+
+    onde = f"WHERE {' AND '.join(filtros)}" if filtros else ''
+    sentido = 'DESC' if decrescente else 'ASC'
+    query = f"""
+        SELECT {', '.join(colunas)} FROM {LANCAMENTOS_CONTABEIS_TABLE}
+        {onde}
+        ORDER BY data_lancamento {sentido}, id {sentido}
+    """
+    with get_db_connection() as conn:
+        df = pd.read_sql_query(query, _get_raw_conn(conn), params=params)
+
+    if 'data_lancamento' in df.columns:
+        df['data_lancamento'] = pd.to_datetime(df['data_lancamento'], errors='coerce', format='ISO8601').dt.normalize()
+    if 'valor' in df.columns:
+        df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
+    for col in ('reduz_deb', 'reduz_cred'):
+        if col in df.columns:
+            df[col] = normalizar_codigos_conta(df[col])
+    return df
+
+
+def existem_lancamentos_contabeis() -> bool:
+    """Indica se há algum lançamento contábil gravado (sem carregar a tabela)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT 1 FROM {LANCAMENTOS_CONTABEIS_TABLE} LIMIT 1")
+        return c.fetchone() is not None
+
+
+COLUNAS_SALDOS_CONTAS = ['conta', 'saldo_anterior', 'debitos', 'creditos', 'saldo_final']
+
+
+def carregar_saldos_contas(data_inicio=None, data_fim=None, contas=None) -> pd.DataFrame:
+    """
+    Saldos por conta agregados no banco, em uma única consulta (UNION ALL das pernas de
+    débito e de crédito, agrupada por conta).
+    Retorna conta, saldo_anterior (antes de data_inicio), debitos e creditos do período e
+    saldo_final, com a natureza devedora (débito soma, crédito subtrai). Sem data_inicio,
+    todo o histórico até data_fim entra em debitos/creditos.
+    """
+    if contas is not None:
+        contas = [c for c in normalizar_codigos_conta(pd.Series(list(contas), dtype=object)).dropna().unique()]
+        if not contas:
+            return pd.DataFrame(columns=COLUNAS_SALDOS_CONTAS)
+
+    def _perna(coluna_conta, valor_debito, valor_credito):
+        filtros = [f"{coluna_conta} IS NOT NULL", f"{coluna_conta} <> ''"]
+        params = []
+        if data_fim is not None:
+            filtros.append(f"data_lancamento < {PH}")
+            params.append((pd.Timestamp(data_fim) + timedelta(days=1)).strftime('%Y-%m-%d'))
+        if contas is not None:
+            filtros.append(f"{coluna_conta} IN ({', '.join([PH] * len(contas))})")
+            params.extend(contas)
+        query = f"""
+            SELECT {coluna_conta} AS conta, data_lancamento,
+                   {valor_debito} AS valor_debito, {valor_credito} AS valor_credito
+            FROM {LANCAMENTOS_CONTABEIS_TABLE}
+            WHERE {' AND '.join(filtros)}
+        """
+        return query, params
+
+    query_deb, params_deb = _perna('reduz_deb', 'COALESCE(valor, 0)', '0')
+    query_cred, params_cred = _perna('reduz_cred', '0', 'COALESCE(valor, 0)')
+    inicio = pd.Timestamp(data_inicio).strftime('%Y-%m-%d') if data_inicio is not None else '0001-01-01'
+    query = f"""
+        SELECT conta,
+               SUM(CASE WHEN data_lancamento < {PH} THEN valor_debito - valor_credito ELSE 0 END) AS saldo_anterior,
+               SUM(CASE WHEN data_lancamento >= {PH} THEN valor_debito ELSE 0 END) AS debitos,
+               SUM(CASE WHEN data_lancamento >= {PH} THEN valor_credito ELSE 0 END) AS creditos
+        FROM ({query_deb} UNION ALL {query_cred}) pernas
+        GROUP BY conta
+        ORDER BY conta
+    """
+    params = [inicio, inicio, inicio] + params_deb + params_cred
+    with get_db_connection() as conn:
+        df = pd.read_sql_query(query, _get_raw_conn(conn), params=params)
+
+    for col in ('saldo_anterior', 'debitos', 'creditos'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).astype(float)
+    df['saldo_final'] = df['saldo_anterior'] + df['debitos'] - df['creditos']
+    return df[COLUNAS_SALDOS_CONTAS]
+
+
 def limpar_lancamentos_contabeis():
     """Remove todos os registros da tabela de lançamentos contábeis."""
     with get_db_connection() as conn:
         try:
             conn.execute(f"DELETE FROM {LANCAMENTOS_CONTABEIS_TABLE}")
+            conn.execute(f"DELETE FROM {SALDOS_DIARIOS_TABLE} WHERE origem = 'contabil'")
             conn.commit()
             st.success(f"Tabela '{LANCAMENTOS_CONTABEIS_TABLE}' limpa com sucesso.")
             carregar_lancamentos_contabeis.clear()
+            carregar_lancamentos.clear()
             return True
         except Exception as e:
             st.error(f"Erro ao tentar limpar os lançamentos contábeis: {e}")
@@ -831,10 +1434,37 @@ def limpar_lancamentos_contabeis():
 # FUNÇÕES DE HISTÓRICO
 # ==============================================================================
 
-def salvar_extrato_bancario_historico(df_ofx: pd.DataFrame):
-    """Salva o DF do extrato bancário no histórico."""
+def gerar_ids_unicos(df_save: pd.DataFrame) -> tuple:
+    """
+    Gera o ID_Unico (MD5) de cada transação do extrato, coluna a coluna.
+    Chave: ID_Transacao_Data_Lancamento_Valor_Descricao_Conta_OFX_Normalizada; a N-ésima
+    repetição da mesma chave no lote recebe o sufixo _DUPN antes do hash. Os IDs são os
+    mesmos gerados pela versão linha a linha, então reimportações continuam idempotentes.
+    Retorna (ids, quantidade de chaves repetidas).
+    """
     import hashlib
 
+    def _texto(coluna):
+        # Mesma formatação do f-string original (nan, None, repr do float)
+        if coluna not in df_save.columns:
+            return pd.Series('', index=df_save.index, dtype=object)
+        return df_save[coluna].astype(object).map(str)
+
+    chave_base = _texto('ID_Transacao')
+    for coluna in ['Data_Lancamento', 'Valor', 'Descricao']:
+        chave_base = chave_base + '_' + _texto(coluna)
+    chave_base = chave_base + '_' + df_save['Conta_OFX_Normalizada'].astype(object).map(str)
+
+    ocorrencia = chave_base.groupby(chave_base, sort=False).cumcount()
+    repetida = ocorrencia > 0
+    chave = chave_base.copy()
+    chave[repetida] = chave_base[repetida] + '_DUP' + ocorrencia[repetida].astype(str)
+
+    ids = pd.Series([hashlib.md5(k.encode()).hexdigest() for k in chave], index=df_save.index, dtype=object)
+    return ids, int((ocorrencia == 1).sum())
+
+def salvar_extrato_bancario_historico(df_ofx: pd.DataFrame):
+    """Salva o DF do extrato bancário no histórico. Retorna as métricas da carga (inserir_em_lote)."""
     with get_db_connection() as conn:
         c = conn.cursor()
         cols_map = {
@@ -859,29 +1489,9 @@ def salvar_extrato_bancario_historico(df_ofx: pd.DataFrame):
 
         # IMPORTANTE: Gera um ID único para cada transação (hash MD5)
         # Evita problema de IDs duplicados do OFX da Caixa
-        def gerar_id_unico(row, contador_duplicatas):
-            """Gera ID único para a transação, adicionando contador se necessário"""
-            chave_base = f"{row['ID_Transacao']}_{row['Data_Lancamento']}_{row['Valor']}_{row.get('Descricao', '')}_{row['Conta_OFX_Normalizada']}"
-
-            # Se é a primeira ocorrência desta chave, usa hash simples
-            if chave_base not in contador_duplicatas:
-                contador_duplicatas[chave_base] = 0
-                return hashlib.md5(chave_base.encode()).hexdigest()
-            else:
-                # Se já existe, incrementa contador e adiciona ao hash
-                contador_duplicatas[chave_base] += 1
-                chave_com_sufixo = f"{chave_base}_DUP{contador_duplicatas[chave_base]}"
-                return hashlib.md5(chave_com_sufixo.encode()).hexdigest()
-
-        # Adiciona ID_Unico ao DataFrame (detecta e diferencia duplicatas)
-        contador_duplicatas = {}
-        ids_unicos = []
-        for _, row in df_save.iterrows():
-            ids_unicos.append(gerar_id_unico(row, contador_duplicatas))
-        df_save['ID_Unico'] = ids_unicos
+        df_save['ID_Unico'], total_duplicatas = gerar_ids_unicos(df_save)
 
         # Informa se houve transações duplicadas
-        total_duplicatas = sum(1 for v in contador_duplicatas.values() if v > 0)
         if total_duplicatas > 0:
             st.info(f"{total_duplicatas} transacao(oes) identica(s) detectada(s) e diferenciada(s) automaticamente.")
 
@@ -889,26 +1499,24 @@ def salvar_extrato_bancario_historico(df_ofx: pd.DataFrame):
         cols_order = ['ID_Unico'] + [col for col in df_save.columns if col != 'ID_Unico']
         df_save = df_save[cols_order]
 
-        columns = ', '.join(df_save.columns)
-        placeholders = ', '.join([PH for _ in df_save.columns])
-
-        # Sintaxe diferente para ignorar duplicatas (SQLite vs PostgreSQL)
-        if IS_PRODUCTION:
-            insert_query = f"INSERT INTO {EXTRATO_BANCARIO_TABLE} ({columns}) VALUES ({placeholders}) ON CONFLICT (ID_Unico) DO NOTHING"
-        else:
-            insert_query = f"INSERT OR IGNORE INTO {EXTRATO_BANCARIO_TABLE} ({columns}) VALUES ({placeholders})"
-
-        data_to_insert = [tuple(row) for row in df_save.values]
+        data_to_insert = [tuple(row) for row in df_save.astype(object).where(df_save.notna(), None).values]
 
         try:
-            c.executemany(insert_query, data_to_insert)
+            # Duplicatas (mesmo ID_Unico) são ignoradas; COPY + merge no PostgreSQL
+            metricas = inserir_em_lote(conn, EXTRATO_BANCARIO_TABLE, df_save.columns, data_to_insert,
+                                       chave_conflito='ID_Unico')
+            atualizar_saldos_diarios(c, 'extrato', df_save['Conta_OFX_Normalizada'], df_save['Data_Lancamento'])
             conn.commit()
 
             try:
                 carregar_extrato_bancario_historico.clear()
             except:
                 pass  # Ignora erro se cache não disponível
-            st.info(f"OK - {len(data_to_insert)} transacoes processadas para salvamento no historico.")
+            st.info(
+                f"OK - {metricas['linhas']} transacoes processadas para salvamento no historico "
+                f"({metricas['inseridas']} novas, {metricas['linhas_por_segundo']:,.0f} linhas/s)."
+            )
+            return metricas
         except Exception as e:
             st.error(f"Erro ao inserir dados no historico do extrato: {e}")
             conn.rollback()
@@ -942,11 +1550,38 @@ def carregar_extrato_bancario_historico(conta_ofx_normalizada: str, data_inicio:
 
         return df
 
+def carregar_extrato_bancario_periodo(data_inicio: datetime.date, data_fim: datetime.date) -> pd.DataFrame:
+    """Carrega o extrato histórico de todas as contas no período, com o ID_Unico (usado na conciliação em lote)."""
+    with get_db_connection() as conn:
+        query = f"""
+            SELECT
+                id_unico AS "ID_Unico",
+                id_transacao AS "ID Transacao",
+                data_lancamento AS "Data Lancamento",
+                valor AS "Valor",
+                descricao AS "Descricao",
+                tipo AS "Tipo",
+                banco_ofx AS "Banco_OFX",
+                conta_ofx_normalizada AS "Conta_OFX_Normalizada"
+            FROM {EXTRATO_BANCARIO_TABLE}
+            WHERE data_lancamento BETWEEN ? AND ?
+            ORDER BY conta_ofx_normalizada ASC, data_lancamento ASC, id_transacao ASC;
+        """
+        query = adapt_query(query)
+        params = (data_inicio.strftime('%Y-%m-%d'), data_fim.strftime('%Y-%m-%d'))
+        df = pd.read_sql_query(query, _get_raw_conn(conn), params=params)
+
+        if not df.empty:
+            df['Data Lancamento'] = pd.to_datetime(df['Data Lancamento'], errors='coerce').dt.date
+
+        return df
+
 def limpar_extrato_bancario_historico():
     """Remove todos os registros da tabela de histórico de extrato bancário."""
     with get_db_connection() as conn:
         try:
             conn.execute(f"DELETE FROM {EXTRATO_BANCARIO_TABLE}")
+            conn.execute(f"DELETE FROM {SALDOS_DIARIOS_TABLE} WHERE origem = 'extrato'")
             conn.commit()
             st.success(f"Tabela '{EXTRATO_BANCARIO_TABLE}' limpa com sucesso.")
             carregar_extrato_bancario_historico.clear()
@@ -955,6 +1590,266 @@ def limpar_extrato_bancario_historico():
             st.error(f"Erro ao tentar limpar o histórico de extrato: {e}")
             return False
 
+# ==============================================================================
+# SALDOS DIÁRIOS MATERIALIZADOS
+# ==============================================================================
+# SALDOS_DIARIOS_TABLE guarda, por (origem, conta, data), o movimento do dia e o saldo
+# acumulado desde o primeiro movimento da conta. Origens: 'extrato' (conta OFX normalizada,
+# soma dos valores) e 'contabil' (código reduzido, débitos - créditos). As gravações no
+# extrato e nos lançamentos recalculam as contas afetadas a partir da menor data alterada;
+# reconstruir_saldos_diarios refaz tudo (python -m conciliacao_lote saldos).
+# Saldo de abertura = saldo do cadastro + movimento_acumulado(data do cadastro, véspera).
+ORIGENS_SALDOS_DIARIOS = ('extrato', 'contabil')
+
+
+def _movimentos_diarios(c, origem: str, contas=None, desde: str = None) -> pd.DataFrame:
+    """Movimento por conta e dia lido das tabelas de origem (conta, data 'AAAA-MM-DD', movimento)."""
+    if origem == 'extrato':
+        pernas = [('Conta_OFX_Normalizada', 'Data_Lancamento', 'Valor', EXTRATO_BANCARIO_TABLE, [])]
+    elif origem == 'contabil':
+        # Débito e crédito na mesma conta contam uma vez, como débito (igual a movimentos_lancamentos_contabeis)
+        distinto = 'IS DISTINCT FROM' if IS_PRODUCTION else 'IS NOT'
+        pernas = [('reduz_deb', 'data_lancamento', 'valor', LANCAMENTOS_CONTABEIS_TABLE, []),
+                  ('reduz_cred', 'data_lancamento', '-valor', LANCAMENTOS_CONTABEIS_TABLE,
+                   [f"reduz_cred {distinto} reduz_deb"])]
+    else:
+        raise ValueError(f"Origem de saldos diários inválida: {origem}. Opções: {ORIGENS_SALDOS_DIARIOS}")
+
+    consultas, params = [], []
+    for coluna_conta, coluna_data, valor, tabela, filtros_perna in pernas:
+        filtros = [f"{coluna_conta} IS NOT NULL", f"{coluna_conta} <> ''", *filtros_perna]
+        if contas is not None:
+            filtros.append(f"{coluna_conta} IN ({', '.join([PH] * len(contas))})")
+            params.extend(contas)
+        if desde is not None:
+            filtros.append(f"{coluna_data} >= {PH}")
+            params.append(desde)
+        consultas.append(
+            f"SELECT {coluna_conta} AS conta, {coluna_data} AS data, {valor} AS valor "
+            f"FROM {tabela} WHERE {' AND '.join(filtros)}"
+        )
+    c.execute(' UNION ALL '.join(consultas), params)
+    df = pd.DataFrame(c.fetchall(), columns=['conta', 'data', 'valor'])
+
+    df['data'] = pd.to_datetime(df['data'].astype(str), errors='coerce', format='ISO8601').dt.strftime('%Y-%m-%d')
+    df['valor'] = pd.to_numeric(df['valor'], errors='coerce').fillna(0.0)
+    df = df.dropna(subset=['data'])
+    return (df.groupby(['conta', 'data'], sort=True)['valor'].sum()
+            .rename('movimento').reset_index())
+
+
+def _acumulados_em(c, origem: str, contas, data: str) -> dict:
+    """Saldo acumulado de cada conta no fim do dia informado (último dia com movimento até ele)."""
+    if not contas:
+        return {}
+    c.execute(f"""
+        SELECT s.conta, s.saldo_acumulado FROM {SALDOS_DIARIOS_TABLE} s
+        WHERE s.origem = {PH} AND s.conta IN ({', '.join([PH] * len(contas))})
+          AND s.data = (SELECT MAX(u.data) FROM {SALDOS_DIARIOS_TABLE} u
+                        WHERE u.origem = s.origem AND u.conta = s.conta AND u.data <= {PH})
+    """, [origem, *contas, data])
+    return {conta: float(saldo) for conta, saldo in c.fetchall()}
+
+
+def _gravar_saldos_diarios(c, origem: str, movimentos: pd.DataFrame, bases: dict) -> int:
+    """Insere os dias de movimento com o saldo acumulado a partir da base de cada conta."""
+    if movimentos.empty:
+        return 0
+    acumulado = movimentos.groupby('conta', sort=False)['movimento'].cumsum()
+    acumulado += movimentos['conta'].map(bases).fillna(0.0)
+    c.executemany(
+        f"INSERT INTO {SALDOS_DIARIOS_TABLE} (origem, conta, data, movimento, saldo_acumulado) "
+        f"VALUES ({PH}, {PH}, {PH}, {PH}, {PH})",
+        [(origem, conta, data, float(mov), float(acum)) for conta, data, mov, acum
+         in zip(movimentos['conta'], movimentos['data'], movimentos['movimento'], acumulado)]
+    )
+    return len(movimentos)
+
+
+def atualizar_saldos_diarios(c, origem: str, contas, datas) -> None:
+    """
+    Recalcula os saldos diários das contas alteradas a partir da menor data alterada de cada uma.
+    contas e datas são paralelos (uma entrada por linha gravada ou excluída). Usa o cursor da
+    gravação, para entrar na mesma transação; o commit fica com quem chamou.
+    """
+    alteracoes = pd.DataFrame({
+        'conta': normalizar_codigos_conta(pd.Series(list(contas), dtype=object)) if origem == 'contabil'
+                 else pd.Series(list(contas), dtype=object),
+        'data': pd.to_datetime(pd.Series(list(datas), dtype=object).astype(str), errors='coerce', format='ISO8601'),
+    }).dropna()
+    if alteracoes.empty:
+        return
+    desde_por_conta = alteracoes.groupby('conta')['data'].min().dt.strftime('%Y-%m-%d')
+
+    for desde, grupo in desde_por_conta.groupby(desde_por_conta):
+        contas_grupo = grupo.index.tolist()
+        vespera = (pd.Timestamp(desde) - timedelta(days=1)).strftime('%Y-%m-%d')
+        bases = _acumulados_em(c, origem, contas_grupo, vespera)
+        c.executemany(
+            f"DELETE FROM {SALDOS_DIARIOS_TABLE} WHERE origem = {PH} AND conta = {PH} AND data >= {PH}",
+            [(origem, conta, desde) for conta in contas_grupo]
+        )
+        _gravar_saldos_diarios(c, origem, _movimentos_diarios(c, origem, contas_grupo, desde), bases)
+
+
+def _reconstruir_saldos_diarios(c, origens) -> dict:
+    """Recalcula do zero os saldos diários das origens informadas; retorna os dias gravados por origem."""
+    gravados = {}
+    for origem in origens:
+        c.execute(f"DELETE FROM {SALDOS_DIARIOS_TABLE} WHERE origem = {PH}", (origem,))
+        gravados[origem] = _gravar_saldos_diarios(c, origem, _movimentos_diarios(c, origem), {})
+    return gravados
+
+
+def reconstruir_saldos_diarios(origens=ORIGENS_SALDOS_DIARIOS) -> dict:
+    """Reconstrói SALDOS_DIARIOS_TABLE a partir do extrato e dos lançamentos, em uma transação."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        try:
+            gravados = _reconstruir_saldos_diarios(c, origens)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return gravados
+
+
+def saldos_acumulados(origem: str, contas, data) -> pd.Series:
+    """Saldo acumulado de cada conta no fim do dia 'data' (0 para conta sem movimento até lá)."""
+    contas = list(dict.fromkeys(contas))
+    with get_db_connection() as conn:
+        acumulados = _acumulados_em(conn.cursor(), origem, contas, pd.Timestamp(data).strftime('%Y-%m-%d'))
+    return pd.Series([acumulados.get(conta, 0.0) for conta in contas], index=contas, dtype=float)
+
+
+def movimento_acumulado(origem: str, conta: str, data_inicio, data_fim) -> float:
+    """Soma dos movimentos da conta entre data_inicio e data_fim (inclusivas), por duas consultas indexadas."""
+    if data_inicio is not None and pd.Timestamp(data_inicio) > pd.Timestamp(data_fim):
+        return 0.0
+    fim = saldos_acumulados(origem, [conta], data_fim).iloc[0]
+    if data_inicio is None:
+        return fim
+    return fim - saldos_acumulados(origem, [conta], pd.Timestamp(data_inicio) - timedelta(days=1)).iloc[0]
+
+
+def primeira_data_saldo_diario(origem: str, conta: str):
+    """Data do primeiro movimento da conta em SALDOS_DIARIOS_TABLE (None se não houver)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT MIN(data) FROM {SALDOS_DIARIOS_TABLE} WHERE origem = {PH} AND conta = {PH}", (origem, conta))
+        primeira = c.fetchone()[0]
+    return pd.Timestamp(primeira).date() if primeira is not None else None
+
+
+# ==============================================================================
+# FUNÇÕES DE ESTADO DA CONCILIAÇÃO
+# ==============================================================================
+
+def carregar_conciliacoes(ids_unicos=None) -> pd.DataFrame:
+    """
+    Carrega os pares (ID_Unico do extrato, id contábil) já conciliados. Com ids_unicos, só os
+    pares dessas linhas do extrato (filtro no banco, pela chave primária), em blocos de 500.
+    """
+    colunas = ['id_unico', 'id_contabil', 'passagem', 'hash_extrato', 'hash_contabil', 'data_contabil',
+               'data_conciliacao']
+    query = f"SELECT {', '.join(colunas)} FROM {CONCILIACOES_TABLE}"
+    try:
+        with get_db_connection() as conn:
+            if ids_unicos is None:
+                return pd.read_sql_query(query, _get_raw_conn(conn))
+
+            ids_unicos = pd.Series(list(ids_unicos), dtype=object).dropna().astype(str).unique().tolist()
+            partes = []
+            for inicio in range(0, len(ids_unicos), 500):
+                parte = ids_unicos[inicio:inicio + 500]
+                partes.append(pd.read_sql_query(
+                    f"{query} WHERE id_unico IN ({', '.join([PH] * len(parte))})", _get_raw_conn(conn), params=parte
+                ))
+            return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=colunas)
+    except Exception as e:
+        print(f"DEBUG: Erro ao carregar conciliações: {e}")
+        return pd.DataFrame(columns=colunas)
+
+def salvar_conciliacoes(df_pares: pd.DataFrame) -> int:
+    """Grava novos pares conciliados (ignora pares já existentes). Retorna a quantidade enviada."""
+    if df_pares.empty:
+        return 0
+
+    cols = ['id_unico', 'id_contabil', 'passagem', 'hash_extrato', 'hash_contabil', 'data_contabil']
+    data_conciliacao = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    data_to_insert = [
+        (str(r[0]), int(r[1]), r[2], r[3], r[4], r[5], data_conciliacao)
+        for r in df_pares[cols].itertuples(index=False, name=None)
+    ]
+
+    columns = ', '.join(cols + ['data_conciliacao'])
+    placeholders = ', '.join([PH for _ in range(len(cols) + 1)])
+    if IS_PRODUCTION:
+        insert_query = f"INSERT INTO {CONCILIACOES_TABLE} ({columns}) VALUES ({placeholders}) ON CONFLICT (id_unico, id_contabil) DO NOTHING"
+    else:
+        insert_query = f"INSERT OR IGNORE INTO {CONCILIACOES_TABLE} ({columns}) VALUES ({placeholders})"
+
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.executemany(insert_query, data_to_insert)
+        conn.commit()
+    return len(data_to_insert)
+
+def excluir_conciliacoes(ids_unicos: list) -> None:
+    """Remove o estado de conciliação das linhas do extrato informadas (ex.: linhas editadas ou excluídas)."""
+    if not ids_unicos:
+        return
+
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        placeholders = ','.join([PH for _ in ids_unicos])
+        c.execute(f"DELETE FROM {CONCILIACOES_TABLE} WHERE id_unico IN ({placeholders})", [str(i) for i in ids_unicos])
+        conn.commit()
+
+def limpar_conciliacoes() -> None:
+    """Remove todo o estado de conciliação (força a reconciliação completa na próxima execução)."""
+    with get_db_connection() as conn:
+        conn.execute(f"DELETE FROM {CONCILIACOES_TABLE}")
+        conn.commit()
+
+def carregar_passagens_conciliacao() -> pd.DataFrame:
+    """Carrega a configuração de passagens de conciliação ativas, na ordem de execução."""
+    try:
+        with get_db_connection() as conn:
+            return pd.read_sql_query(
+                f"SELECT conta_contabil, ordem, nome, tipo, parametros FROM {PASSAGENS_CONCILIACAO_TABLE} "
+                f"WHERE ativo = 1 ORDER BY conta_contabil, ordem, id",
+                _get_raw_conn(conn)
+            )
+    except Exception as e:
+        print(f"DEBUG: Erro ao carregar passagens de conciliação: {e}")
+        return pd.DataFrame(columns=['conta_contabil', 'ordem', 'nome', 'tipo', 'parametros'])
+
+def salvar_passagens_conciliacao(passagens: list, conta_contabil: str = None) -> None:
+    """
+    Substitui as passagens de um escopo: da conta contábil informada ou, sem conta, o padrão da empresa.
+    Cada passagem é um dict no formato de PASSAGES_CONFIG ('name', 'tipo' e demais parâmetros).
+    """
+    conta = str(conta_contabil).strip() if conta_contabil not in (None, '') else None
+    registros = []
+    for ordem, passagem in enumerate(passagens, start=1):
+        parametros = {k: v for k, v in passagem.items() if k not in ('name', 'tipo')}
+        registros.append((conta, ordem, passagem['name'], passagem.get('tipo', 'valor_data'), json.dumps(parametros)))
+
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        if conta is None:
+            c.execute(f"DELETE FROM {PASSAGENS_CONCILIACAO_TABLE} WHERE conta_contabil IS NULL")
+        else:
+            c.execute(f"DELETE FROM {PASSAGENS_CONCILIACAO_TABLE} WHERE conta_contabil = {PH}", (conta,))
+        if registros:
+            c.executemany(
+                f"INSERT INTO {PASSAGENS_CONCILIACAO_TABLE} (conta_contabil, ordem, nome, tipo, parametros) "
+                f"VALUES ({PH}, {PH}, {PH}, {PH}, {PH})",
+                registros
+            )
+        conn.commit()
+
 # ==============================================================================
 # FUNÇÕES DE CADASTRO DA EMPRESA
 # ==============================================================================
@@ -0,0 +1,311 @@
+"""
+Leitor rápido de arquivos OFX (1.x SGML e 2.x XML).
+Percorre o arquivo uma única vez separando as tags com uma expressão regular e monta, para cada
+conta (<STMTRS>), as transações (<STMTTRN>) em listas por coluna, sem árvore de objetos. Reproduz
+a leitura do ofxparse (decodificação, entidades HTML, datas com fuso, valores com vírgula e 'null');
+qualquer estrutura que ele não trate exatamente igual faz ler_ofx retornar None, e a importação
+usa o ofxparse.
+"""
+import codecs
+import decimal
+import html
+import logging
+import re
+from datetime import datetime, timedelta
+
+from utils import remover_acentos
+
+logger = logging.getLogger(__name__)
+
+# Mesma ordem de tentativa da importação pelo ofxparse
+ENCODINGS_OFX = ['cp1252', 'latin-1', 'iso-8859-1', 'utf-8']
+
+# Uma tag simples (sem atributos) seguida do texto até a próxima tag
+_TAG = re.compile(r'<(/?)([A-Za-z0-9_.]+)>([^<]*)')
+
+# Agregados tratados só pelo ofxparse (cartão de crédito, investimentos, lista de contas)
+AGREGADOS_NAO_SUPORTADOS = {'CCSTMTRS', 'INVSTMTRS', 'ACCTINFORS'}
+
+# Campos lidos de cada conta e de cada transação (a primeira ocorrência dentro do agregado)
+CAMPOS_CONTA = ('ACCTID', 'BANKID', 'BRANCHID')
+CAMPOS_TRANSACAO = ('TRNTYPE', 'NAME', 'MEMO', 'TRNAMT', 'DTPOSTED', 'DTUSER', 'FITID')
+
+# Campos que o ofxparse exige preenchidos quando presentes (senão a leitura falha)
+_TRANSACAO_NAO_VAZIOS = ('TRNTYPE', 'NAME', 'DTUSER', 'SIC', 'CHECKNUM')
+_TRANSACAO_OBRIGATORIOS = ('TRNAMT', 'DTPOSTED', 'FITID')
+_NAO_VAZIOS = {'CURDEF', 'SEVERITY', 'MESSAGE', 'TRNUID'}
+_DATAS = {'DTSTART', 'DTEND', 'DTASOF'}
+
+# Entidades que o html.parser (usado pelo ofxparse) e o html.unescape convertem igual
+_ENTIDADE_DESCONHECIDA = re.compile(
+    r'&(?!(?:#\d+|#[xX][0-9A-Fa-f]+|amp|AMP|lt|LT|gt|GT|quot|QUOT|apos|nbsp);)[#A-Za-z]')
+
+_FUSO = re.compile(r"\[(?P<tz>[-+]?\d+\.?\d*)\:\w*\]$")
+_FRACAO = re.compile(r"^[0-9]*\.([0-9]{0,5})")
+
+
+class OFXNaoSuportado(Exception):
+    """Estrutura que o leitor rápido não trata: a importação deve usar o ofxparse."""
+
+
+# ==============================================================================
+# CONVERSÃO DE VALORES (mesmas regras do ofxparse)
+# ==============================================================================
+
+def _texto(valor: str) -> str:
+    """Converte as entidades HTML do valor (&amp; etc.)."""
+    if '&' not in valor:
+        return valor
+    if _ENTIDADE_DESCONHECIDA.search(valor):
+        raise OFXNaoSuportado(f"entidade HTML não suportada: {valor!r}")
+    return html.unescape(valor)
+
+
+def data_hora_ofx(valor: str):
+    """Data/hora OFX (ex.: '20240115120000.000[-3:BRT]') em UTC, como OfxParser.parseOfxDateTime."""
+    fuso = _FUSO.search(valor)
+    deslocamento = timedelta(hours=float(fuso.group('tz')) if fuso else 0)
+    fracao = _FRACAO.search(valor)
+    segundos = timedelta(seconds=float("0." + fracao.group(1)) if fracao else 0)
+    try:
+        return datetime.strptime(valor[:14], '%Y%m%d%H%M%S') - deslocamento + segundos
+    except ValueError:
+        if valor[:8] == "00000000":
+            return None
+        return datetime.strptime(valor[:8], '%Y%m%d') - deslocamento + segundos
+
+
+def decimal_ofx(valor: str) -> decimal.Decimal:
+    """Valor OFX em Decimal, aceitando '1.234,56', '1,234.56', '1234,56' e '+1 234,56'."""
+    d = valor.strip()
+    if re.search(r'.*\..*,', d):
+        d = d.replace('.', '')
+    if re.search(r'.*,.*\.', d):
+        d = d.replace(',', '')
+    if '.' not in d and ',' in d:
+        d = d.replace(',', '.')
+    d = d.replace(' ', '').replace('+', '')
+    return decimal.Decimal(d)
+
+
+def _valor_transacao(valor: str):
+    try:
+        return decimal_ofx(valor)
+    except decimal.InvalidOperation:
+        # Alguns bancos usam transações 'null' (ex.: mudança de taxa); o ofxparse grava 0
+        if valor.strip() in ('null', '-null'):
+            return 0
+        raise
+
+
+def _por_valor_unico(valores: list, converter) -> list:
+    """Aplica converter uma vez por valor distinto (datas e valores se repetem muito no extrato)."""
+    convertidos = {valor: converter(valor) for valor in set(valores)}
+    return [convertidos[valor] for valor in valores]
+
+
+# ==============================================================================
+# DECODIFICAÇÃO
+# ==============================================================================
+
+def _corpo_como_ofxparse(texto: str) -> str:
+    """
+    Texto que o ofxparse entrega ao parser HTML: ele recodifica a string em latin-1 e a decodifica
+    pelo cabeçalho ENCODING/CHARSET. Levanta exceção nos mesmos casos em que ele falharia.
+    """
+    dados = texto.encode('latin-1')
+    cabecalho = dados[:1024 * 10]
+    cabecalho = cabecalho[:cabecalho.find(b'<')]
+    cabecalhos = {}
+    for linha in cabecalho.splitlines():
+        if linha.strip() == b'':
+            break
+        chave, valor = linha.split(b':')
+        cabecalhos[chave.strip().upper().decode('ascii', 'replace')] = valor.strip().decode('ascii', 'replace')
+
+    tipo = cabecalhos.get('ENCODING')
+    if not tipo:
+        encoding = 'ascii'
+    elif tipo == 'USASCII':
+        charset = cabecalhos.get('CHARSET', '1252')
+        encoding = 'iso-8859-1' if charset == '8859-1' else f'cp{charset}'
+    elif tipo in ('UNICODE', 'UTF-8'):
+        encoding = 'utf-8'
+    else:
+        raise OFXNaoSuportado(f"ENCODING desconhecido: {tipo}")
+    codecs.lookup(encoding)
+    if texto.isascii():
+        return texto
+    return dados.decode(encoding)
+
+
+def decodificar_ofx(file_bytes: bytes):
+    """
+    (texto, corpo): texto decodificado e sem acentos (base das buscas por regex da importação) e o
+    corpo que o ofxparse leria, na primeira codificação em que ele leria o arquivo.
+    """
+    for encoding in ENCODINGS_OFX:
+        try:
+            texto = file_bytes.decode(encoding)
+            if not texto.isascii():
+                texto = remover_acentos(texto)
+            return texto, _corpo_como_ofxparse(texto)
+        except (UnicodeError, ValueError, LookupError, OFXNaoSuportado):
+            continue
+    raise OFXNaoSuportado("nenhuma codificação aceita")
+
+
+# ==============================================================================
+# LEITURA
+# ==============================================================================
+
+def _fechar_transacao(colunas: dict, transacao: dict):
+    for campo in _TRANSACAO_NAO_VAZIOS:
+        if transacao.get(campo) == '':
+            raise OFXNaoSuportado(f"<{campo}> vazio")
+    for campo in _TRANSACAO_OBRIGATORIOS:
+        if not transacao.get(campo):
+            raise OFXNaoSuportado(f"<{campo}> ausente")
+    for campo in CAMPOS_TRANSACAO:
+        colunas[campo].append(transacao.get(campo))
+
+
+def _validar_folha(tag: str, valor: str):
+    """Campos fora das transações que o ofxparse converte (e nos quais falharia)."""
+    if tag in _NAO_VAZIOS:
+        if valor == '':
+            raise OFXNaoSuportado(f"<{tag}> vazio")
+    elif tag in _DATAS:
+        data_hora_ofx(_texto(valor).strip())
+    elif tag == 'BALAMT':
+        decimal_ofx(_texto(valor))
+    elif tag == 'CODE':
+        int(_texto(valor).strip())
+
+
+def _tokenizar(corpo: str) -> list:
+    """Percorre as tags a partir de <OFX> e retorna as contas com as colunas brutas das transações."""
+    inicio = corpo.find('<OFX>')
+    if inicio < 0 or '</' in corpo[:inicio]:
+        raise OFXNaoSuportado("sem <OFX>")
+    trecho = corpo[inicio:]
+    tokens = _TAG.findall(trecho)
+    # Todo '<' deve abrir uma tag simples (sem <?...?>, <!-- -->, atributos ou <TAG/>)
+    if trecho.count('<') != len(tokens):
+        raise OFXNaoSuportado("marcação não suportada")
+    if not all(tag.isupper() for tag in {tag for _, tag, _ in tokens}):
+        raise OFXNaoSuportado("tags em minúsculas")
+    # Como no ofxparse: tag que nunca é fechada no arquivo é um elemento com valor (SGML)
+    fechadas = {tag for barra, tag, _ in tokens if barra}
+
+    contas = []
+    pilha = []
+    conta = transacao = None
+    marcas = []  # (tag, CODEs e SEVERITYs vistos até a abertura) de SONRS/STATUS
+    vistos = {'CODE': 0, 'SEVERITY': 0}
+    i, total = 0, len(tokens)
+    while i < total:
+        barra, tag, valor = tokens[i]
+        i += 1
+        if barra:
+            if not pilha or pilha[-1] != tag or valor.strip():
+                raise OFXNaoSuportado(f"</{tag}> fora de ordem")
+            pilha.pop()
+            if tag == 'STMTTRN':
+                _fechar_transacao(conta['colunas'], transacao)
+                transacao = None
+            elif tag == 'STMTRS':
+                conta = None
+            elif marcas and marcas[-1][0] == tag:
+                _, codigos, severidades = marcas.pop()
+                if vistos['CODE'] == codigos or (tag == 'STATUS' and vistos['SEVERITY'] == severidades):
+                    raise OFXNaoSuportado(f"<{tag}> incompleto")
+            continue
+
+        folha = tag not in fechadas
+        if not folha:
+            if i < total and tokens[i][0] and tokens[i][1] == tag:
+                # Elemento com fechamento (XML): <NAME>valor</NAME>
+                if tokens[i][2].strip():
+                    raise OFXNaoSuportado(f"texto após </{tag}>")
+                folha = True
+                i += 1
+            elif valor.strip():
+                raise OFXNaoSuportado(f"<{tag}> com valor e filhos")
+
+        if not folha:
+            if tag in AGREGADOS_NAO_SUPORTADOS:
+                raise OFXNaoSuportado(f"<{tag}>")
+            if tag == 'STMTRS':
+                if conta is not None:
+                    raise OFXNaoSuportado("<STMTRS> aninhado")
+                conta = {'colunas': {campo: [] for campo in CAMPOS_TRANSACAO}}
+                contas.append(conta)
+            elif tag == 'STMTTRN':
+                if conta is None or transacao is not None:
+                    raise OFXNaoSuportado("<STMTTRN> fora de <STMTRS>")
+                transacao = {}
+            elif tag in ('SONRS', 'STATUS'):
+                marcas.append((tag, vistos['CODE'], vistos['SEVERITY']))
+            pilha.append(tag)
+            continue
+
+        if tag in vistos:
+            vistos[tag] += 1
+        if conta is not None and tag in CAMPOS_CONTA and tag not in conta:
+            conta[tag] = valor
+        if transacao is not None:
+            if tag not in transacao:
+                transacao[tag] = valor
+        else:
+            _validar_folha(tag, valor)
+
+    if pilha or transacao is not None:
+        raise OFXNaoSuportado("arquivo incompleto")
+    if not contas:
+        raise OFXNaoSuportado("nenhum <STMTRS>")
+    return contas
+
+
+def _converter_conta(conta: dict) -> dict:
+    """Converte as colunas brutas de uma conta nos valores que o ofxparse produziria."""
+    colunas = conta['colunas']
+
+    def campo(valores):
+        return [_texto(v).strip() if v is not None else '' for v in valores]
+
+    tipos = [_texto(v).lower().strip() if v is not None else '' for v in colunas['TRNTYPE']]
+    nomes = campo(colunas['NAME'])
+    memos = campo(colunas['MEMO'])
+    datas = _por_valor_unico(campo(colunas['DTPOSTED']), data_hora_ofx)
+    # DTUSER não é usado, mas o ofxparse falha se for inválido
+    _por_valor_unico([v for v in campo(colunas['DTUSER']) if v], data_hora_ofx)
+    valores = _por_valor_unico([_texto(v) for v in colunas['TRNAMT']], _valor_transacao)
+
+    return {
+        'conta': _texto(conta.get('ACCTID', '')).strip(),
+        'banco': _texto(conta.get('BANKID', '')).strip(),
+        'agencia': _texto(conta.get('BRANCHID', '')).strip(),
+        'datas': datas,
+        'valores': valores,
+        'descricoes': [nome or memo or '' for nome, memo in zip(nomes, memos)],
+        'ids': campo(colunas['FITID']),
+        'tipos': tipos,
+    }
+
+
+def ler_ofx(file_bytes: bytes):
+    """
+    Lê o OFX em uma passada. Retorna (texto, contas) — texto decodificado e sem acentos, e para
+    cada <STMTRS> um dict com conta, banco, agencia e as colunas datas, valores, descricoes, ids e
+    tipos — ou None se o arquivo precisar do ofxparse.
+    """
+    try:
+        texto, corpo = decodificar_ofx(file_bytes)
+        return texto, [_converter_conta(conta) for conta in _tokenizar(corpo)]
+    except OFXNaoSuportado as e:
+        logger.debug("Usando ofxparse: %s", e)
+    except Exception as e:
+        # Valor que o ofxparse também rejeitaria (data, valor, código): ele reporta o erro
+        logger.debug("Usando ofxparse: %s: %s", type(e).__name__, e)
+    return None
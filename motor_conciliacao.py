@@ -0,0 +1,1362 @@
+# motor_conciliacao.py
+# Motor de conciliação extrato x contábil, independente do Streamlit e do banco de dados.
+# Inclui o cálculo vetorizado de saldos diários e da provisão de saldo negativo (seção 4).
+# Trabalha apenas sobre DataFrames; o progresso é reportado por um callback opcional
+# eventos(evento: dict) com as chaves 'evento', 'nivel' (write/info/success/warning) e 'mensagem',
+# além dos dados de cada evento. O adaptador Streamlit fica em conciliacao.py e a linha de comando em conciliacao_lote.py.
+import pandas as pd
+import numpy as np
+import multiprocessing
+import os
+import json
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import combinations
+
+from utils import remover_acentos
+
+
+# ==============================================================================
+# CONFIGURAÇÃO DE PASSAGENS DE CONCILIAÇÃO
+# ==============================================================================
+# Pipeline padrão. Pode ser substituído por empresa ou por conta contábil na tabela
+# passagens_conciliacao (ver montar_configuracao_passagens). 'tipo' escolhe a função em
+# TIPOS_PASSAGEM (padrão 'valor_data'); os demais campos são parâmetros da passagem.
+# Exemplo de passagem por número de documento:
+#   {'name': 'Passagem Documento', 'tipo': 'documento', 'tolerance': 0.00, 'date_tolerance_days': 10}
+# Exemplo de passagem por similaridade de texto (descrição x histórico):
+#   {'name': 'Passagem Texto', 'tipo': 'texto', 'tolerance': 0.00, 'date_tolerance_days': 5,
+#    'min_similaridade': 0.6, 'ngrama': 0}
+PASSAGES_CONFIG = [
+    # 1. Passagem Exata: Valor, Data e Conta Exatas
+    {'name': 'Passagem 1: Valor, Data e Conta EXATAS',
+     'tolerance': 0.00, 'date_tolerance_days': 0, 'use_value_key': False},
+
+    # 2. Passagem Tolerante: Valor Exato e Conta Exata (com Data +/- 1 dia)
+    {'name': 'Passagem 2: Valor Exato e Conta (Data ± 1 dia)',
+     'tolerance': 0.00, 'date_tolerance_days': 1, 'use_value_key': False},
+
+    # 3. Passagem Tolerante na Data: Valor e Conta (com Data +/- 5 dias)
+    {'name': 'Passagem 3: Valor Exato e Conta (Data ± 5 dias)',
+     'tolerance': 0.00, 'date_tolerance_days': 5, 'use_value_key': False},
+
+    # 4. Passagem de Tolerância de Valor: Data e Conta Exatas (Valor +/- 0.05)
+    {'name': 'Passagem 4: Data e Conta Exatas (Valor ± 0.05)',
+     'tolerance': 0.05, 'date_tolerance_days': 0, 'use_value_key': False},
+
+    # 5. Passagem Agregada: até 'max_itens' lançamentos de um lado somam 1 lançamento do outro
+    #    (ex.: tarifas agrupadas pelo banco). Roda por último, só sobre o que sobrou das passagens 1:1.
+    {'name': 'Passagem 5: Agregada N:1 / 1:N (Data ± 3 dias)', 'tipo': 'agregada',
+     'tolerance': 0.00, 'date_tolerance_days': 3, 'use_value_key': False,
+     'max_itens': 4, 'max_candidatos': 40},
+
+    # ... Adicione suas outras passagens aqui ...
+]
+
+# Palavras genéricas das descrições bancárias, ignoradas na passagem por texto (após normalização)
+PALAVRAS_IGNORADAS_TEXTO = frozenset({
+    'PIX', 'TED', 'DOC', 'TEF', 'TRANSF', 'TRANSFERENCIA', 'PAGTO', 'PAGAMENTO', 'PAG', 'PGTO',
+    'RECEBIDO', 'RECEBIDA', 'RECEBIMENTO', 'ENVIADO', 'ENVIADA', 'CREDITO', 'DEBITO', 'CRED', 'DEB',
+    'BOLETO', 'TITULO', 'REF', 'VALOR', 'CONTA', 'LTDA', 'EIRELI', 'DOS', 'DAS', 'PARA', 'COM',
+})
+
+# Motores de matching disponíveis:
+# - 'vetorizado': junção ordenada por conta/valor com searchsorted (padrão)
+# - 'linha_a_linha': implementação original com _find_match por linha (referência)
+MOTORES_CONCILIACAO = ('vetorizado', 'linha_a_linha')
+MOTOR_CONCILIACAO_PADRAO = 'vetorizado'
+
+# Execução paralela por conta: número de processos (1 = sequencial; 0 ou 'auto' = nº de CPUs).
+# Pode ser definido pela variável de ambiente CONCILIACAO_WORKERS.
+CONCILIACAO_WORKERS_ENV = 'CONCILIACAO_WORKERS'
+# Lotes por processo: contas são agrupadas em lotes de tamanho parecido para equilibrar a carga
+LOTES_POR_WORKER = 4
+
+# Callback de progresso: recebe um dict por evento (ver cabeçalho do módulo)
+Eventos = Optional[Callable[[dict], None]]
+
+
+def _emitir(eventos: Eventos, evento: str, nivel: str, mensagem: str, **dados) -> None:
+    """Envia um evento de progresso ao callback, se houver."""
+    if eventos is not None:
+        eventos({'evento': evento, 'nivel': nivel, 'mensagem': mensagem, **dados})
+
+
+# Registro de tipos de passagem: tipo -> função (df_ofx, df_contabil, pass_info, motor)
+# que retorna (df_ofx, df_contabil, métricas). Métricas: linhas_consideradas,
+# candidatos_avaliados e matches; o tempo de cada passagem é medido pelo pipeline.
+TIPO_PASSAGEM_PADRAO = 'valor_data'
+TIPOS_PASSAGEM = {}
+
+
+def registrar_tipo_passagem(tipo: str):
+    """Decorador que registra uma função de passagem em TIPOS_PASSAGEM."""
+    def decorador(func):
+        TIPOS_PASSAGEM[tipo] = func
+        return func
+    return decorador
+
+
+# ==============================================================================
+# 1. LÓGICA DE MATCHING (FUNÇÕES INTERNAS)
+# ==============================================================================
+
+def _find_match(row, df_contabil_helper, tolerance: float, date_tolerance_days: int) -> pd.Series:
+    """Função interna para encontrar uma única correspondência no extrato contábil."""
+
+    valor_match = -row['Valor']
+    conta_match = row['Conta_Contábil_Vinculada']
+    data_match = row['Data Lançamento']
+
+    df_filtered_conta = df_contabil_helper[df_contabil_helper['Conta Contábil'] == conta_match]
+
+    if df_filtered_conta.empty:
+        return pd.Series([False, None])
+
+    df_filtered_valor = df_filtered_conta[
+        (df_filtered_conta['Valor'].abs() >= abs(valor_match) - tolerance) &
+        (df_filtered_conta['Valor'].abs() <= abs(valor_match) + tolerance)
+        ].copy()
+
+    if df_filtered_valor.empty:
+        return pd.Series([False, None])
+
+    min_date = data_match - timedelta(days=date_tolerance_days)
+    max_date = data_match + timedelta(days=date_tolerance_days)
+
+    df_filtered_data = df_filtered_valor[
+        (df_filtered_valor['Data'] >= min_date) &
+        (df_filtered_valor['Data'] <= max_date)
+        ]
+
+    if df_filtered_data.empty:
+        return pd.Series([False, None])
+
+    if len(df_filtered_data) > 1:
+        df_filtered_data['diff_days'] = (df_filtered_data['Data'] - data_match).apply(lambda x: abs(x.days))
+        match = df_filtered_data.sort_values(by='diff_days').iloc[0]
+    else:
+        match = df_filtered_data.iloc[0]
+
+    return pd.Series([True, match['ID Contabil']])
+
+
+def _gerar_pares_candidatos(df_unmatched: pd.DataFrame, df_contabil_helper: pd.DataFrame, tolerance: float,
+                            date_tolerance_days: int) -> pd.DataFrame:
+    """
+    Gera, em um único passo vetorizado, todos os pares candidatos (extrato x contábil) de uma passagem.
+
+    Os lançamentos contábeis são ordenados por (Conta Contábil, |Valor|) e, para cada linha do extrato,
+    a faixa de valores aceitos é localizada com searchsorted. Os pares são expandidos em arrays e
+    filtrados pela janela de datas. Retorna as colunas pos_ofx/pos_cont (posições nos DataFrames de
+    entrada), diff_dias e diff_valor (em centavos).
+    """
+    pares_vazios = pd.DataFrame({col: pd.Series(dtype=np.int64)
+                                 for col in ['pos_ofx', 'pos_cont', 'diff_dias', 'diff_valor']})
+    if df_unmatched.empty or df_contabil_helper.empty:
+        return pares_vazios
+
+    # Contas codificadas em inteiros (mesma igualdade do filtro original; NaN fica -1 e nunca casa)
+    codigos, _ = pd.factorize(pd.concat([
+        df_unmatched['Conta_Contábil_Vinculada'], df_contabil_helper['Conta Contábil']
+    ], ignore_index=True))
+    # Linhas sem Valor ou sem Data nunca casam (como no _find_match): saem com conta -1 e valor/data zerados,
+    # para que NaN/NaT não virem inteiros inválidos na busca ordenada
+    valor_ofx = df_unmatched['Valor'].astype(float)
+    valor_cont = df_contabil_helper['Valor'].astype(float)
+    data_ofx = pd.to_datetime(df_unmatched['Data Lançamento'])
+    data_cont = pd.to_datetime(df_contabil_helper['Data'])
+    ok_ofx = (valor_ofx.notna() & data_ofx.notna()).to_numpy()
+    ok_cont = (valor_cont.notna() & data_cont.notna()).to_numpy()
+    conta_ofx = np.where(ok_ofx, codigos[:len(df_unmatched)], -1).astype(np.int64)
+    conta_cont = np.where(ok_cont, codigos[len(df_unmatched):], -1).astype(np.int64)
+
+    # Valores em centavos (abs) para a busca ordenada e datas em dias
+    abs_ofx = np.abs(valor_ofx.where(ok_ofx, 0.0).to_numpy())
+    abs_cont = np.abs(valor_cont.where(ok_cont, 0.0).to_numpy())
+    cent_ofx = np.rint(abs_ofx * 100).astype(np.int64)
+    cent_cont = np.rint(abs_cont * 100).astype(np.int64)
+    dia_ofx = np.where(ok_ofx, data_ofx.to_numpy().astype('datetime64[D]').astype(np.int64), 0)
+    dia_cont = np.where(ok_cont, data_cont.to_numpy().astype('datetime64[D]').astype(np.int64), 0)
+    # Faixa alargada em 1 centavo; o filtro exato (igual ao _find_match) é aplicado depois
+    tol_cent = int(round(tolerance * 100)) + 1
+
+    # Chave composta (conta, centavos) ordenável em um único int64
+    base = int(max(cent_ofx.max(), cent_cont.max())) + tol_cent + 1
+    chave_cont = conta_cont * base + cent_cont
+    ordem = np.argsort(chave_cont, kind='stable')
+    chave_ordenada = chave_cont[ordem]
+
+    validos = conta_ofx >= 0
+    lo = np.searchsorted(chave_ordenada, conta_ofx * base + np.maximum(cent_ofx - tol_cent, 0), side='left')
+    hi = np.searchsorted(chave_ordenada, conta_ofx * base + cent_ofx + tol_cent, side='right')
+    qtd = np.where(validos, hi - lo, 0)
+    if qtd.sum() == 0:
+        return pares_vazios
+
+    # Expande todos os pares candidatos (linha do extrato x posição no contábil ordenado)
+    pos_ofx = np.repeat(np.arange(len(df_unmatched)), qtd)
+    inicio_grupo = np.repeat(np.cumsum(qtd) - qtd, qtd)
+    pos_cont = ordem[np.repeat(lo, qtd) + (np.arange(qtd.sum()) - inicio_grupo)]
+
+    diff_dias = np.abs(dia_cont[pos_cont] - dia_ofx[pos_ofx])
+    na_janela = (
+        (diff_dias <= date_tolerance_days) & (conta_cont[pos_cont] >= 0) &
+        (abs_cont[pos_cont] >= abs_ofx[pos_ofx] - tolerance) &
+        (abs_cont[pos_cont] <= abs_ofx[pos_ofx] + tolerance)
+    )
+    pos_ofx, pos_cont = pos_ofx[na_janela], pos_cont[na_janela]
+
+    return pd.DataFrame({
+        'pos_ofx': pos_ofx,
+        'pos_cont': pos_cont,
+        'diff_dias': diff_dias[na_janela],
+        'diff_valor': np.abs(cent_cont[pos_cont] - cent_ofx[pos_ofx]),
+    })
+
+
+def _atribuir_pares_um_para_um(pares: pd.DataFrame, colunas_custo=('diff_dias', 'diff_valor')) -> pd.DataFrame:
+    """
+    Resolve conflitos entre pares candidatos com atribuição gulosa por custo.
+
+    Custo: colunas_custo (padrão diff_dias, diff_valor), com desempate pela ordem do extrato e depois do contábil.
+    Em cada rodada são aceitos os pares que são o melhor candidato tanto da sua linha do extrato
+    quanto do seu lançamento contábil; as linhas aceitas saem da disputa e a rodada se repete.
+    O resultado é idêntico ao guloso sequencial, mas cada rodada é vetorizada.
+    Garante que cada linha do extrato e cada ID Contabil apareçam no máximo uma vez.
+    """
+    if pares.empty:
+        return pares
+
+    restantes = pares.sort_values([*colunas_custo, 'pos_ofx', 'pos_cont'], kind='stable')
+    aceitos = []
+    while not restantes.empty:
+        melhor_ofx = ~restantes['pos_ofx'].duplicated()
+        melhor_cont = ~restantes['pos_cont'].duplicated()
+        rodada = restantes[melhor_ofx & melhor_cont]
+        aceitos.append(rodada)
+        restantes = restantes[
+            ~restantes['pos_ofx'].isin(rodada['pos_ofx']) & ~restantes['pos_cont'].isin(rodada['pos_cont'])
+        ]
+
+    return pd.concat(aceitos).sort_values('pos_ofx')
+
+
+def _find_matches_vetorizado(df_unmatched: pd.DataFrame, df_contabil_helper: pd.DataFrame, tolerance: float,
+                             date_tolerance_days: int) -> Tuple[pd.DataFrame, int]:
+    """
+    Versão vetorizada de _find_match: gera os pares candidatos e aplica a atribuição 1:1.
+    Retorna (resultados, quantidade de pares candidatos avaliados).
+    """
+    results = pd.DataFrame({'Match_Found': False, 'Matched_ID': np.nan}, index=df_unmatched.index)
+
+    pares = _gerar_pares_candidatos(df_unmatched, df_contabil_helper, tolerance, date_tolerance_days)
+    candidatos = len(pares)
+    pares = _atribuir_pares_um_para_um(pares)
+    if pares.empty:
+        return results, candidatos
+
+    indices = df_unmatched.index[pares['pos_ofx'].to_numpy()]
+    results.loc[indices, 'Match_Found'] = True
+    results.loc[indices, 'Matched_ID'] = df_contabil_helper['ID Contabil'].to_numpy()[pares['pos_cont'].to_numpy()]
+    return results, candidatos
+
+
+def _marcar_matches(df_ofx, df_contabil_raw, indices_ofx, ids_contabil, nome_passagem: str) -> None:
+    """Marca os pares 1:1 encontrados em uma passagem nos dois DataFrames."""
+    # Marca no DF OFX
+    df_ofx.loc[indices_ofx, 'Conciliado_Contábil'] = 'Sim'
+    df_ofx.loc[indices_ofx, 'ID_Contabil_Conciliado'] = np.asarray(ids_contabil, dtype=float)
+    df_ofx.loc[indices_ofx, 'Passagem_Conciliacao'] = nome_passagem
+
+    # Marca no DF Contábil
+    df_contabil_raw.loc[
+        df_contabil_raw['ID Contabil'].isin(np.asarray(ids_contabil).astype(int)),
+        'Conciliado_OFX'
+    ] = 'Sim'
+
+
+@registrar_tipo_passagem('valor_data')
+def _executar_passagem(df_ofx, df_contabil_raw, pass_info: dict,
+                      motor: str = MOTOR_CONCILIACAO_PADRAO) -> Tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """Executa uma passagem por valor, data e conta (cada ID Contabil é usado no máximo uma vez)."""
+
+    df_unmatched = df_ofx[df_ofx['Conciliado_Contábil'] == 'Não'].copy()
+    # Apenas as transações contábeis ainda não conciliadas (inclusive nas passagens anteriores)
+    df_contabil_helper = df_contabil_raw[df_contabil_raw['Conciliado_OFX'] == 'Não']
+    metricas = {'linhas_consideradas': len(df_unmatched), 'candidatos_avaliados': 0, 'matches': 0}
+
+    if df_unmatched.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    if motor == 'vetorizado':
+        results, metricas['candidatos_avaliados'] = _find_matches_vetorizado(
+            df_unmatched, df_contabil_helper, pass_info['tolerance'], pass_info['date_tolerance_days']
+        )
+    else:
+        # O motor linha a linha compara cada linha do extrato com todo o contábil pendente
+        metricas['candidatos_avaliados'] = len(df_unmatched) * len(df_contabil_helper)
+        results = df_unmatched.apply(
+            lambda row: _find_match(row, df_contabil_helper, pass_info['tolerance'], pass_info['date_tolerance_days']),
+            axis=1,
+            result_type='expand'
+        )
+        results.columns = ['Match_Found', 'Matched_ID']
+        # O motor linha a linha não faz atribuição: a primeira linha do extrato fica com o ID
+        disputados = results['Match_Found'].astype(bool) & results['Matched_ID'].duplicated()
+        results.loc[disputados, ['Match_Found', 'Matched_ID']] = [False, np.nan]
+    results['Match_Found'] = results['Match_Found'].astype(bool)
+
+    matched_ofx_indices = results[results['Match_Found']].index
+    matched_contabil_ids = results[results['Match_Found']]['Matched_ID'].astype(int)
+
+    if matched_ofx_indices.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    _marcar_matches(df_ofx, df_contabil_raw, matched_ofx_indices, matched_contabil_ids, pass_info['name'])
+
+    metricas['matches'] = len(matched_ofx_indices)
+    return df_ofx, df_contabil_raw, metricas
+
+
+def _codigos_conta(pend_ofx: pd.DataFrame, pend_cont: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Contas dos dois lados codificadas nos mesmos inteiros (NaN fica -1 e nunca casa)."""
+    codigos, _ = pd.factorize(pd.concat([
+        pend_ofx['Conta_Contábil_Vinculada'], pend_cont['Conta Contábil']
+    ], ignore_index=True))
+    return codigos[:len(pend_ofx)], codigos[len(pend_ofx):]
+
+
+def _filtrar_janela(pend_ofx: pd.DataFrame, pend_cont: pd.DataFrame, pares: pd.DataFrame,
+                    pass_info: dict) -> pd.DataFrame:
+    """
+    Mantém os pares candidatos (pos_ofx/pos_cont) com valor e data dentro das tolerâncias da
+    passagem e acrescenta diff_dias e diff_valor (em centavos). Demais colunas são preservadas.
+    """
+    pos_ofx = pares['pos_ofx'].to_numpy()
+    pos_cont = pares['pos_cont'].to_numpy()
+    abs_ofx = np.abs(pend_ofx['Valor'].astype(float).to_numpy())[pos_ofx]
+    abs_cont = np.abs(pend_cont['Valor'].astype(float).to_numpy())[pos_cont]
+    dia_ofx = pd.to_datetime(pend_ofx['Data Lançamento']).to_numpy().astype('datetime64[D]').astype(np.int64)[pos_ofx]
+    dia_cont = pd.to_datetime(pend_cont['Data']).to_numpy().astype('datetime64[D]').astype(np.int64)[pos_cont]
+    tolerance = pass_info.get('tolerance', 0.0)
+    diff_dias = np.abs(dia_cont - dia_ofx)
+    na_janela = (
+        (diff_dias <= pass_info.get('date_tolerance_days', 0)) &
+        (abs_cont >= abs_ofx - tolerance) & (abs_cont <= abs_ofx + tolerance)
+    )
+    pares = pares[na_janela].reset_index(drop=True)
+    pares['diff_dias'] = diff_dias[na_janela]
+    pares['diff_valor'] = np.abs(np.rint(abs_cont * 100) - np.rint(abs_ofx * 100)).astype(np.int64)[na_janela]
+    return pares
+
+
+def _tokens_documento(textos: pd.Series, min_digitos: int) -> pd.Series:
+    """Extrai os números de documento (sequências de dígitos, sem zeros à esquerda) de cada texto."""
+    tokens = textos.fillna('').astype(str).str.findall(rf'\d{{{min_digitos},}}').explode()
+    tokens = tokens.dropna().str.lstrip('0')
+    return tokens[tokens != '']
+
+
+@registrar_tipo_passagem('documento')
+def _executar_passagem_documento(df_ofx, df_contabil_raw, pass_info: dict,
+                                 motor: str = MOTOR_CONCILIACAO_PADRAO) -> Tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """
+    Passagem por número de documento: casa linhas da mesma conta que compartilham um número
+    (cheque, DOC, boleto...) entre a descrição/ID do extrato e o histórico contábil, com valor
+    e data dentro das tolerâncias. Números muito repetidos (ex.: anos) são ignorados.
+    """
+
+    pend_ofx = df_ofx[df_ofx['Conciliado_Contábil'] == 'Não']
+    pend_cont = df_contabil_raw[df_contabil_raw['Conciliado_OFX'] == 'Não']
+    metricas = {'linhas_consideradas': len(pend_ofx), 'candidatos_avaliados': 0, 'matches': 0}
+
+    cols_ofx = [c for c in pass_info.get('colunas_extrato', ['Descrição', 'ID Transacao']) if c in pend_ofx.columns]
+    cols_cont = [c for c in pass_info.get('colunas_contabil', ['Historico', 'Histórico']) if c in pend_cont.columns]
+    if pend_ofx.empty or pend_cont.empty or not cols_ofx or not cols_cont:
+        return df_ofx, df_contabil_raw, metricas
+
+    min_digitos = pass_info.get('min_digitos', 4)
+    max_ocorrencias = pass_info.get('max_ocorrencias', 20)
+
+    conta_ofx, conta_cont = _codigos_conta(pend_ofx, pend_cont)
+
+    def _tabela_tokens(df, colunas, contas):
+        texto = df[colunas].fillna('').astype(str).agg(' '.join, axis=1).reset_index(drop=True)
+        tokens = _tokens_documento(texto, min_digitos)
+        tabela = pd.DataFrame({'pos': tokens.index.to_numpy(), 'token': tokens.to_numpy()})
+        tabela['conta'] = contas[tabela['pos'].to_numpy()]
+        tabela = tabela[tabela['conta'] >= 0].drop_duplicates(['pos', 'token'])
+        # Poda: números presentes em muitas linhas da conta não identificam documento
+        frequencia = tabela.groupby(['conta', 'token'])['pos'].transform('size')
+        return tabela[frequencia <= max_ocorrencias]
+
+    tok_ofx = _tabela_tokens(pend_ofx, cols_ofx, conta_ofx)
+    tok_cont = _tabela_tokens(pend_cont, cols_cont, conta_cont)
+    pares = tok_ofx.merge(tok_cont, on=['conta', 'token'], suffixes=('_ofx', '_cont'))
+    pares = pares.drop_duplicates(['pos_ofx', 'pos_cont'])
+    metricas['candidatos_avaliados'] = len(pares)
+    if pares.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    pares = _filtrar_janela(pend_ofx, pend_cont, pares, pass_info)
+    pares = _atribuir_pares_um_para_um(pares)
+    if pares.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    indices_ofx = pend_ofx.index[pares['pos_ofx'].to_numpy()]
+    ids_contabil = pend_cont['ID Contabil'].to_numpy()[pares['pos_cont'].to_numpy()]
+    _marcar_matches(df_ofx, df_contabil_raw, indices_ofx, ids_contabil, pass_info['name'])
+
+    metricas['matches'] = len(indices_ofx)
+    return df_ofx, df_contabil_raw, metricas
+
+
+def _normalizar_textos(textos: pd.Series) -> pd.Series:
+    """Caixa alta, sem acentos e só letras/dígitos separados por espaço (cada texto distinto é tratado uma vez)."""
+    textos = textos.fillna('').astype(str)
+    unicos = pd.Series(textos.unique())
+    normalizados = (
+        unicos.map(remover_acentos).str.upper()
+        .str.replace(r'[^A-Z0-9]+', ' ', regex=True).str.strip()
+    )
+    return textos.map(dict(zip(unicos, normalizados)))
+
+
+def _tokens_texto(textos: pd.Series, min_caracteres: int, ngrama: int, ignorar) -> pd.Series:
+    """
+    Tokens de cada texto normalizado (índice = posição do texto). Com ngrama > 0, cada palavra
+    vira seus n-gramas de caracteres, o que tolera nomes truncados ou abreviados pelo banco.
+    """
+    tokens = _normalizar_textos(textos).str.split().explode().dropna()
+    tokens = tokens[(tokens.str.len() >= min_caracteres) & ~tokens.isin(ignorar)]
+    if ngrama and not tokens.empty:
+        gramas = {t: [t[i:i + ngrama] for i in range(max(len(t) - ngrama + 1, 1))] for t in tokens.unique()}
+        tokens = tokens.map(gramas).explode()
+    return tokens
+
+
+@registrar_tipo_passagem('texto')
+def _executar_passagem_texto(df_ofx, df_contabil_raw, pass_info: dict,
+                             motor: str = MOTOR_CONCILIACAO_PADRAO) -> Tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """
+    Passagem por similaridade de texto: casa linhas da mesma conta cuja descrição do extrato e
+    histórico contábil são parecidos (nome do pagador de PIX, número de boleto...), com valor e
+    data dentro das tolerâncias.
+
+    Os textos são normalizados uma vez e indexados por (conta, token); só os pares que dividem
+    algum token viram candidatos, e tokens presentes em mais de max_ocorrencias linhas da conta
+    são descartados do índice, o que limita o número de candidatos. A nota é o cosseno entre os
+    vetores de tokens com peso IDF da conta; pares com nota >= min_similaridade são atribuídos
+    1:1 pela maior nota e depois pela menor diferença de data/valor.
+    """
+
+    pend_ofx = df_ofx[df_ofx['Conciliado_Contábil'] == 'Não']
+    pend_cont = df_contabil_raw[df_contabil_raw['Conciliado_OFX'] == 'Não']
+    metricas = {'linhas_consideradas': len(pend_ofx), 'candidatos_avaliados': 0, 'matches': 0}
+
+    cols_ofx = [c for c in pass_info.get('colunas_extrato', ['Descrição']) if c in pend_ofx.columns]
+    cols_cont = [c for c in pass_info.get('colunas_contabil', ['Historico', 'Histórico']) if c in pend_cont.columns]
+    if pend_ofx.empty or pend_cont.empty or not cols_ofx or not cols_cont:
+        return df_ofx, df_contabil_raw, metricas
+
+    min_similaridade = pass_info.get('min_similaridade', 0.6)
+    max_ocorrencias = pass_info.get('max_ocorrencias', 40)
+    min_caracteres = pass_info.get('min_caracteres', 3)
+    ngrama = pass_info.get('ngrama', 0)
+    ignorar = set(pass_info.get('ignorar', PALAVRAS_IGNORADAS_TEXTO))
+
+    conta_ofx, conta_cont = _codigos_conta(pend_ofx, pend_cont)
+
+    def _tabela_tokens(df, colunas, contas):
+        texto = df[colunas].fillna('').astype(str).agg(' '.join, axis=1).reset_index(drop=True)
+        tokens = _tokens_texto(texto, min_caracteres, ngrama, ignorar)
+        tabela = pd.DataFrame({'pos': tokens.index.to_numpy(), 'token': tokens.to_numpy()})
+        tabela['conta'] = contas[tabela['pos'].to_numpy()]
+        return tabela[tabela['conta'] >= 0].drop_duplicates(['pos', 'token'])
+
+    tok_ofx = _tabela_tokens(pend_ofx, cols_ofx, conta_ofx)
+    tok_cont = _tabela_tokens(pend_cont, cols_cont, conta_cont)
+    if tok_ofx.empty or tok_cont.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    # Peso IDF por conta: log(1 + linhas da conta / linhas com o token), somando os dois lados
+    linhas_conta = pd.Series(np.concatenate([conta_ofx, conta_cont])).value_counts()
+    frequencia = pd.concat([tok_ofx, tok_cont]).groupby(['conta', 'token']).size().rename('freq').reset_index()
+
+    def _pesar(tabela):
+        tabela = tabela.merge(frequencia, on=['conta', 'token'])
+        tabela['peso'] = np.log1p(tabela['conta'].map(linhas_conta).to_numpy() / tabela['freq'].to_numpy())
+        norma = np.sqrt((tabela['peso'] ** 2).groupby(tabela['pos']).sum())
+        # Poda: tokens muito frequentes na conta contam na norma, mas não geram candidatos
+        return tabela[tabela['freq'] <= max_ocorrencias], norma
+
+    tok_ofx, norma_ofx = _pesar(tok_ofx)
+    tok_cont, norma_cont = _pesar(tok_cont)
+    pares = tok_ofx.merge(tok_cont[['conta', 'token', 'pos']], on=['conta', 'token'], suffixes=('_ofx', '_cont'))
+    if pares.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    pares['produto'] = pares['peso'] ** 2
+    pares = pares.groupby(['pos_ofx', 'pos_cont'], sort=False)['produto'].sum().reset_index()
+    metricas['candidatos_avaliados'] = len(pares)
+    pares['similaridade'] = pares['produto'].to_numpy() / (
+        norma_ofx.reindex(pares['pos_ofx']).to_numpy() * norma_cont.reindex(pares['pos_cont']).to_numpy()
+    )
+    pares = pares[pares['similaridade'] >= min_similaridade]
+    if pares.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    pares = _filtrar_janela(pend_ofx, pend_cont, pares, pass_info)
+    # Maior nota primeiro (em milésimos, para empates estáveis), depois data e valor mais próximos
+    pares['custo_texto'] = -np.rint(pares['similaridade'].to_numpy() * 1000).astype(np.int64)
+    pares = _atribuir_pares_um_para_um(pares, ('custo_texto', 'diff_dias', 'diff_valor'))
+    if pares.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    indices_ofx = pend_ofx.index[pares['pos_ofx'].to_numpy()]
+    ids_contabil = pend_cont['ID Contabil'].to_numpy()[pares['pos_cont'].to_numpy()]
+    _marcar_matches(df_ofx, df_contabil_raw, indices_ofx, ids_contabil, pass_info['name'])
+
+    metricas['matches'] = len(indices_ofx)
+    return df_ofx, df_contabil_raw, metricas
+
+
+@lru_cache(maxsize=None)
+def _tabela_subconjuntos(n: int, max_itens: int) -> np.ndarray:
+    """Matriz booleana (subconjuntos x n) com todos os subconjuntos de 0 a max_itens elementos."""
+    linhas = [np.zeros(n, dtype=bool)]
+    for k in range(1, min(n, max_itens) + 1):
+        for combo in combinations(range(n), k):
+            linha = np.zeros(n, dtype=bool)
+            linha[list(combo)] = True
+            linhas.append(linha)
+    return np.array(linhas, dtype=bool).reshape(len(linhas), n)
+
+
+@lru_cache(maxsize=None)
+def _tabela_subconjuntos_int(n: int, max_itens: int) -> np.ndarray:
+    """Mesma tabela de _tabela_subconjuntos em int64 (para somas por produto matricial)."""
+    return _tabela_subconjuntos(n, max_itens).astype(np.int64)
+
+
+def _buscar_subconjunto(centavos: np.ndarray, custos: np.ndarray, alvo: int, tol_cent: int,
+                        max_itens: int):
+    """
+    Busca meet-in-the-middle limitada: encontra 2..max_itens itens cuja soma (em centavos) fica a até
+    tol_cent do alvo. Os itens são ordenados por valor e divididos em duas metades; as somas de uma
+    metade são ordenadas e a metade complementar é localizada com searchsorted.
+    Entre as soluções, prefere menos itens e depois menor distância total de datas (custos).
+    Retorna (posições escolhidas em centavos ou None, quantidade de subconjuntos avaliados).
+    """
+    n = len(centavos)
+    ordem = np.argsort(centavos, kind='stable')
+    valores = centavos[ordem]
+    custos = custos[ordem]
+
+    # Poda pelos extremos: nem os 2 menores cabem, ou nem os maiores alcançam o alvo
+    if n < 2 or valores[:2].sum() > alvo + tol_cent or valores[-max_itens:].sum() < alvo - tol_cent:
+        return None, 0
+
+    meio_a, meio_b = np.arange(0, n, 2), np.arange(1, n, 2)
+    mask_a = _tabela_subconjuntos(len(meio_a), max_itens)
+    mask_b = _tabela_subconjuntos(len(meio_b), max_itens)
+    soma_a = _tabela_subconjuntos_int(len(meio_a), max_itens) @ valores[meio_a]
+    soma_b = _tabela_subconjuntos_int(len(meio_b), max_itens) @ valores[meio_b]
+    avaliados = len(soma_a) + len(soma_b)
+
+    # Poda por valor: metades que já passam do alvo não participam
+    usar_a = np.flatnonzero(soma_a <= alvo + tol_cent)
+    usar_b = np.flatnonzero(soma_b <= alvo + tol_cent)
+    ordem_b = usar_b[np.argsort(soma_b[usar_b], kind='stable')]
+    soma_b_ord = soma_b[ordem_b]
+
+    lo = np.searchsorted(soma_b_ord, alvo - tol_cent - soma_a[usar_a], side='left')
+    hi = np.searchsorted(soma_b_ord, alvo + tol_cent - soma_a[usar_a], side='right')
+    qtd = hi - lo
+    if qtd.sum() == 0:
+        return None, avaliados
+
+    ia = np.repeat(usar_a, qtd)
+    inicio_grupo = np.repeat(np.cumsum(qtd) - qtd, qtd)
+    ib = ordem_b[np.repeat(lo, qtd) + (np.arange(qtd.sum()) - inicio_grupo)]
+
+    tamanho = mask_a[ia].sum(axis=1) + mask_b[ib].sum(axis=1)
+    validos = np.flatnonzero((tamanho >= 2) & (tamanho <= max_itens))
+    if validos.size == 0:
+        return None, avaliados
+
+    ia, ib, tamanho = ia[validos], ib[validos], tamanho[validos]
+    custo = mask_a[ia].astype(np.int64) @ custos[meio_a] + mask_b[ib].astype(np.int64) @ custos[meio_b]
+    melhor = np.lexsort((custo, tamanho))[0]
+    escolhidos = np.concatenate([meio_a[mask_a[ia[melhor]]], meio_b[mask_b[ib[melhor]]]])
+    return np.sort(ordem[escolhidos]), avaliados
+
+
+def _agrupar_por_soma(alvo_conta, alvo_dia, alvo_cent, alvo_usado,
+                      item_conta, item_dia, item_cent, item_usado,
+                      tol_cent: int, date_tolerance_days: int, max_itens: int, max_candidatos: int) -> list:
+    """
+    Para cada alvo (em ordem de data), procura itens da mesma conta dentro da janela de datas
+    cuja soma seja igual ao valor do alvo. Marca alvo_usado/item_usado e retorna
+    ([(pos_alvo, pos_itens)], quantidade de subconjuntos avaliados).
+    """
+    grupos = []
+    avaliados = 0
+    if len(alvo_cent) == 0 or len(item_cent) == 0:
+        return grupos, avaliados
+
+    # Itens ordenados por (conta, dia) em uma chave int64; a janela vira uma faixa contígua
+    dia_min = min(alvo_dia.min(), item_dia.min())
+    span = int(max(alvo_dia.max(), item_dia.max()) - dia_min) + 2 * date_tolerance_days + 2
+    chave_item = item_conta * span + (item_dia - dia_min)
+    ordem_item = np.argsort(chave_item, kind='stable')
+    chave_ordenada = chave_item[ordem_item]
+
+    for t in np.lexsort((np.arange(len(alvo_dia)), alvo_dia)):
+        if alvo_usado[t] or alvo_conta[t] < 0:
+            continue
+        base = alvo_conta[t] * span + (alvo_dia[t] - dia_min)
+        lo = np.searchsorted(chave_ordenada, base - date_tolerance_days, side='left')
+        hi = np.searchsorted(chave_ordenada, base + date_tolerance_days, side='right')
+        candidatos = ordem_item[lo:hi]
+        candidatos = candidatos[
+            ~item_usado[candidatos] & (item_cent[candidatos] > 0) & (item_cent[candidatos] <= alvo_cent[t] + tol_cent)
+        ]
+        if len(candidatos) < 2:
+            continue
+
+        dist = np.abs(item_dia[candidatos] - alvo_dia[t])
+        if len(candidatos) > max_candidatos:
+            mais_proximos = np.argsort(dist, kind='stable')[:max_candidatos]
+            candidatos, dist = candidatos[mais_proximos], dist[mais_proximos]
+
+        selecao, qtd_avaliada = _buscar_subconjunto(item_cent[candidatos], dist, int(alvo_cent[t]), tol_cent, max_itens)
+        avaliados += qtd_avaliada
+        if selecao is None:
+            continue
+
+        escolhidos = candidatos[selecao]
+        alvo_usado[t] = True
+        item_usado[escolhidos] = True
+        grupos.append((t, escolhidos))
+    return grupos, avaliados
+
+
+def _ultimo_numero_grupo(*grupos: pd.Series) -> int:
+    """Maior número já usado nos rótulos AGR-nnnnn (0 se não houver)."""
+    numeros = [
+        pd.to_numeric(g.dropna().astype(str).str.extract(r'^AGR-(\d+)$')[0], errors='coerce').max()
+        for g in grupos
+    ]
+    numeros = [n for n in numeros if pd.notna(n)]
+    return int(max(numeros)) if numeros else 0
+
+@registrar_tipo_passagem('agregada')
+def _executar_passagem_agregada(df_ofx, df_contabil_raw, pass_info: dict,
+                                motor: str = MOTOR_CONCILIACAO_PADRAO) -> Tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """
+    Passagem agregada (N:1 e 1:N): um lançamento de um lado casa com a soma de vários do outro.
+    Primeiro 1 linha do extrato x N lançamentos contábeis (mesmo sinal); depois N linhas do extrato
+    (mesmo sinal) x 1 lançamento contábil. Os membros de cada grupo recebem o mesmo Grupo_Conciliacao.
+    """
+
+    pend_ofx = df_ofx[df_ofx['Conciliado_Contábil'] == 'Não']
+    pend_cont = df_contabil_raw[df_contabil_raw['Conciliado_OFX'] == 'Não']
+    metricas = {'linhas_consideradas': len(pend_ofx), 'candidatos_avaliados': 0, 'matches': 0}
+    if pend_ofx.empty or pend_cont.empty:
+        return df_ofx, df_contabil_raw, metricas
+
+    # Mesmas codificações do motor vetorizado (contas inteiras, centavos, dias)
+    codigos, _ = pd.factorize(pd.concat([
+        pend_ofx['Conta_Contábil_Vinculada'], pend_cont['Conta Contábil']
+    ], ignore_index=True))
+    valor_ofx = pend_ofx['Valor'].astype(float).to_numpy()
+    valor_cont = pend_cont['Valor'].astype(float).to_numpy()
+    data_ofx = pd.to_datetime(pend_ofx['Data Lançamento'], errors='coerce')
+    data_cont = pd.to_datetime(pend_cont['Data'], errors='coerce')
+    # Linhas sem Valor ou sem Data ficam fora da passagem: conta -1 e valor/data zerados antes da conversão
+    ok_ofx = ~np.isnan(valor_ofx) & data_ofx.notna().to_numpy()
+    ok_cont = ~np.isnan(valor_cont) & data_cont.notna().to_numpy()
+    conta_ofx = np.where(ok_ofx, codigos[:len(pend_ofx)], -1).astype(np.int64)
+    conta_cont = np.where(ok_cont, codigos[len(pend_ofx):], -1).astype(np.int64)
+    valor_ofx = np.where(ok_ofx, valor_ofx, 0.0)
+    valor_cont = np.where(ok_cont, valor_cont, 0.0)
+    cent_ofx = np.rint(np.abs(valor_ofx) * 100).astype(np.int64)
+    cent_cont = np.rint(np.abs(valor_cont) * 100).astype(np.int64)
+    dia_ofx = np.where(ok_ofx, data_ofx.to_numpy().astype('datetime64[D]').astype(np.int64), 0)
+    dia_cont = np.where(ok_cont, data_cont.to_numpy().astype('datetime64[D]').astype(np.int64), 0)
+
+    ofx_usado = conta_ofx < 0
+    cont_usado = conta_cont < 0
+    tol_cent = int(round(pass_info['tolerance'] * 100))
+    params = (tol_cent, pass_info['date_tolerance_days'], pass_info.get('max_itens', 4),
+              pass_info.get('max_candidatos', 40))
+
+    # 1:N -> alvo é a linha do extrato, itens são lançamentos contábeis de mesmo sinal
+    grupos_1n = []
+    for sinal in (True, False):
+        fora_do_sinal = (valor_cont < 0) != sinal
+        usado_sinal = cont_usado | fora_do_sinal
+        grupos_sinal, avaliados = _agrupar_por_soma(conta_ofx, dia_ofx, cent_ofx, ofx_usado,
+                                                    conta_cont, dia_cont, cent_cont, usado_sinal, *params)
+        metricas['candidatos_avaliados'] += avaliados
+        cont_usado |= usado_sinal & ~fora_do_sinal
+        grupos_1n.extend(grupos_sinal)
+
+    # N:1 -> alvo é o lançamento contábil, itens são linhas do extrato de mesmo sinal
+    grupos_n1 = []
+    for sinal in (True, False):
+        fora_do_sinal = (valor_ofx < 0) != sinal
+        usado_sinal = ofx_usado | fora_do_sinal
+        grupos_sinal, avaliados = _agrupar_por_soma(conta_cont, dia_cont, cent_cont, cont_usado,
+                                                    conta_ofx, dia_ofx, cent_ofx, usado_sinal, *params)
+        metricas['candidatos_avaliados'] += avaliados
+        ofx_usado |= usado_sinal & ~fora_do_sinal
+        grupos_n1.extend(grupos_sinal)
+
+    if not grupos_1n and not grupos_n1:
+        return df_ofx, df_contabil_raw, metricas
+
+    # Monta as marcações de todos os grupos e aplica de uma vez
+    ids_cont = pend_cont['ID Contabil'].to_numpy()
+    numero = _ultimo_numero_grupo(df_ofx['Grupo_Conciliacao'], df_contabil_raw['Grupo_Conciliacao'])
+    pos_ofx_marcar, id_ofx_marcar, grupo_ofx = [], [], []
+    pos_cont_marcar, grupo_cont = [], []
+    for pos_ofx, pos_itens in grupos_1n:
+        numero += 1
+        grupo = f"AGR-{numero:05d}"
+        pos_ofx_marcar.append(pos_ofx)
+        id_ofx_marcar.append(ids_cont[pos_itens].min())
+        grupo_ofx.append(grupo)
+        pos_cont_marcar.extend(pos_itens)
+        grupo_cont.extend([grupo] * len(pos_itens))
+    for pos_cont, pos_itens in grupos_n1:
+        numero += 1
+        grupo = f"AGR-{numero:05d}"
+        pos_ofx_marcar.extend(pos_itens)
+        id_ofx_marcar.extend([ids_cont[pos_cont]] * len(pos_itens))
+        grupo_ofx.extend([grupo] * len(pos_itens))
+        pos_cont_marcar.append(pos_cont)
+        grupo_cont.append(grupo)
+
+    idx_ofx = pend_ofx.index[pos_ofx_marcar]
+    df_ofx.loc[idx_ofx, 'Conciliado_Contábil'] = 'Sim'
+    df_ofx.loc[idx_ofx, 'ID_Contabil_Conciliado'] = np.asarray(id_ofx_marcar, dtype=float)
+    df_ofx.loc[idx_ofx, 'Passagem_Conciliacao'] = pass_info['name']
+    df_ofx.loc[idx_ofx, 'Grupo_Conciliacao'] = grupo_ofx
+    idx_cont = pend_cont.index[pos_cont_marcar]
+    df_contabil_raw.loc[idx_cont, 'Conciliado_OFX'] = 'Sim'
+    df_contabil_raw.loc[idx_cont, 'Grupo_Conciliacao'] = grupo_cont
+
+    metricas['matches'] = len(idx_ofx)
+    return df_ofx, df_contabil_raw, metricas
+
+# ==============================================================================
+# 2. PIPELINE DE PASSAGENS
+# ==============================================================================
+
+def _preparar_controle(df_extrato_vinculado: pd.DataFrame, df_contabil: pd.DataFrame,
+                       resetar: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Copia os DataFrames de entrada e adiciona as colunas de controle da conciliação."""
+    df_ofx_conc = df_extrato_vinculado.copy()
+    df_contabil_conc = df_contabil.copy()
+
+    # Adiciona colunas de controle
+    if resetar or 'Conciliado_Contábil' not in df_ofx_conc.columns:
+        df_ofx_conc['Conciliado_Contábil'] = 'Não'
+        df_ofx_conc['ID_Contabil_Conciliado'] = np.nan
+        df_ofx_conc['Passagem_Conciliacao'] = 'N/A'
+
+    if resetar or 'Conciliado_OFX' not in df_contabil_conc.columns:
+        df_contabil_conc['Conciliado_OFX'] = 'Não'
+
+    # Grupo da passagem agregada (N:1 / 1:N); vazio nos matches 1:1
+    for df in (df_ofx_conc, df_contabil_conc):
+        if resetar or 'Grupo_Conciliacao' not in df.columns:
+            df['Grupo_Conciliacao'] = None
+
+    # Garante que ID Contabil seja numérico e único
+    df_contabil_conc['ID Contabil'] = df_contabil_conc['ID Contabil'].fillna(
+        pd.Series(range(1, len(df_contabil_conc) + 1))
+    ).astype(int)
+
+    return df_ofx_conc, df_contabil_conc
+
+def _chave_conta(conta) -> str:
+    """Normaliza o código da conta contábil para comparar com a configuração ('123.0' -> '123')."""
+    texto = str(conta).strip()
+    return texto[:-2] if texto.endswith('.0') else texto
+
+def _validar_passagem(pass_info: dict) -> None:
+    """Garante que a passagem tem nome e um tipo registrado em TIPOS_PASSAGEM."""
+    tipo = pass_info.get('tipo', TIPO_PASSAGEM_PADRAO)
+    if tipo not in TIPOS_PASSAGEM:
+        raise ValueError(f"Tipo de passagem inválido: {tipo}. Opções: {sorted(TIPOS_PASSAGEM)}")
+    if not pass_info.get('name'):
+        raise ValueError("Toda passagem precisa de um nome ('name').")
+
+def montar_configuracao_passagens(df_config: pd.DataFrame) -> dict:
+    """
+    Monta a configuração de passagens a partir das linhas de passagens_conciliacao:
+    {'padrao': [passagens da empresa], 'por_conta': {conta contábil: [passagens]}}.
+    Sem passagens cadastradas para a empresa, o padrão é PASSAGES_CONFIG.
+    """
+    configuracao = {'padrao': list(PASSAGES_CONFIG), 'por_conta': {}}
+    if df_config is None or df_config.empty:
+        return configuracao
+
+    escopo = df_config['conta_contabil'].fillna('').astype(str).str.strip()
+    for conta, grupo in df_config.groupby(escopo, sort=False):
+        passagens = []
+        for linha in grupo.sort_values('ordem', kind='stable').itertuples(index=False):
+            pass_info = {'name': linha.nome, 'tipo': linha.tipo, 'tolerance': 0.0, 'date_tolerance_days': 0}
+            pass_info.update(json.loads(linha.parametros) if linha.parametros else {})
+            _validar_passagem(pass_info)
+            passagens.append(pass_info)
+        if conta == '':
+            configuracao['padrao'] = passagens
+        else:
+            configuracao['por_conta'][_chave_conta(conta)] = passagens
+    return configuracao
+
+def _evento_fim_passagem(eventos: Eventos, registro: dict) -> None:
+    """Evento de fim de passagem com as métricas da passagem."""
+    nivel = 'success' if registro['matches'] else 'info'
+    _emitir(eventos, 'passagem_fim', nivel,
+            f"{int(registro['matches'])} matches encontrados na {registro['passagem']}.", **registro)
+
+def _executar_pipeline(df_ofx_conc: pd.DataFrame, df_contabil_conc: pd.DataFrame, motor: str,
+                       passagens: list, eventos: Eventos = None) -> Tuple[pd.DataFrame, pd.DataFrame, list]:
+    """Executa as passagens em ordem sobre as linhas ainda não conciliadas, medindo cada uma."""
+    metricas = []
+    for pass_info in passagens:
+        tipo = pass_info.get('tipo', TIPO_PASSAGEM_PADRAO)
+        _emitir(eventos, 'passagem_inicio', 'write', f"--- Executando: {pass_info['name']} ---",
+                passagem=pass_info['name'])
+        inicio = time.perf_counter()
+        df_ofx_conc, df_contabil_conc, metricas_passagem = TIPOS_PASSAGEM[tipo](
+            df_ofx_conc, df_contabil_conc, pass_info, motor
+        )
+        registro = {'passagem': pass_info['name'], 'tipo': tipo, **metricas_passagem,
+                    'tempo_s': time.perf_counter() - inicio}
+        metricas.append(registro)
+        _evento_fim_passagem(eventos, registro)
+    return df_ofx_conc, df_contabil_conc, metricas
+
+def _executar_passagens(df_ofx_conc: pd.DataFrame, df_contabil_conc: pd.DataFrame, motor: str,
+                        workers: int = 1, configuracao: dict = None,
+                        eventos: Eventos = None) -> Tuple[pd.DataFrame, pd.DataFrame, list]:
+    """
+    Executa o pipeline de passagens e retorna (df_ofx, df_contabil, métricas por passagem).
+
+    Com um único pipeline e workers = 1 roda direto. Com passagens específicas por conta ou
+    workers > 1, particiona por conta contábil (o matching só casa linhas da mesma conta),
+    agrupa as contas de cada pipeline em lotes equilibrados, executa os lotes (em um
+    ProcessPoolExecutor quando workers > 1) e junta os resultados na ordem original das linhas.
+    """
+    if configuracao is None:
+        configuracao = {'padrao': PASSAGES_CONFIG, 'por_conta': {}}
+    padrao, por_conta = configuracao['padrao'], configuracao['por_conta']
+    if workers <= 1 and not por_conta:
+        return _executar_pipeline(df_ofx_conc, df_contabil_conc, motor, padrao, eventos)
+
+    indice_ofx, indice_cont = df_ofx_conc.index, df_contabil_conc.index
+    df_ofx_conc = df_ofx_conc.reset_index(drop=True)
+    df_contabil_conc = df_contabil_conc.reset_index(drop=True)
+
+    # Mesma codificação de contas do motor vetorizado (NaN = -1, nunca casa)
+    codigos, contas = pd.factorize(pd.concat([
+        df_ofx_conc['Conta_Contábil_Vinculada'], df_contabil_conc['Conta Contábil']
+    ], ignore_index=True))
+    conta_ofx = pd.Series(codigos[:len(df_ofx_conc)], index=df_ofx_conc.index)
+    conta_cont = pd.Series(codigos[len(df_ofx_conc):], index=df_contabil_conc.index)
+
+    pendentes = conta_ofx[(conta_ofx >= 0) & (df_ofx_conc['Conciliado_Contábil'] == 'Não')]
+    tamanhos = pendentes.value_counts()
+
+    # Cada conta segue o pipeline configurado para ela ou o padrão da empresa
+    pipelines = [padrao]
+    pipeline_da_conta = {}
+    for codigo in tamanhos.index:
+        passagens = por_conta.get(_chave_conta(contas[codigo]), padrao)
+        posicao = next((i for i, p in enumerate(pipelines) if p is passagens), None)
+        if posicao is None:
+            pipelines.append(passagens)
+            posicao = len(pipelines) - 1
+        pipeline_da_conta[codigo] = posicao
+    em_uso = sorted(set(pipeline_da_conta.values()))
+
+    if len(em_uso) <= 1 and (workers <= 1 or len(tamanhos) < 2):
+        passagens = pipelines[em_uso[0]] if em_uso else padrao
+        df_ofx_conc, df_contabil_conc, metricas = _executar_pipeline(df_ofx_conc, df_contabil_conc, motor, passagens, eventos)
+        return df_ofx_conc.set_axis(indice_ofx), df_contabil_conc.set_axis(indice_cont), metricas
+
+    lotes = []
+    for posicao in em_uso:
+        tamanhos_pipeline = tamanhos[[pipeline_da_conta[c] == posicao for c in tamanhos.index]]
+        qtd_lotes = 1 if workers <= 1 else min(len(tamanhos_pipeline), workers * LOTES_POR_WORKER)
+        lotes.extend((lote, pipelines[posicao]) for lote in _montar_lotes(tamanhos_pipeline, qtd_lotes))
+
+    if workers > 1:
+        _emitir(eventos, 'execucao_paralela', 'write',
+                f"--- Execução paralela: {len(tamanhos)} contas em {len(lotes)} lotes, {workers} processos ---",
+                contas=len(tamanhos), lotes=len(lotes), workers=workers)
+        # Os processos de trabalho não recebem o callback; as métricas somadas são emitidas ao final.
+        # spawn: um fork do servidor do Streamlit (multithread) herdaria o pool de conexões e locks ocupados
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futuros = [
+                executor.submit(
+                    _conciliar_lote,
+                    df_ofx_conc[conta_ofx.isin(lote)],
+                    df_contabil_conc[conta_cont.isin(lote)],
+                    motor,
+                    passagens
+                )
+                for lote, passagens in lotes
+            ]
+            resultados = [futuro.result() for futuro in futuros]
+    else:
+        resultados = [
+            _executar_pipeline(df_ofx_conc[conta_ofx.isin(lote)].copy(),
+                               df_contabil_conc[conta_cont.isin(lote)].copy(), motor, passagens, eventos)
+            for lote, passagens in lotes
+        ]
+
+    partes_ofx, partes_cont, metricas = [df_ofx_conc], [df_contabil_conc], []
+    for numero_lote, (parte_ofx, parte_cont, metricas_lote) in enumerate(resultados):
+        # Grupos agregados criados no lote são numerados por lote; prefixa para não colidirem na
+        # renumeração. Grupos que já vieram na entrada (estado reaplicado) mantêm o rótulo.
+        for parte, original in ((parte_ofx, df_ofx_conc), (parte_cont, df_contabil_conc)):
+            novo = parte['Grupo_Conciliacao'].notna() & original.loc[parte.index, 'Grupo_Conciliacao'].isna()
+            parte.loc[novo, 'Grupo_Conciliacao'] = f"{numero_lote}:" + parte.loc[novo, 'Grupo_Conciliacao']
+        partes_ofx.append(parte_ofx)
+        partes_cont.append(parte_cont)
+        metricas.extend(metricas_lote)
+
+    # As linhas processadas nos lotes substituem as originais (última ocorrência de cada índice)
+    df_ofx_conc = pd.concat(partes_ofx)
+    df_ofx_conc = df_ofx_conc[~df_ofx_conc.index.duplicated(keep='last')].sort_index()
+    df_contabil_conc = pd.concat(partes_cont)
+    df_contabil_conc = df_contabil_conc[~df_contabil_conc.index.duplicated(keep='last')].sort_index()
+
+    # Renumeração global dos grupos novos (ordem de aparição no extrato), após o maior rótulo existente
+    novos_grupos = df_ofx_conc['Grupo_Conciliacao'].dropna().astype(str)
+    novos_grupos = novos_grupos[novos_grupos.str.contains(':', regex=False)]
+    if not novos_grupos.empty:
+        inicio = _ultimo_numero_grupo(df_ofx_conc['Grupo_Conciliacao'], df_contabil_conc['Grupo_Conciliacao'])
+        mapa = {g: f"AGR-{inicio + i + 1:05d}" for i, g in enumerate(pd.unique(novos_grupos))}
+        df_ofx_conc['Grupo_Conciliacao'] = df_ofx_conc['Grupo_Conciliacao'].replace(mapa)
+        df_contabil_conc['Grupo_Conciliacao'] = df_contabil_conc['Grupo_Conciliacao'].replace(mapa)
+
+    # Métricas somadas por passagem (tempo = soma dos lotes)
+    if metricas:
+        metricas = pd.DataFrame(metricas).groupby(['passagem', 'tipo'], sort=False, as_index=False).sum()
+        metricas = metricas.to_dict('records')
+        if workers > 1:
+            for registro in metricas:
+                _evento_fim_passagem(eventos, registro)
+
+    return df_ofx_conc.set_axis(indice_ofx), df_contabil_conc.set_axis(indice_cont), metricas
+
+def _resolver_configuracao(configuracao: dict = None) -> dict:
+    """Configuração informada (validada) ou, se omitida, PASSAGES_CONFIG para todas as contas."""
+    if configuracao is None:
+        return {'padrao': list(PASSAGES_CONFIG), 'por_conta': {}}
+    configuracao = {'padrao': configuracao.get('padrao', PASSAGES_CONFIG),
+                    'por_conta': {_chave_conta(c): p for c, p in configuracao.get('por_conta', {}).items()}}
+    for passagens in [configuracao['padrao'], *configuracao['por_conta'].values()]:
+        for pass_info in passagens:
+            _validar_passagem(pass_info)
+    return configuracao
+
+def metricas_conciliacao(df_ofx_conc: pd.DataFrame) -> pd.DataFrame:
+    """
+    Métricas por passagem da conciliação que gerou df_ofx_conc: linhas consideradas, candidatos
+    avaliados, matches, tempo (s) e taxa de match (matches / linhas consideradas).
+    """
+    metricas = pd.DataFrame(
+        df_ofx_conc.attrs.get('metricas_passagens', []),
+        columns=['passagem', 'tipo', 'linhas_consideradas', 'candidatos_avaliados', 'matches', 'tempo_s']
+    )
+    metricas['taxa_match'] = (metricas['matches'] / metricas['linhas_consideradas'].where(metricas['linhas_consideradas'] > 0)).fillna(0.0)
+    return metricas
+
+def resolver_workers(workers=None) -> int:
+    """Número de processos: parâmetro explícito, senão CONCILIACAO_WORKERS, senão 1 (sequencial)."""
+    if workers is None:
+        workers = os.environ.get(CONCILIACAO_WORKERS_ENV, 1)
+    if str(workers).strip().lower() in ('0', 'auto'):
+        return os.cpu_count() or 1
+    try:
+        return max(int(workers), 1)
+    except (TypeError, ValueError):
+        raise ValueError(f"Número de workers inválido: {workers}")
+
+def _conciliar_lote(df_ofx_lote: pd.DataFrame, df_contabil_lote: pd.DataFrame, motor: str,
+                    passagens: list) -> Tuple[pd.DataFrame, pd.DataFrame, list]:
+    """Executado em um processo de trabalho: roda o pipeline sobre as contas de um lote."""
+    return _executar_pipeline(df_ofx_lote, df_contabil_lote, motor, passagens)
+
+def _montar_lotes(tamanhos: pd.Series, qtd_lotes: int) -> list:
+    """Distribui as contas em lotes equilibrados (maior conta primeiro, sempre no lote mais leve)."""
+    lotes = [[] for _ in range(qtd_lotes)]
+    carga = np.zeros(qtd_lotes, dtype=np.int64)
+    for conta, tamanho in tamanhos.sort_values(ascending=False, kind='stable').items():
+        destino = int(np.argmin(carga))
+        lotes[destino].append(conta)
+        carga[destino] += tamanho
+    return [lote for lote in lotes if lote]
+
+def _hash_linhas(df: pd.DataFrame, col_data: str, col_valor: str, col_conta: str) -> pd.Series:
+    """
+    Impressão digital das colunas usadas no matching (data, valor, conta).
+    Normaliza os tipos antes do hash para que o resultado seja estável entre execuções.
+    """
+    datas = pd.to_datetime(df[col_data], errors='coerce').dt.strftime('%Y-%m-%d').fillna('')
+    valores = pd.to_numeric(df[col_valor], errors='coerce').round(2).map('{:.2f}'.format).astype(str)
+    contas = df[col_conta].astype(str)
+    chave = datas + '|' + valores + '|' + contas
+    return pd.util.hash_pandas_object(chave, index=False).map('{:016x}'.format)
+
+# ==============================================================================
+# 3. API DO MOTOR
+# ==============================================================================
+
+def _chaves_conta(contas: pd.Series) -> pd.Series:
+    """Versão vetorizada de _chave_conta (vazio para contas nulas)."""
+    return contas.fillna('').astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+
+def vincular_contas(df_extrato: pd.DataFrame, df_contas: pd.DataFrame) -> pd.DataFrame:
+    """Adiciona ao extrato a Conta_Contábil_Vinculada do cadastro de contas ('N/A' se não houver)."""
+    if df_contas.empty or 'Conta_OFX_Normalizada' not in df_extrato.columns \
+            or 'Conta_OFX_Normalizada' not in df_contas.columns:
+        return df_extrato.assign(Conta_Contábil_Vinculada='N/A')
+
+    df_map = df_contas[['Conta_OFX_Normalizada', 'Conta Contábil']].drop_duplicates()
+    mapa_contas = df_map.set_index('Conta_OFX_Normalizada')['Conta Contábil'].to_dict()
+    return df_extrato.assign(
+        Conta_Contábil_Vinculada=df_extrato['Conta_OFX_Normalizada'].map(mapa_contas).fillna('N/A')
+    )
+
+def montar_extrato_conciliacao(df_historico: pd.DataFrame, df_contas: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte o extrato histórico (extrato_bancario_historico) no extrato esperado pelo motor:
+    nomes de colunas da importação e Conta_Contábil_Vinculada normalizada como no contábil.
+    """
+    df_extrato = df_historico.rename(columns={'Data Lancamento': 'Data Lançamento', 'Descricao': 'Descrição'})
+    df_extrato = vincular_contas(df_extrato, df_contas)
+    vinculada = df_extrato['Conta_Contábil_Vinculada']
+    df_extrato['Conta_Contábil_Vinculada'] = _chaves_conta(vinculada).where(vinculada != 'N/A', 'N/A')
+    return df_extrato
+
+def montar_contabil_conciliacao(df_lancamentos: pd.DataFrame, contas_contabeis) -> pd.DataFrame:
+    """
+    Converte lancamentos_contabeis (colunas do banco) no contábil esperado pelo motor: uma linha
+    por perna (débito/crédito) lançada em uma das contas contábeis informadas (as dos bancos).
+    'ID Contabil' é o id na perna de débito e -id na de crédito, para que uma transferência
+    entre duas contas bancárias gere duas linhas distintas.
+    """
+    colunas = ['ID Contabil', 'Data', 'Valor', 'Conta Contábil', 'Historico']
+    if df_lancamentos.empty:
+        return pd.DataFrame(columns=colunas)
+
+    contas = set(_chaves_conta(pd.Series(list(contas_contabeis), dtype=object))) - {'', 'N/A'}
+    base = pd.DataFrame({
+        'id': pd.to_numeric(df_lancamentos['id'], errors='coerce'),
+        'Data': pd.to_datetime(df_lancamentos['data_lancamento'], errors='coerce'),
+        'Valor': pd.to_numeric(df_lancamentos['valor'], errors='coerce').abs(),
+        'Historico': df_lancamentos['historico'] if 'historico' in df_lancamentos.columns else '',
+    })
+
+    pernas = []
+    for coluna, sinal in (('reduz_deb', 1), ('reduz_cred', -1)):
+        conta = _chaves_conta(df_lancamentos[coluna])
+        na_conta = conta.isin(contas) & base['id'].notna()
+        perna = base[na_conta].assign(**{'Conta Contábil': conta[na_conta]})
+        perna['ID Contabil'] = perna['id'].astype(np.int64) * sinal
+        pernas.append(perna)
+
+    df_contabil = pd.concat(pernas, ignore_index=True)
+    return df_contabil.sort_values(['Data', 'ID Contabil'], kind='stable', ignore_index=True)[colunas]
+
+def conciliar(df_extrato_vinculado: pd.DataFrame, df_contabil: pd.DataFrame,
+              motor: str = MOTOR_CONCILIACAO_PADRAO, workers=None, configuracao: dict = None,
+              eventos: Eventos = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Executa o pipeline de passagens e retorna (extrato, contábil) com as colunas de controle.
+    As métricas por passagem ficam em metricas_conciliacao(extrato).
+    """
+    if motor not in MOTORES_CONCILIACAO:
+        raise ValueError(f"Motor de conciliação inválido: {motor}. Opções: {MOTORES_CONCILIACAO}")
+    workers = resolver_workers(workers)
+    configuracao = _resolver_configuracao(configuracao)
+
+    df_ofx_conc, df_contabil_conc = _preparar_controle(df_extrato_vinculado, df_contabil)
+    df_ofx_conc, df_contabil_conc, metricas = _executar_passagens(
+        df_ofx_conc, df_contabil_conc, motor, workers, configuracao, eventos
+    )
+    df_ofx_conc.attrs['metricas_passagens'] = metricas
+
+    _emitir(eventos, 'concluido', 'success', "Conciliação Multi-Pass concluída!",
+            conciliados=int((df_ofx_conc['Conciliado_Contábil'] == 'Sim').sum()), total=len(df_ofx_conc))
+    return df_ofx_conc, df_contabil_conc
+
+def conciliar_incremental(df_extrato_vinculado: pd.DataFrame, df_contabil: pd.DataFrame, estado: pd.DataFrame,
+                          motor: str = MOTOR_CONCILIACAO_PADRAO, workers=None, configuracao: dict = None,
+                          eventos: Eventos = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, list]:
+    """
+    Conciliação incremental: reaplica os pares do estado salvo (conciliacoes_extrato_contabil)
+    cujas linhas (extrato e contábil) não mudaram e executa as passagens apenas sobre o restante
+    (linhas novas, editadas ou ainda não conciliadas).
+
+    O extrato precisa da coluna 'ID_Unico' (chave do extrato histórico) e o contábil do
+    'ID Contabil' estável. Um par é invalidado quando uma linha carregada mudou ou quando o
+    lançamento contábil sumiu dentro do período carregado (excluído ou reimportado); pares cuja
+    data contábil está fora desse período são mantidos e reaplicados.
+
+    Retorna (extrato, contábil, novos pares a gravar, ID_Unico dos pares obsoletos a excluir).
+    """
+    if motor not in MOTORES_CONCILIACAO:
+        raise ValueError(f"Motor de conciliação inválido: {motor}. Opções: {MOTORES_CONCILIACAO}")
+    if 'ID_Unico' not in df_extrato_vinculado.columns:
+        raise ValueError("A conciliação incremental exige a coluna 'ID_Unico' no extrato.")
+    workers = resolver_workers(workers)
+    configuracao = _resolver_configuracao(configuracao)
+
+    # 1. Inicialização (o estado vem do banco, não de colunas de execuções anteriores)
+    df_ofx_conc, df_contabil_conc = _preparar_controle(df_extrato_vinculado, df_contabil, resetar=True)
+
+    id_unico = df_ofx_conc['ID_Unico'].astype(str)
+    hash_ofx = pd.Series(
+        _hash_linhas(df_ofx_conc, 'Data Lançamento', 'Valor', 'Conta_Contábil_Vinculada').values,
+        index=id_unico.values
+    )
+    hash_ofx = hash_ofx[~hash_ofx.index.duplicated()]
+    hash_cont = pd.Series(
+        _hash_linhas(df_contabil_conc, 'Data', 'Valor', 'Conta Contábil').values,
+        index=df_contabil_conc['ID Contabil'].values
+    )
+    hash_cont = hash_cont[~hash_cont.index.duplicated()]
+    datas_cont = pd.to_datetime(df_contabil_conc['Data'], errors='coerce')
+    data_cont = pd.Series(datas_cont.dt.strftime('%Y-%m-%d').values, index=df_contabil_conc['ID Contabil'].values)
+    data_cont = data_cont[~data_cont.index.duplicated()]
+
+    # 2. Validação do estado salvo: o par cai se alguma de suas linhas mudou ou se o contábil
+    # não foi carregado embora sua data esteja no período carregado
+    obsoletos = []
+    estado = estado[estado['id_unico'].astype(str).isin(hash_ofx.index)]
+    if not estado.empty:
+        estado = estado.assign(id_unico=estado['id_unico'].astype(str), id_contabil=estado['id_contabil'].astype(int))
+        hash_atual_cont = estado['id_contabil'].map(hash_cont)
+        data_par = pd.to_datetime(estado['data_contabil'], errors='coerce')
+        fora_da_janela = data_par.notna() & ~data_par.between(datas_cont.min(), datas_cont.max())
+        valido = (
+            (estado['id_unico'].map(hash_ofx) == estado['hash_extrato']) &
+            ((hash_atual_cont == estado['hash_contabil']) | (hash_atual_cont.isna() & fora_da_janela))
+        )
+        # Um par inválido derruba o grupo inteiro (todas as linhas ligadas ao mesmo lançamento contábil)
+        contabil_obsoletos = estado.loc[~valido, 'id_contabil']
+        invalido = ~valido | estado['id_contabil'].isin(contabil_obsoletos)
+        obsoletos = estado.loc[invalido, 'id_unico'].unique().tolist()
+        estado = estado[~estado['id_unico'].isin(obsoletos)]
+        if obsoletos:
+            _emitir(eventos, 'estado_invalidado', 'info',
+                    f"{len(obsoletos)} conciliações invalidadas por alteração nas linhas (serão refeitas).",
+                    quantidade=len(obsoletos))
+
+    # 3. Reaplica os pares válidos
+    if not estado.empty:
+        estado = estado.sort_values(['id_unico', 'id_contabil'])
+        estado_por_id = estado.drop_duplicates('id_unico').set_index('id_unico')
+        mask_ofx = id_unico.isin(estado_por_id.index)
+        df_ofx_conc.loc[mask_ofx, 'Conciliado_Contábil'] = 'Sim'
+        df_ofx_conc.loc[mask_ofx, 'ID_Contabil_Conciliado'] = id_unico[mask_ofx].map(estado_por_id['id_contabil']).astype(float)
+        df_ofx_conc.loc[mask_ofx, 'Passagem_Conciliacao'] = id_unico[mask_ofx].map(estado_por_id['passagem'])
+        df_contabil_conc.loc[df_contabil_conc['ID Contabil'].isin(estado['id_contabil']), 'Conciliado_OFX'] = 'Sim'
+
+        # Grupos agregados: extrato com vários contábeis (1:N) ou contábil com vários extratos (N:1)
+        multi_ofx = estado['id_unico'].duplicated(keep=False)
+        multi_cont = estado['id_contabil'].duplicated(keep=False)
+        chave_grupo = pd.Series(None, index=estado.index, dtype=object)
+        chave_grupo[multi_cont] = 'C' + estado.loc[multi_cont, 'id_contabil'].astype(str)
+        chave_grupo[multi_ofx] = 'E' + estado.loc[multi_ofx, 'id_unico']
+        if chave_grupo.notna().any():
+            numeros = pd.factorize(chave_grupo.dropna())[0] + 1
+            grupos = pd.Series([f"AGR-{n:05d}" for n in numeros], index=chave_grupo.dropna().index)
+            grupo_por_id = grupos.groupby(estado.loc[grupos.index, 'id_unico']).first()
+            grupo_por_cont = grupos.groupby(estado.loc[grupos.index, 'id_contabil']).first()
+            df_ofx_conc.loc[mask_ofx, 'Grupo_Conciliacao'] = id_unico[mask_ofx].map(grupo_por_id)
+            df_contabil_conc['Grupo_Conciliacao'] = df_contabil_conc['ID Contabil'].map(grupo_por_cont)
+        _emitir(eventos, 'estado_reaproveitado', 'info',
+                f"{int(mask_ofx.sum())} conciliações reaproveitadas da execução anterior.",
+                quantidade=int(mask_ofx.sum()))
+    else:
+        mask_ofx = pd.Series(False, index=df_ofx_conc.index)
+
+    # 4. Passagens apenas sobre o que sobrou
+    df_ofx_conc, df_contabil_conc, metricas = _executar_passagens(
+        df_ofx_conc, df_contabil_conc, motor, workers, configuracao, eventos
+    )
+    df_ofx_conc.attrs['metricas_passagens'] = metricas
+
+    # 5. Novos pares a persistir
+    colunas_pares = ['id_unico', 'id_contabil', 'passagem', 'hash_extrato', 'hash_contabil', 'data_contabil']
+    pares = pd.DataFrame(columns=colunas_pares)
+    novos = df_ofx_conc[(df_ofx_conc['Conciliado_Contábil'] == 'Sim') & ~mask_ofx]
+    if not novos.empty:
+        pares = pd.DataFrame({
+            'id_unico': id_unico[novos.index].values,
+            'id_contabil': novos['ID_Contabil_Conciliado'].astype(int).values,
+            'passagem': novos['Passagem_Conciliacao'].values,
+            'grupo': novos['Grupo_Conciliacao'].values,
+        })
+        # Nos grupos 1:N a linha do extrato gera um par para cada lançamento contábil do grupo
+        membros = df_contabil_conc.loc[df_contabil_conc['Grupo_Conciliacao'].notna(), ['Grupo_Conciliacao', 'ID Contabil']]
+        em_grupo = pares['grupo'].notna()
+        pares_grupo = pares[em_grupo].drop(columns='id_contabil').merge(
+            membros.rename(columns={'Grupo_Conciliacao': 'grupo', 'ID Contabil': 'id_contabil'}), on='grupo'
+        )
+        pares = pd.concat([pares[~em_grupo], pares_grupo], ignore_index=True)
+        pares['hash_extrato'] = pares['id_unico'].map(hash_ofx)
+        pares['hash_contabil'] = pares['id_contabil'].map(hash_cont)
+        pares['data_contabil'] = pares['id_contabil'].map(data_cont)
+        pares = pares[colunas_pares]
+
+    _emitir(eventos, 'concluido', 'success',
+            f"Conciliação incremental concluída! {len(novos)} novas conciliações.",
+            conciliados=int((df_ofx_conc['Conciliado_Contábil'] == 'Sim').sum()), total=len(df_ofx_conc),
+            novos=len(novos))
+    return df_ofx_conc, df_contabil_conc, pares, obsoletos
+
+
+# ==============================================================================
+# 4. SALDOS DIÁRIOS E PROVISÃO DE SALDO NEGATIVO
+# ==============================================================================
+
+COLUNAS_LANCAMENTO_PROVISAO = [
+    'idlancamento', 'data_lancamento', 'historico', 'valor', 'tipo_lancamento',
+    'reduz_deb', 'nome_conta_d', 'reduz_cred', 'nome_conta_c', 'origem'
+]
+
+
+def movimentos_lancamentos_contabeis(df_lancamentos: pd.DataFrame, contas) -> pd.DataFrame:
+    """
+    Movimento com sinal dos lançamentos contábeis nas contas informadas (contas de ativo:
+    débito soma, crédito subtrai). Retorna conta, data e valor, na ordem dos lançamentos.
+    """
+    lanc = df_lancamentos.assign(data=pd.to_datetime(df_lancamentos['data_lancamento'], errors='coerce'))
+    debitos = lanc.loc[lanc['reduz_deb'].isin(contas), ['reduz_deb', 'data', 'valor']]
+    # Lançamento com débito e crédito na mesma conta conta uma vez, como débito
+    creditos = lanc.loc[lanc['reduz_cred'].isin(contas) & (lanc['reduz_cred'] != lanc['reduz_deb']),
+                        ['reduz_cred', 'data', 'valor']]
+    movimentos = pd.concat([
+        debitos.set_axis(['conta', 'data', 'valor'], axis=1),
+        creditos.set_axis(['conta', 'data', 'valor'], axis=1).assign(valor=-creditos['valor']),
+    ])
+    return movimentos.sort_index(kind='stable').reset_index(drop=True)
+
+
+def calcular_saldos_diarios(df_movimentos: pd.DataFrame, df_contas: pd.DataFrame,
+                            data_inicio, data_fim) -> pd.DataFrame:
+    """
+    Saldo diário de várias contas de uma vez, sem laço por conta ou por dia.
+
+    df_movimentos: conta, data e valor (com sinal). df_contas: conta, saldo_inicial e
+    data_saldo_inicial; sem data, a conta começa no primeiro movimento (ou em data_inicio).
+    Retorna uma linha por conta e dia até data_fim: movimento, saldo_final, provisao
+    (valor negativo a cobrir no dia) e ajuste (variação da provisão em relação ao dia anterior).
+    """
+    colunas = ['conta', 'data', 'movimento', 'saldo_final', 'provisao', 'ajuste']
+    contas = df_contas.drop_duplicates('conta').reset_index(drop=True)
+    if contas.empty:
+        return pd.DataFrame(columns=colunas)
+
+    fim = np.datetime64(pd.Timestamp(data_fim).date(), 'D')
+    mov = pd.DataFrame({
+        'pos': pd.Index(contas['conta']).get_indexer(df_movimentos['conta']),
+        'dia': pd.to_datetime(df_movimentos['data'], errors='coerce').to_numpy().astype('datetime64[D]'),
+        'valor': df_movimentos['valor'].astype(float).to_numpy(),
+    })
+    mov = mov[(mov['pos'] >= 0) & (mov['dia'] <= fim)]
+
+    # Início de cada conta: data do saldo inicial, senão primeiro movimento, senão data_inicio
+    inicio = (
+        pd.to_datetime(contas['data_saldo_inicial'], errors='coerce')
+        .fillna(pd.to_datetime(mov.groupby('pos')['dia'].min()))
+        .fillna(pd.Timestamp(data_inicio))
+        .to_numpy().astype('datetime64[D]')
+    )
+    mov = mov[mov['dia'].to_numpy() >= inicio[mov['pos'].to_numpy()]]
+
+    # Grade conta x dia: as contas ficam em blocos contíguos de dias consecutivos
+    dias = np.maximum((fim - inicio).astype(np.int64) + 1, 0)
+    pos = np.repeat(np.arange(len(contas)), dias)
+    primeira_linha = np.cumsum(dias) - dias
+    deslocamento = np.arange(len(pos)) - primeira_linha[pos]
+    datas = inicio[pos] + deslocamento.astype('timedelta64[D]')
+
+    movimento = np.zeros(len(pos))
+    diario = mov.groupby(['pos', 'dia'], sort=False)['valor'].sum()
+    pos_mov = diario.index.get_level_values('pos').to_numpy()
+    dia_mov = diario.index.get_level_values('dia').to_numpy().astype('datetime64[D]')
+    movimento[primeira_linha[pos_mov] + (dia_mov - inicio[pos_mov]).astype(np.int64)] = diario.to_numpy()
+
+    saldo_inicial = pd.to_numeric(contas['saldo_inicial'], errors='coerce').fillna(0.0).to_numpy()
+    saldo_final = saldo_inicial[pos] + pd.Series(movimento).groupby(pos).cumsum().to_numpy()
+    provisao = np.clip(-saldo_final, 0.0, None)
+    anterior = pd.Series(provisao).groupby(pos).shift(1, fill_value=0.0).to_numpy()
+
+    return pd.DataFrame({
+        'conta': contas['conta'].to_numpy()[pos],
+        'data': datas.astype('datetime64[ns]'),
+        'movimento': movimento,
+        'saldo_final': saldo_final,
+        'provisao': provisao,
+        'ajuste': provisao - anterior,
+    }, columns=colunas)
+
+
+def gerar_lancamentos_provisao(df_saldos: pd.DataFrame, df_contas: pd.DataFrame, data_inicio,
+                               historico_provisao: str, historico_reversao: str, origem: str,
+                               incluir_conta: bool = False) -> pd.DataFrame:
+    """
+    Lançamentos de provisão (saldo mais negativo) e reversão (saldo menos negativo) a partir de
+    data_inicio, para os dias com ajuste diferente de zero. df_contas traz, por conta, conta_principal,
+    nome_principal, conta_negativo e nome_negativo; os históricos recebem a data (DD/MM/AAAA) ao final.
+    Com incluir_conta, a coluna 'conta' (chave de df_contas) é acrescentada ao resultado.
+    """
+    colunas = COLUNAS_LANCAMENTO_PROVISAO + (['conta'] if incluir_conta else [])
+    periodo = df_saldos[
+        (df_saldos['data'] >= pd.Timestamp(data_inicio)) & (np.round(df_saldos['ajuste'].astype(float), 2) != 0)
+    ]
+    if periodo.empty:
+        return pd.DataFrame(columns=colunas)
+
+    contas = df_contas.drop_duplicates('conta').set_index('conta').loc[periodo['conta']]
+    ajuste = periodo['ajuste'].to_numpy()
+    eh_provisao = ajuste > 0
+    datas = pd.DatetimeIndex(periodo['data'])
+    principal = contas['conta_principal'].to_numpy()
+    negativo = contas['conta_negativo'].to_numpy()
+    nome_principal = contas['nome_principal'].to_numpy()
+    nome_negativo = contas['nome_negativo'].to_numpy()
+
+    return pd.DataFrame({
+        'idlancamento': [str(uuid.uuid4()) for _ in range(len(periodo))],
+        'data_lancamento': datas.strftime('%Y-%m-%d'),
+        'historico': np.where(eh_provisao, historico_provisao, historico_reversao).astype(object)
+                     + ' ' + datas.strftime('%d/%m/%Y').to_numpy(dtype=object),
+        'valor': np.abs(ajuste),
+        'tipo_lancamento': 'Ajuste',
+        'reduz_deb': np.where(eh_provisao, principal, negativo),
+        'nome_conta_d': np.where(eh_provisao, nome_principal, nome_negativo),
+        'reduz_cred': np.where(eh_provisao, negativo, principal),
+        'nome_conta_c': np.where(eh_provisao, nome_negativo, nome_principal),
+        'origem': origem,
+        'conta': periodo['conta'].to_numpy(),
+    }, columns=colunas)
@@ -170,10 +170,11 @@ def criar_cabecalho_relatorio(elements, empresa_info, logo_path, titulo_relatori
     return elements
 
 
-def gerar_balancete_pdf(df_lancamentos: pd.DataFrame, df_plano_contas: pd.DataFrame,
+def gerar_balancete_pdf(df_saldos: pd.DataFrame, df_plano_contas: pd.DataFrame,
                         empresa_info: dict, logo_path: str, data_inicio: date, data_fim: date) -> BytesIO:
     """
     Gera PDF do Balancete de Verificação com design moderno.
+    df_saldos: saldos por conta do período (db_manager.carregar_saldos_contas).
     """
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4,
@@ -186,83 +187,23 @@ def gerar_balancete_pdf(df_lancamentos: pd.DataFrame, df_plano_contas: pd.DataFr
     criar_cabecalho_relatorio(elements, empresa_info, logo_path,
                               "BALANCETE DE VERIFICAÇÃO", periodo_str)
 
-    # Converter data_lancamento para datetime se necessário
-    if not pd.api.types.is_datetime64_any_dtype(df_lancamentos['data_lancamento']):
-        df_lancamentos['data_lancamento'] = pd.to_datetime(df_lancamentos['data_lancamento'])
-
-    # Filtrar lançamentos do período
-    df_periodo = df_lancamentos[
-        (df_lancamentos['data_lancamento'].dt.date >= data_inicio) &
-        (df_lancamentos['data_lancamento'].dt.date <= data_fim)
-    ].copy()
-
-    # Calcular saldo anterior (antes do período)
-    df_anterior = df_lancamentos[
-        df_lancamentos['data_lancamento'].dt.date < data_inicio
-    ].copy()
-
-    # Normalizar códigos de conta (remover .0 se for float)
-    if 'reduz_deb' in df_periodo.columns:
-        df_periodo['reduz_deb'] = df_periodo['reduz_deb'].apply(
-            lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-        )
-    if 'reduz_cred' in df_periodo.columns:
-        df_periodo['reduz_cred'] = df_periodo['reduz_cred'].apply(
-            lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-        )
-
-    if not df_anterior.empty:
-        if 'reduz_deb' in df_anterior.columns:
-            df_anterior['reduz_deb'] = df_anterior['reduz_deb'].apply(
-                lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-            )
-        if 'reduz_cred' in df_anterior.columns:
-            df_anterior['reduz_cred'] = df_anterior['reduz_cred'].apply(
-                lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-            )
-
-    # Calcular totais por conta
+    # Uma linha por conta com movimento no período ou saldo anterior
     balancete = []
-
-    # Obter todas as contas usadas no período e anteriormente
-    contas_periodo_deb = df_periodo['reduz_deb'].dropna().unique() if 'reduz_deb' in df_periodo.columns else []
-    contas_periodo_cred = df_periodo['reduz_cred'].dropna().unique() if 'reduz_cred' in df_periodo.columns else []
-    contas_anterior_deb = df_anterior['reduz_deb'].dropna().unique() if not df_anterior.empty and 'reduz_deb' in df_anterior.columns else []
-    contas_anterior_cred = df_anterior['reduz_cred'].dropna().unique() if not df_anterior.empty and 'reduz_cred' in df_anterior.columns else []
-
-    todas_contas = set(list(contas_periodo_deb) + list(contas_periodo_cred) +
-                      list(contas_anterior_deb) + list(contas_anterior_cred))
-
-    for conta in sorted(todas_contas, key=lambda x: str(x)):
-        # Converter conta para string (sem decimais se for número)
-        conta_str = str(conta)
+    for _, saldo in df_saldos.iterrows():
+        conta_str = str(saldo['conta'])
 
         # Buscar nome e tipo da conta no plano de contas
         conta_info = df_plano_contas[df_plano_contas['codigo'] == conta_str]
         nome_conta = conta_info.iloc[0]['descricao'] if not conta_info.empty else 'N/A'
         tipo_conta = conta_info.iloc[0]['tipo'] if not conta_info.empty and 'tipo' in conta_info.columns else 'Analitico'
 
-        # Calcular saldo anterior
-        if not df_anterior.empty:
-            saldo_ant_deb = df_anterior[df_anterior['reduz_deb'] == conta_str]['valor'].sum()
-            saldo_ant_cred = df_anterior[df_anterior['reduz_cred'] == conta_str]['valor'].sum()
-            saldo_anterior = saldo_ant_deb - saldo_ant_cred
-        else:
-            saldo_anterior = 0.0
-
-        # Calcular débitos e créditos do período
-        debitos = df_periodo[df_periodo['reduz_deb'] == conta_str]['valor'].sum()
-        creditos = df_periodo[df_periodo['reduz_cred'] == conta_str]['valor'].sum()
-        saldo_periodo = debitos - creditos
-        saldo_final = saldo_anterior + saldo_periodo
-
         balancete.append({
             'Conta': conta_str,
             'Descrição': nome_conta[:40],  # Limitar tamanho
-            'Saldo Anterior': saldo_anterior,
-            'Débitos': debitos,
-            'Créditos': creditos,
-            'Saldo Final': saldo_final,
+            'Saldo Anterior': saldo['saldo_anterior'],
+            'Débitos': saldo['debitos'],
+            'Créditos': saldo['creditos'],
+            'Saldo Final': saldo['saldo_final'],
             'Tipo': tipo_conta
         })
 
@@ -615,10 +556,11 @@ def gerar_livro_razao_pdf(df_lancamentos: pd.DataFrame, df_plano_contas: pd.Data
     return buffer
 
 
-def gerar_balanco_patrimonial_pdf(df_lancamentos: pd.DataFrame, df_plano_contas: pd.DataFrame,
+def gerar_balanco_patrimonial_pdf(df_saldos: pd.DataFrame, df_plano_contas: pd.DataFrame,
                                    empresa_info: dict, logo_path: str, data_referencia: date) -> BytesIO:
     """
     Gera PDF do Balanço Patrimonial com design moderno.
+    df_saldos: saldos por conta até a data de referência (db_manager.carregar_saldos_contas).
     """
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4,
@@ -631,32 +573,11 @@ def gerar_balanco_patrimonial_pdf(df_lancamentos: pd.DataFrame, df_plano_contas:
     criar_cabecalho_relatorio(elements, empresa_info, logo_path,
                               "BALANÇO PATRIMONIAL", periodo_str)
 
-    # Converter data_lancamento para datetime se necessário
-    if not pd.api.types.is_datetime64_any_dtype(df_lancamentos['data_lancamento']):
-        df_lancamentos['data_lancamento'] = pd.to_datetime(df_lancamentos['data_lancamento'])
-
-    # Filtrar lançamentos até a data de referência
-    df_periodo = df_lancamentos[
-        df_lancamentos['data_lancamento'].dt.date <= data_referencia
-    ].copy()
-
-    # Normalizar códigos de conta
-    if 'reduz_deb' in df_periodo.columns:
-        df_periodo['reduz_deb'] = df_periodo['reduz_deb'].apply(
-            lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-        )
-    if 'reduz_cred' in df_periodo.columns:
-        df_periodo['reduz_cred'] = df_periodo['reduz_cred'].apply(
-            lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x) if pd.notna(x) else None
-        )
-
-    # Calcular saldos por conta
+    # Saldo final (débitos - créditos) de cada conta do plano
+    saldo_por_conta = df_saldos.set_index('conta')['saldo_final']
     saldos = {}
     for conta in df_plano_contas['codigo'].unique():
-        # Usar reduz_deb e reduz_cred
-        debitos = df_periodo[df_periodo['reduz_deb'] == conta]['valor'].sum()
-        creditos = df_periodo[df_periodo['reduz_cred'] == conta]['valor'].sum()
-        saldo = debitos - creditos
+        saldo = saldo_por_conta.get(conta, 0.0)
 
         if abs(saldo) > 0.01:  # Apenas contas com saldo
             conta_info = df_plano_contas[df_plano_contas['codigo'] == conta].iloc[0]
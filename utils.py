@@ -3,6 +3,9 @@ import pandas as pd
 from datetime import datetime
 from io import BytesIO
 import re
+import sys
+import unicodedata
+from functools import lru_cache
 
 def safe_parse_date(date_str, default_date):
     """Tenta converter uma string para data, retornando uma data padrão em caso de falha."""
@@ -123,3 +126,64 @@ def normalizar_chave_ofx(chave: str) -> str:
     conta = chave_limpa[4:].lstrip('0')
     
     return agencia + conta
+
+_TRECHO_NAO_ASCII = re.compile(r'[^\x00-\x7f]+')
+
+
+def _remover_acentos_trecho(match) -> str:
+    nfd = unicodedata.normalize('NFD', match.group())
+    return ''.join(char for char in nfd if unicodedata.category(char) != 'Mn')
+
+
+def remover_acentos(texto: str) -> str:
+    """Remove acentos e demais marcas diacríticas (decomposição NFD), preservando o restante do texto."""
+    # Só os trechos não ASCII passam pela decomposição (arquivos inteiros, como o OFX, são quase todo ASCII)
+    return _TRECHO_NAO_ASCII.sub(_remover_acentos_trecho, texto)
+
+
+# ==============================================================================
+# VERSÕES VETORIZADAS (colunas inteiras, com as mesmas regras das funções acima)
+# ==============================================================================
+
+def somente_digitos_serie(serie: pd.Series) -> pd.Series:
+    """Apenas os dígitos de cada valor (como re.sub(r'\D', '', str(x))); vazios viram ''."""
+    return serie.astype(str).str.replace(r'\D', '', regex=True).fillna('')
+
+
+def normalizar_numero_serie(serie: pd.Series, is_conta_cadastro=False) -> pd.Series:
+    """normalizar_numero aplicado a uma coluna inteira."""
+    texto = serie.astype(str)
+    if is_conta_cadastro:
+        # Remove o dígito verificador (tudo a partir do primeiro '-' ou 'X')
+        texto = texto.str.replace(r'(?s)[-X].*', '', regex=True)
+    numeros = texto.str.replace(r'\D', '', regex=True).fillna('')
+    return numeros.str.lstrip('0').where(numeros != '', '0')
+
+
+def normalizar_chave_ofx_serie(serie: pd.Series) -> pd.Series:
+    """normalizar_chave_ofx aplicado a uma coluna inteira (valores não texto ou curtos ficam como estão)."""
+    if not (pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie)):
+        return serie
+    validas = serie.str.len() >= 5
+    chave_limpa = serie.str.replace(r'\D', '', regex=True)
+    normalizada = chave_limpa.str[:4] + chave_limpa.str[4:].str.lstrip('0')
+    return serie.where(~validas, normalizada)
+
+
+@lru_cache(maxsize=1)
+def _regex_marcas_diacriticas() -> re.Pattern:
+    """Classe com todos os caracteres da categoria Mn (montada uma vez por processo)."""
+    intervalos = []
+    for codigo in range(sys.maxunicode + 1):
+        if unicodedata.category(chr(codigo)) == 'Mn':
+            if intervalos and intervalos[-1][1] == codigo - 1:
+                intervalos[-1][1] = codigo
+            else:
+                intervalos.append([codigo, codigo])
+    classe = ''.join(f"{re.escape(chr(inicio))}-{re.escape(chr(fim))}" for inicio, fim in intervalos)
+    return re.compile(f"[{classe}]")
+
+
+def remover_acentos_serie(serie: pd.Series) -> pd.Series:
+    """remover_acentos aplicado a uma coluna de texto inteira."""
+    return serie.str.normalize('NFD').str.replace(_regex_marcas_diacriticas(), '', regex=True)